@@ -9,59 +9,117 @@ from sklearn.decomposition import PCA
 import pickle
 import json
 import os
+import sys
 import logging
 
+# dataset_io está en la raíz del proyecto
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dataset_io
+
 # Configuración de Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Ruta relativa al archivo actual
 ruta_dataset = os.path.join(os.path.dirname(__file__), "dataset_empleados_kmeans.xlsx")
-logging.info(f"Intentando cargar dataset desde: {ruta_dataset}")  # Log
-
-try:
-    dataset = pd.read_excel(ruta_dataset)
-except FileNotFoundError:
-    logging.error(f"No se encontró el archivo: {ruta_dataset}")
-    print(json.dumps({"error": f"No se encontró el archivo: {ruta_dataset}"}))
-    exit()  # Importante: Salir del script si el archivo no existe
-
-# --- Código original de Ceci (sin caracteres especiales) ---
-codificador = OneHotEncoder()
-codificacion = codificador.fit_transform(dataset[["Rendimiento ACTUAL"]])
-nuevas_cols = pd.DataFrame(codificacion.toarray(), columns=codificador.get_feature_names_out(["Rendimiento ACTUAL"]))
-dataset = pd.concat([dataset, nuevas_cols], axis="columns")
-dataset = dataset.drop("Rendimiento ACTUAL", axis=1)
-
-columnas_numericas = dataset.columns.difference(["Nombre", "Ciclo"]).tolist()
-dataset_agrupado_por_Nombre = dataset.groupby("Nombre")[columnas_numericas].sum().reset_index()
-
-escalador = MinMaxScaler()
+
 columnas_a_escalar = [
     "Ausencias Injustificadas", "Llegadas tarde",
     "Rendimiento ACTUAL_Alto", "Rendimiento ACTUAL_Bajo",
     "Rendimiento ACTUAL_Medio", "Salidas tempranas"
 ]
-dataset_agrupado_por_Nombre_escalado = dataset_agrupado_por_Nombre.copy()
-dataset_agrupado_por_Nombre_escalado[columnas_a_escalar] = escalador.fit_transform(
-    dataset_agrupado_por_Nombre_escalado[columnas_a_escalar]
-)
-
-n_clusters = 3
-X = dataset_agrupado_por_Nombre_escalado.drop(['Nombre'], axis=1)
-kmeans = KMeans(n_clusters=n_clusters, random_state=12)
-dataset_agrupado_por_Nombre_escalado['Cluster'] = kmeans.fit_predict(X)
-
-dataset_agrupado_por_Nombre["Cluster"] = dataset_agrupado_por_Nombre_escalado["Cluster"]
-dataset_agrupado_por_Nombre["Probabilidad de Rotacion"] = dataset_agrupado_por_Nombre["Cluster"].map({
-    2: "ALTA",
-    0: "BAJA",
-    1: "MEDIA"
-})
 
-# Salida JSON
-if __name__ == "__main__":
+
+columnas_incidencias = ["Ausencias Injustificadas", "Llegadas tarde", "Salidas tempranas"]
+
+
+def rango_por_riesgo(centroides, columnas=columnas_a_escalar):
+    """
+    Rango de cada cluster según el riesgo de su centroide (0 = menor riesgo): más incidencias y
+    más ciclos con rendimiento bajo suben el riesgo, más ciclos con rendimiento alto lo bajan.
+    No depende del número que KMeans le haya dado a cada cluster, que cambia entre ajustes.
+    """
+    indice = {columna: i for i, columna in enumerate(columnas)}
+    riesgo = (
+        centroides[:, [indice[c] for c in columnas_incidencias]].sum(axis=1)
+        + centroides[:, indice["Rendimiento ACTUAL_Bajo"]]
+        - centroides[:, indice["Rendimiento ACTUAL_Alto"]]
+    )
+    rango = np.empty(len(centroides), dtype=np.int64)
+    rango[np.argsort(riesgo, kind="stable")] = np.arange(len(centroides))
+    return rango
+
+
+def etiqueta_rotacion(rango, n_clusters):
+    """
+    BAJA para el cluster de menor riesgo, ALTA para el de mayor y MEDIA para el resto.
+    """
+    if rango == 0:
+        return "BAJA"
+    if rango == n_clusters - 1:
+        return "ALTA"
+    return "MEDIA"
+
+
+def cargar_dataset(ruta=ruta_dataset):
+    logging.info(f"Intentando cargar dataset desde: {ruta}")  # Log
+    # El Excel se parsea una sola vez; después se lee su copia Parquet mientras no cambie
+    return dataset_io.leer_con_copia_columnar(ruta)
+
+
+def calcular_rotacion(dataset, n_clusters=3, random_state=12):
+    """
+    Agrupa el dataset por empleado, lo escala y le asigna un cluster de K-Means.
+    Devuelve (resultados, pipeline) donde 'resultados' es el JSON de salida del script
+    y 'pipeline' contiene el codificador, el escalador y el KMeans ajustados.
+    """
+    # --- Código original de Ceci (sin caracteres especiales) ---
+    codificador = OneHotEncoder()
+    codificacion = codificador.fit_transform(dataset[["Rendimiento ACTUAL"]])
+    nuevas_cols = pd.DataFrame(codificacion.toarray(), columns=codificador.get_feature_names_out(["Rendimiento ACTUAL"]))
+    dataset = pd.concat([dataset, nuevas_cols], axis="columns")
+    dataset = dataset.drop("Rendimiento ACTUAL", axis=1)
+
+    columnas_numericas = dataset.columns.difference(["Nombre", "Ciclo"]).tolist()
+    dataset_agrupado_por_Nombre = dataset.groupby("Nombre")[columnas_numericas].sum().reset_index()
+
+    escalador = MinMaxScaler()
+    dataset_agrupado_por_Nombre_escalado = dataset_agrupado_por_Nombre.copy()
+    dataset_agrupado_por_Nombre_escalado[columnas_a_escalar] = escalador.fit_transform(
+        dataset_agrupado_por_Nombre_escalado[columnas_a_escalar]
+    )
+
+    X = dataset_agrupado_por_Nombre_escalado.drop(['Nombre'], axis=1)
+    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state)
+    # Los clusters se renumeran por riesgo (0 = BAJA ... n_clusters - 1 = ALTA)
+    rango = rango_por_riesgo(kmeans.fit(X).cluster_centers_, X.columns.tolist())
+    dataset_agrupado_por_Nombre_escalado['Cluster'] = rango[kmeans.labels_]
+
+    dataset_agrupado_por_Nombre["Cluster"] = dataset_agrupado_por_Nombre_escalado["Cluster"]
+    dataset_agrupado_por_Nombre["Probabilidad de Rotacion"] = dataset_agrupado_por_Nombre["Cluster"].map(
+        {cluster: etiqueta_rotacion(cluster, n_clusters) for cluster in range(n_clusters)}
+    )
+
     resultados = {
         "data": dataset_agrupado_por_Nombre.to_dict(orient="records"),
         "clusters": n_clusters
     }
+    pipeline = {
+        "codificador": codificador,
+        "escalador": escalador,
+        "kmeans": kmeans,
+        "rango": rango
+    }
+    return resultados, pipeline
+
+
+# Salida JSON
+if __name__ == "__main__":
+    try:
+        dataset = cargar_dataset()
+    except FileNotFoundError:
+        logging.error(f"No se encontró el archivo: {ruta_dataset}")
+        print(json.dumps({"error": f"No se encontró el archivo: {ruta_dataset}"}))
+        exit()  # Importante: Salir del script si el archivo no existe
+
+    resultados, _ = calcular_rotacion(dataset)
     print(json.dumps(resultados))
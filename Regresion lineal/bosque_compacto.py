@@ -0,0 +1,317 @@
+import os
+import json
+import shutil
+import tempfile
+import logging
+import threading
+import numpy as np
+
+# Formato compacto del Random Forest: los arrays de todos los árboles (variable, umbral, hijos y
+# probabilidades por nodo) concatenados en archivos .npy contiguos dentro de una carpeta.
+# Se abren con mmap, así la carga es casi instantánea y varios workers de gunicorn comparten
+# las mismas páginas del cache del sistema operativo en lugar de tener una copia cada uno.
+#
+#   <carpeta>/meta.json         -> formato, clases, cantidad de variables, profundidad por árbol
+#   <carpeta>/arbol_inicio.npy  -> posición del primer nodo de cada árbol (n_arboles + 1)
+#   <carpeta>/variable.npy      -> variable que evalúa cada nodo
+#   <carpeta>/umbral.npy        -> umbral de cada nodo (se va a la izquierda si x <= umbral)
+#   <carpeta>/izquierdo.npy     -> hijo izquierdo, relativo al árbol (0 = hoja)
+#   <carpeta>/derecho.npy       -> hijo derecho, relativo al árbol
+#   <carpeta>/proba.npy         -> probabilidad de cada clase en el nodo (n_nodos x n_clases)
+#
+# La raíz de un árbol nunca es hija de otro nodo, por eso el 0 sirve para marcar las hojas.
+# El formato cuantizado usa float32 para umbrales y probabilidades y uint16 para índices.
+
+VERSION_FORMATO = 1
+ARCHIVO_META = "meta.json"
+ARRAYS = ("arbol_inicio", "variable", "umbral", "izquierdo", "derecho", "proba")
+MAX_UINT16 = np.iinfo(np.uint16).max
+
+# Hasta esta cantidad de filas se recorren todos los árboles a la vez con NumPy (motor plano):
+# en lotes chicos evita el costo fijo por árbol de sklearn. Lotes más grandes van por los árboles nativos.
+FILAS_MOTOR_PLANO = int(os.environ.get("BOSQUE_FILAS_MOTOR_PLANO", 128))
+
+
+def _umbral_float32(umbral):
+    # Los árboles de sklearn comparan x (casteado a float32) contra un umbral float64. Redondeando
+    # el umbral hacia abajo al float32 anterior la comparación x <= umbral da exactamente lo mismo.
+    umbral32 = umbral.astype(np.float32)
+    excedidos = umbral32.astype(np.float64) > umbral
+    umbral32[excedidos] = np.nextafter(umbral32[excedidos], np.float32(-np.inf))
+    return umbral32
+
+
+def _arrays_del_bosque(modelo, cuantizado):
+    arboles = [estimador.tree_ for estimador in modelo.estimators_]
+    inicios = np.zeros(len(arboles) + 1, dtype=np.int64)
+    inicios[1:] = np.cumsum([arbol.node_count for arbol in arboles])
+
+    izquierdo = np.concatenate([np.where(a.children_left < 0, 0, a.children_left) for a in arboles])
+    derecho = np.concatenate([np.where(a.children_right < 0, 0, a.children_right) for a in arboles])
+    variable = np.concatenate([np.where(a.feature < 0, 0, a.feature) for a in arboles])
+    umbral = np.concatenate([a.threshold for a in arboles])
+
+    # Igual que DecisionTreeClassifier.predict_proba: conteos normalizados por nodo (0 -> 1)
+    valores = np.concatenate([a.value[:, 0, :] for a in arboles])
+    normalizador = valores.sum(axis=1, keepdims=True)
+    normalizador[normalizador == 0.0] = 1.0
+    proba = valores / normalizador
+
+    if cuantizado:
+        tipo_indice = np.uint16
+        umbral = _umbral_float32(umbral)
+        proba = proba.astype(np.float32)
+    else:
+        tipo_indice = np.int32
+    return {
+        "arbol_inicio": inicios,
+        "variable": variable.astype(tipo_indice),
+        "umbral": umbral,
+        "izquierdo": izquierdo.astype(tipo_indice),
+        "derecho": derecho.astype(tipo_indice),
+        "proba": np.ascontiguousarray(proba),
+    }
+
+
+def admite_cuantizado(modelo):
+    """
+    El formato cuantizado necesita que cada árbol tenga a lo sumo 65535 nodos y variables.
+    """
+    return (
+        modelo.n_features_in_ <= MAX_UINT16
+        and all(estimador.tree_.node_count <= MAX_UINT16 for estimador in modelo.estimators_)
+    )
+
+
+def _meta_del_bosque(modelo, cuantizado):
+    return {
+        "version_formato": VERSION_FORMATO,
+        "cuantizado": cuantizado,
+        "n_arboles": len(modelo.estimators_),
+        "n_variables": int(modelo.n_features_in_),
+        "clases": [c.item() if hasattr(c, "item") else c for c in modelo.classes_],
+        "profundidad": [int(estimador.tree_.max_depth) for estimador in modelo.estimators_],
+    }
+
+
+def _escribir(modelo, carpeta, cuantizado):
+    arrays = _arrays_del_bosque(modelo, cuantizado)
+    meta = _meta_del_bosque(modelo, cuantizado)
+    # Se escribe en una carpeta temporal al lado y se renombra: nunca queda un bosque a medias
+    padre = os.path.dirname(os.path.abspath(carpeta))
+    os.makedirs(padre, exist_ok=True)
+    carpeta_tmp = tempfile.mkdtemp(dir=padre, suffix=".tmp")
+    try:
+        for nombre, array in arrays.items():
+            np.save(os.path.join(carpeta_tmp, f"{nombre}.npy"), array)
+        with open(os.path.join(carpeta_tmp, ARCHIVO_META), "w", encoding="utf-8") as archivo:
+            json.dump(meta, archivo)
+        if os.path.exists(carpeta):
+            shutil.rmtree(carpeta)
+        os.replace(carpeta_tmp, carpeta)
+    except Exception:
+        shutil.rmtree(carpeta_tmp, ignore_errors=True)
+        raise
+    return meta
+
+
+def exportar_bosque(modelo, carpeta, cuantizado=False, x_verificacion=None):
+    """
+    Exporta el RandomForestClassifier entrenado al formato compacto en 'carpeta'.
+    Si se pasa 'x_verificacion' se comprueba que el bosque exportado prediga exactamente lo mismo
+    que el modelo; si la versión cuantizada no lo logra, se exporta la versión completa.
+    Devuelve la metadata del bosque escrito (incluye 'bytes').
+    """
+    if cuantizado and not admite_cuantizado(modelo):
+        logging.warning("El bosque tiene árboles de más de 65535 nodos: se exporta sin cuantizar.")
+        cuantizado = False
+
+    meta = _escribir(modelo, carpeta, cuantizado)
+    if x_verificacion is not None:
+        bosque = cargar_bosque(carpeta, mmap=False)
+        if not verificar_paridad(modelo, bosque, x_verificacion):
+            if not cuantizado:
+                shutil.rmtree(carpeta, ignore_errors=True)
+                raise ValueError("El bosque exportado no reproduce las predicciones del modelo.")
+            logging.warning("El bosque cuantizado no reproduce todas las predicciones: se exporta sin cuantizar.")
+            meta = _escribir(modelo, carpeta, False)
+            if not verificar_paridad(modelo, cargar_bosque(carpeta, mmap=False), x_verificacion):
+                shutil.rmtree(carpeta, ignore_errors=True)
+                raise ValueError("El bosque exportado no reproduce las predicciones del modelo.")
+        meta["paridad_verificada_filas"] = len(x_verificacion)
+
+    meta["bytes"] = sum(
+        os.path.getsize(os.path.join(carpeta, f"{nombre}.npy")) for nombre in ARRAYS
+    )
+    logging.info(f"Bosque compacto exportado en {carpeta} ({meta['bytes']} bytes, cuantizado={meta['cuantizado']}).")
+    return meta
+
+
+def cargar_bosque(carpeta, mmap=True):
+    """
+    Abre un bosque exportado. Con 'mmap' los arrays no se leen a memoria: se mapean del archivo.
+    """
+    with open(os.path.join(carpeta, ARCHIVO_META), "r", encoding="utf-8") as archivo:
+        meta = json.load(archivo)
+    if meta.get("version_formato") != VERSION_FORMATO:
+        raise ValueError(f"Versión de formato de bosque no soportada: {meta.get('version_formato')}")
+    modo = "r" if mmap else None
+    arrays = {nombre: np.load(os.path.join(carpeta, f"{nombre}.npy"), mmap_mode=modo) for nombre in ARRAYS}
+    return BosqueCompacto(meta, arrays)
+
+
+def compilar_bosque(modelo):
+    """
+    Arma un BosqueCompacto en memoria a partir de un RandomForestClassifier ya cargado (sin
+    pasar por disco). Para lotes grandes usa los árboles del propio modelo.
+    """
+    bosque = BosqueCompacto(_meta_del_bosque(modelo, False), _arrays_del_bosque(modelo, False))
+    bosque._nativos = [estimador.tree_ for estimador in modelo.estimators_]
+    return bosque
+
+
+def obtener_bosque(datos_modelo):
+    """
+    Modelo de 'datos_modelo' como BosqueCompacto. Los modelos cargados desde un pickle se
+    compilan una vez y el resultado queda en 'datos_modelo'.
+    """
+    modelo = datos_modelo['modelo']
+    if isinstance(modelo, BosqueCompacto):
+        return modelo
+    bosque = datos_modelo.get('bosque')
+    if bosque is None:
+        bosque = compilar_bosque(modelo)
+        datos_modelo['bosque'] = bosque
+    return bosque
+
+
+def verificar_paridad(modelo, bosque, x):
+    """
+    True si el bosque compacto predice exactamente las mismas clases que el modelo de sklearn para 'x'.
+    """
+    return bool(np.array_equal(modelo.predict(x), bosque.predict(x)))
+
+
+def _arbol_nativo(n_variables, profundidad, izquierdo, derecho, variable, umbral):
+    # Árbol de sklearn con solo la estructura (hijos, variable y umbral): sirve para que apply()
+    # recorra el lote en C. Las probabilidades se siguen leyendo de los arrays del bosque.
+    from sklearn.tree._tree import Tree, NODE_DTYPE
+    n_nodos = len(izquierdo)
+    es_hoja = izquierdo == 0
+    nodos = np.zeros(n_nodos, dtype=NODE_DTYPE)
+    nodos['left_child'] = np.where(es_hoja, -1, izquierdo)
+    nodos['right_child'] = np.where(es_hoja, -1, derecho)
+    nodos['feature'] = np.where(es_hoja, -2, variable)
+    nodos['threshold'] = np.where(es_hoja, -2.0, umbral)
+    arbol = Tree(n_variables, np.array([1], dtype=np.intp), 1)
+    arbol.__setstate__({
+        'max_depth': profundidad,
+        'node_count': n_nodos,
+        'nodes': nodos,
+        'values': np.zeros((n_nodos, 1, 1), dtype=np.float64),
+    })
+    return arbol
+
+
+class BosqueCompacto:
+    """
+    Bosque de decisión sobre arrays planos, con la misma interfaz de predicción que el
+    RandomForestClassifier de origen (predict, predict_proba, classes_, n_features_in_).
+    Los lotes de hasta 'filas_motor_plano' filas se resuelven con el motor plano: todos los
+    árboles a la vez, con operaciones gather de NumPy sobre los arrays. Los más grandes usan árboles
+    de sklearn con solo la estructura, armados la primera vez que se necesitan; si eso no es
+    posible (cambió la API interna de sklearn) también van por el motor plano.
+    """
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.classes_ = np.array(meta["clases"])
+        self.n_classes_ = len(self.classes_)
+        self.n_features_in_ = meta["n_variables"]
+        self.cuantizado = meta["cuantizado"]
+        self.profundidad = meta["profundidad"]
+        self.arbol_inicio = np.asarray(arrays["arbol_inicio"])
+        self.n_arboles = len(self.profundidad)
+        # Vistas ndarray sobre los memmap (sin copiar): indexar un np.memmap tiene más costo fijo
+        self.variable = np.asarray(arrays["variable"])
+        self.umbral = np.asarray(arrays["umbral"])
+        self.izquierdo = np.asarray(arrays["izquierdo"])
+        self.derecho = np.asarray(arrays["derecho"])
+        self.proba = np.asarray(arrays["proba"])
+        self.filas_motor_plano = FILAS_MOTOR_PLANO
+        self._nativos = None
+        self._lock = threading.Lock()
+
+    def _arboles_nativos(self):
+        if self._nativos is None:
+            with self._lock:
+                if self._nativos is None:
+                    try:
+                        self._nativos = [
+                            _arbol_nativo(
+                                self.n_features_in_, self.profundidad[arbol],
+                                *(np.asarray(array[self.arbol_inicio[arbol]:self.arbol_inicio[arbol + 1]])
+                                  for array in (self.izquierdo, self.derecho, self.variable, self.umbral))
+                            )
+                            for arbol in range(self.n_arboles)
+                        ]
+                    except Exception as e:
+                        logging.warning(f"No se pudieron armar los árboles nativos ({e}). Se recorre el bosque con NumPy.")
+                        self._nativos = []
+        return self._nativos
+
+    def _validar(self, x):
+        # sklearn evalúa los árboles en float32 y rechaza NaN/infinito: se replica para dar lo mismo
+        x = np.asarray(x, dtype=np.float32)
+        if x.ndim != 2 or x.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaban {self.n_features_in_} variables y llegaron {x.shape[-1] if x.ndim else 0}.")
+        if not np.isfinite(x).all():
+            raise ValueError("La entrada contiene NaN, infinito o un valor demasiado grande para float32.")
+        return x
+
+    def _hojas_plano(self, x):
+        """
+        Motor plano: recorre todos los árboles para todas las filas a la vez, un nivel por iteración.
+        Cada par (fila, árbol) avanza con gathers sobre los arrays y sale de la lista de activos
+        cuando llega a una hoja. Devuelve el nodo hoja (índice global) de cada par: n_filas x n_arboles.
+        """
+        n_filas, n_variables = x.shape
+        valores = x.ravel()
+        inicios = np.tile(self.arbol_inicio[:-1], n_filas)
+        base_fila = np.repeat(np.arange(n_filas, dtype=np.intp) * n_variables, self.n_arboles)
+        hojas = np.empty(n_filas * self.n_arboles, dtype=np.intp)
+        activos = np.arange(n_filas * self.n_arboles)
+        nodo = inicios.copy()
+        while activos.size:
+            izquierdo = self.izquierdo[nodo]
+            es_hoja = izquierdo == 0
+            if es_hoja.any():
+                hojas[activos[es_hoja]] = nodo[es_hoja]
+                sigue = ~es_hoja
+                activos, nodo, izquierdo = activos[sigue], nodo[sigue], izquierdo[sigue]
+                if not activos.size:
+                    break
+            va_izquierda = valores[base_fila[activos] + self.variable[nodo]] <= self.umbral[nodo]
+            nodo = inicios[activos] + np.where(va_izquierda, izquierdo, self.derecho[nodo])
+        return hojas.reshape(n_filas, self.n_arboles)
+
+    def predict_proba(self, x):
+        x = np.ascontiguousarray(self._validar(x))
+        proba = np.zeros((len(x), self.n_classes_), dtype=np.float64)
+        nativos = self._arboles_nativos() if len(x) > self.filas_motor_plano else None
+        # Misma acumulación que RandomForestClassifier.predict_proba: árbol por árbol y al final el promedio
+        if nativos:
+            for arbol, nativo in enumerate(nativos):
+                proba += self.proba[self.arbol_inicio[arbol] + nativo.apply(x)]
+        else:
+            # Se parte en tramos para acotar la memoria del motor plano (pares fila-árbol)
+            paso = max(self.filas_motor_plano, 1)
+            for inicio in range(0, len(x), paso):
+                hojas = self._hojas_plano(x[inicio:inicio + paso])
+                # cumsum suma en orden, árbol por árbol: da exactamente lo mismo que el bucle
+                proba[inicio:inicio + paso] = np.cumsum(self.proba[hojas], axis=1, dtype=np.float64)[:, -1]
+        proba /= self.n_arboles
+        return proba
+
+    def predict(self, x):
+        return self.classes_.take(np.argmax(self.predict_proba(x), axis=1), axis=0)
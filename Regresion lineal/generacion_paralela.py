@@ -0,0 +1,85 @@
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# dataset_io está en la raíz del proyecto
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dataset_io
+
+# Generación de datasets sintéticos grandes en fragmentos independientes. Cada fragmento tiene
+# su propio generador, derivado con SeedSequence.spawn de la semilla principal: el resultado
+# depende solo de (semilla, n_samples, filas_por_fragmento), no de cuántos procesos lo generen
+# ni en qué orden terminen, así que se reproduce bit a bit.
+
+FILAS_POR_FRAGMENTO = int(os.environ.get("SINTETICOS_FILAS_POR_FRAGMENTO", 500000))
+PROCESOS = int(os.environ.get("SINTETICOS_PROCESOS", 0)) or os.cpu_count() or 1
+
+
+def generador_fragmento(secuencia):
+    """
+    RandomState (misma API que np.random, que usan los generadores) sobre un MT19937
+    inicializado con la SeedSequence del fragmento.
+    """
+    return np.random.RandomState(np.random.MT19937(secuencia))
+
+
+def _generar_fragmento(funcion, argumentos, inicio, n_filas, secuencia, ruta):
+    # Corre dentro de un proceso del pool (o en el mismo proceso si hay uno solo)
+    df = funcion(*argumentos, n_samples=n_filas, rng=generador_fragmento(secuencia), inicio=inicio)
+    dataset_io.guardar_dataset(df, ruta)
+    return ruta, len(df)
+
+
+def generar_fragmentado(funcion, argumentos, n_samples, carpeta_salida, semilla=None,
+                        filas_por_fragmento=FILAS_POR_FRAGMENTO, procesos=PROCESOS):
+    """
+    Genera 'n_samples' filas con 'funcion(*argumentos, n_samples=, rng=, inicio=)' en fragmentos
+    de 'filas_por_fragmento' filas, repartidos en 'procesos' procesos, y los deja como dataset
+    fragmentado en 'carpeta_salida' (se reemplaza completa al terminar).
+    'funcion' debe poder importarse desde otro proceso (definida a nivel de módulo).
+    Devuelve la entropía de la semilla usada: con semilla=None se sortea una y se informa
+    para poder reproducir el dataset.
+    """
+    if n_samples <= 0 or filas_por_fragmento <= 0:
+        raise ValueError("n_samples y filas_por_fragmento deben ser mayores a 0")
+    semilla_principal = np.random.SeedSequence(semilla)
+    n_fragmentos = -(-n_samples // filas_por_fragmento)
+    secuencias = semilla_principal.spawn(n_fragmentos)
+    procesos = max(1, min(procesos, n_fragmentos))
+    logging.info(
+        f"Generando {n_samples} filas en {n_fragmentos} fragmentos con {procesos} procesos "
+        f"(semilla={semilla_principal.entropy})."
+    )
+
+    carpeta_salida = os.path.abspath(carpeta_salida)
+    os.makedirs(os.path.dirname(carpeta_salida), exist_ok=True)
+    # Los fragmentos se escriben en una carpeta temporal al lado y se publican todos juntos
+    carpeta_tmp = tempfile.mkdtemp(dir=os.path.dirname(carpeta_salida), suffix=".tmp")
+    try:
+        tareas = [
+            (funcion, argumentos, inicio, min(filas_por_fragmento, n_samples - inicio), secuencia,
+             dataset_io.ruta_fragmento(carpeta_tmp, indice))
+            for indice, (inicio, secuencia) in enumerate(zip(range(0, n_samples, filas_por_fragmento), secuencias))
+        ]
+        if procesos == 1:
+            for tarea in tareas:
+                _generar_fragmento(*tarea)
+        else:
+            # 'spawn': los procesos no heredan el estado global de np.random ni locks del padre
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn")) as pool:
+                for ruta, filas in pool.map(_generar_fragmento, *zip(*tareas)):
+                    logging.info(f"Fragmento {os.path.basename(ruta)} generado ({filas} filas).")
+
+        if os.path.isdir(carpeta_salida):
+            shutil.rmtree(carpeta_salida)
+        os.replace(carpeta_tmp, carpeta_salida)
+    except Exception:
+        shutil.rmtree(carpeta_tmp, ignore_errors=True)
+        raise
+    logging.info(f"Dataset fragmentado guardado en: {carpeta_salida}")
+    return semilla_principal.entropy
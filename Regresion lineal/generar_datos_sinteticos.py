@@ -1,52 +1,117 @@
+import os
+import sys
+import argparse
 import pandas as pd
 import numpy as np
 
-def generar_datos_sinteticos(n_samples=10000, p_ruido=0.15):
+# dataset_io está en la raíz del proyecto
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dataset_io
+import generacion_paralela
+
+def calcular_desempenio_futuro_fila(row, p_ruido, rng=np.random):
+    """
+    Puntaje de una fila, con los sorteos de ruido fila por fila. Se mantiene como referencia
+    de calcular_desempenio_futuro, que es la que usa el generador.
+    """
+    score = 0
+    if row['jerarquia'] == 'senior': score += 1.5
+    elif row['jerarquia'] == 'junior': score += 1.0
+    else: score += 0.5
+    if row['desempenio'] == 'alto': score += 1.5
+    elif row['desempenio'] == 'medio': score += 1.0
+    else: score += 0.5
+    score += min(row['años_experiencia'] / 10, 1.0)
+    score += min(row['proyectos_completados'] / 10, 1.0)
+    score += min(row['horas_extra'] / 40, 0.5)
+    score += min(row['capacitaciones'] / 5, 0.5)
+    score += (row['feedback_positivo'] - row['feedback_negativo']) / 5
+    score += min(row['tiempo_en_empresa'] / 10, 0.5)
+    score += (row['motivacion'] - 3) * 0.5
+    score += rng.normal(0, 0.2)
+    if rng.rand() < p_ruido:
+        score += rng.uniform(-2, 2)
+    if score >= 4.5: return 2
+    elif score >= 3.0: return 1
+    else: return 0
+
+# Aporte de 'jerarquia' y 'desempenio' al puntaje; cualquier otro valor suma 0.5
+PUNTOS_JERARQUIA = {'senior': 1.5, 'junior': 1.0}
+PUNTOS_DESEMPENIO = {'alto': 1.5, 'medio': 1.0}
+
+def calcular_desempenio_futuro(df, p_ruido, rng=np.random):
+    """
+    Versión vectorizada de calcular_desempenio_futuro_fila para todo el DataFrame: el puntaje
+    se calcula por columnas y los sorteos de ruido se hacen en bloque al principio. Las
+    etiquetas siguen la misma distribución que la versión por fila, aunque no la misma
+    secuencia (el orden de los sorteos cambia).
+    """
+    n = len(df)
+    ruido_normal = rng.normal(0, 0.2, n)
+    con_ruido = rng.rand(n) < p_ruido
+    ruido_uniforme = rng.uniform(-2, 2, n)
+
+    score = (
+        df['jerarquia'].map(PUNTOS_JERARQUIA).fillna(0.5).to_numpy(dtype=float)
+        + df['desempenio'].map(PUNTOS_DESEMPENIO).fillna(0.5).to_numpy(dtype=float)
+        + np.minimum(df['años_experiencia'].to_numpy(dtype=float) / 10, 1.0)
+        + np.minimum(df['proyectos_completados'].to_numpy(dtype=float) / 10, 1.0)
+        + np.minimum(df['horas_extra'].to_numpy(dtype=float) / 40, 0.5)
+        + np.minimum(df['capacitaciones'].to_numpy(dtype=float) / 5, 0.5)
+        + (df['feedback_positivo'].to_numpy(dtype=float) - df['feedback_negativo'].to_numpy(dtype=float)) / 5
+        + np.minimum(df['tiempo_en_empresa'].to_numpy(dtype=float) / 10, 0.5)
+        + (df['motivacion'].to_numpy(dtype=float) - 3) * 0.5
+        + ruido_normal
+        + np.where(con_ruido, ruido_uniforme, 0.0)
+    )
+    return np.where(score >= 4.5, 2, np.where(score >= 3.0, 1, 0))
+
+def generar_datos_sinteticos(n_samples=10000, p_ruido=0.15, semilla=None, rng=None, inicio=0):
+    """
+    Con 'semilla' (o un RandomState en 'rng') el resultado es reproducible; sin ninguno se usa
+    el estado global de np.random. 'inicio' numera los empleados a partir de esa posición.
+    """
+    if rng is None:
+        rng = np.random if semilla is None else np.random.RandomState(semilla)
     areas = ['Desarrollo', 'Diseño', 'Marketing', 'Ventas', 'Soporte', 'QA']
     data = {
-        'nombre': [f'Empleado_{i}' for i in range(n_samples)],
-        'area': np.random.choice(areas, n_samples),
-        'jerarquia': np.random.choice(['trainee', 'junior', 'senior'], n_samples, p=[0.3, 0.4, 0.3]),
-        'desempenio': np.random.choice(['bajo', 'medio', 'alto'], n_samples, p=[0.2, 0.5, 0.3]),
-        'años_experiencia': np.random.normal(5, 2, n_samples).clip(0, 15),
-        'proyectos_completados': np.random.poisson(5, n_samples),
-        'horas_extra': np.random.normal(10, 5, n_samples).clip(0, 40),
-        'capacitaciones': np.random.poisson(3, n_samples),
-        'feedback_positivo': np.random.normal(4, 1, n_samples).clip(1, 5),
-        'feedback_negativo': np.random.normal(2, 1, n_samples).clip(1, 5),
-        'tiempo_en_empresa': np.random.normal(3, 1.5, n_samples).clip(0, 10),
-        'motivacion': np.random.normal(3, 1, n_samples).clip(1, 5)
+        'nombre': [f'Empleado_{i}' for i in range(inicio, inicio + n_samples)],
+        'area': rng.choice(areas, n_samples),
+        'jerarquia': rng.choice(['trainee', 'junior', 'senior'], n_samples, p=[0.3, 0.4, 0.3]),
+        'desempenio': rng.choice(['bajo', 'medio', 'alto'], n_samples, p=[0.2, 0.5, 0.3]),
+        'años_experiencia': rng.normal(5, 2, n_samples).clip(0, 15),
+        'proyectos_completados': rng.poisson(5, n_samples),
+        'horas_extra': rng.normal(10, 5, n_samples).clip(0, 40),
+        'capacitaciones': rng.poisson(3, n_samples),
+        'feedback_positivo': rng.normal(4, 1, n_samples).clip(1, 5),
+        'feedback_negativo': rng.normal(2, 1, n_samples).clip(1, 5),
+        'tiempo_en_empresa': rng.normal(3, 1.5, n_samples).clip(0, 10),
+        'motivacion': rng.normal(3, 1, n_samples).clip(1, 5)
     }
     df = pd.DataFrame(data)
 
-    def calcular_desempenio_futuro(row):
-        score = 0
-        if row['jerarquia'] == 'senior': score += 1.5
-        elif row['jerarquia'] == 'junior': score += 1.0
-        else: score += 0.5
-        if row['desempenio'] == 'alto': score += 1.5
-        elif row['desempenio'] == 'medio': score += 1.0
-        else: score += 0.5
-        score += min(row['años_experiencia'] / 10, 1.0)
-        score += min(row['proyectos_completados'] / 10, 1.0)
-        score += min(row['horas_extra'] / 40, 0.5)
-        score += min(row['capacitaciones'] / 5, 0.5)
-        score += (row['feedback_positivo'] - row['feedback_negativo']) / 5
-        score += min(row['tiempo_en_empresa'] / 10, 0.5)
-        score += (row['motivacion'] - 3) * 0.5
-        score += np.random.normal(0, 0.2)
-        if np.random.rand() < p_ruido:
-            score += np.random.uniform(-2, 2)
-        if score >= 4.5: return 2
-        elif score >= 3.0: return 1
-        else: return 0
-
-    df['desempenio_futuro'] = df.apply(calcular_desempenio_futuro, axis=1)
+    df['desempenio_futuro'] = calcular_desempenio_futuro(df, p_ruido, rng)
     df['jerarquia'] = df['jerarquia'].map({'trainee': 0, 'junior': 1, 'senior': 2})
     df['desempenio'] = df['desempenio'].map({'bajo': 0, 'medio': 1, 'alto': 2})
     return df
 
 if __name__ == "__main__":
-    df = generar_datos_sinteticos()
-    df.to_csv('prediccion_rendimiento_training_completo.csv', index=False)
-    print("Datos sintéticos generados y guardados en 'prediccion_rendimiento_training_completo.csv'") 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Genera el dataset sintético de desempeño futuro.")
+    parser.add_argument("--n_samples", type=int, default=10000)
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--salida", default='prediccion_rendimiento_training_completo.parquet',
+                        help="Archivo (.parquet/.csv) o carpeta sin extensión para generar por fragmentos en paralelo")
+    parser.add_argument("--procesos", type=int, default=generacion_paralela.PROCESOS)
+    parser.add_argument("--filas_por_fragmento", type=int, default=generacion_paralela.FILAS_POR_FRAGMENTO)
+    args = parser.parse_args()
+
+    if not os.path.splitext(args.salida)[1]:
+        entropia = generacion_paralela.generar_fragmentado(
+            generar_datos_sinteticos, (), args.n_samples, args.salida, args.semilla,
+            filas_por_fragmento=args.filas_por_fragmento, procesos=args.procesos,
+        )
+        print(f"Datos sintéticos generados en la carpeta '{args.salida}' (semilla={entropia})")
+    else:
+        df = generar_datos_sinteticos(args.n_samples, semilla=args.semilla)
+        dataset_io.guardar_dataset(df, args.salida)
+        print(f"Datos sintéticos generados y guardados en '{args.salida}'") 
\ No newline at end of file
@@ -5,6 +5,12 @@ import sys
 import logging
 import os
 from collections import Counter
+from functools import partial
+
+# dataset_io está en la raíz del proyecto
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dataset_io
+import generacion_paralela
 
 # Configuración de Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,6 +18,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 def clasificar_fila_con_ruido(fila, reglas, p_ruido=0.01): # <--- p_ruido AÚN MÁS REDUCIDO
     """
     Clasifica una fila basándose en las reglas proporcionadas y añade ruido controlado.
+    Se mantiene como referencia de clasificar_lote_con_ruido, que es la que usa el generador.
     """
     puntajes = []
     
@@ -85,10 +92,188 @@ def clasificar_fila_con_ruido(fila, reglas, p_ruido=0.01): # <--- p_ruido AÚN M
     return np.random.choice([0, 1, 2], p=[0.1, 0.8, 0.1])
 
 
-def generar_datos_sinteticos_con_reglas(reglas, n_samples=3000, p_ruido=0.01): # <--- n_samples MODIFICADO a 3000
+# Probabilidades del ruido y del valor por defecto (las mismas que usa clasificar_fila_con_ruido)
+RUIDO_DESDE_BAJO = ([0, 1], [0.8, 0.2])
+RUIDO_DESDE_ALTO = ([1, 2], [0.2, 0.8])
+RUIDO_DESDE_MEDIO = ([0, 1, 2], [0.1, 0.8, 0.1])
+SIN_REGLAS = ([0, 1, 2], [0.1, 0.8, 0.1])
+
+
+def compilar_reglas(reglas):
+    """
+    Convierte el JSON de reglas en una lista de evaluadores por columna, con la misma
+    interpretación que clasificar_fila_con_ruido:
+      ('rango', columna, min, max)                -> {"1": [min, max]}
+      ('clases', columna, [(clase, min, max),...]) -> {"0": [...], "1": [...], "2": [...]}
+    """
+    compiladas = []
+    for columna, rangos_clase in reglas.items():
+        if not isinstance(rangos_clase, dict):
+            continue
+        if "1" in rangos_clase and isinstance(rangos_clase["1"], list) and len(rangos_clase["1"]) == 2:
+            min_val, max_val = rangos_clase["1"]
+            compiladas.append(('rango', columna, min_val, max_val))
+        elif any(k in rangos_clase for k in ["0", "1", "2"]):
+            rangos = []
+            for clase_codificada, (min_val, max_val) in rangos_clase.items():
+                try:
+                    rangos.append((int(clase_codificada), min_val, max_val))
+                except ValueError:
+                    logging.warning(f"Clave de clase codificada '{clase_codificada}' no es un entero. Ignorando.")
+            compiladas.append(('clases', columna, rangos))
+    return compiladas
+
+
+def _columna_numerica(df, columna):
+    """
+    Devuelve la columna como float, mapeando 'jerarquia'/'desempenio' simbólicos igual que la versión por fila.
+    """
+    valores = df[columna]
+    if valores.dtype == 'object':
+        if columna == 'desempenio':
+            valores = valores.str.lower().map({'bajo': 0, 'medio': 1, 'alto': 2}).fillna(valores)
+        elif columna == 'jerarquia':
+            valores = valores.str.lower().map({'trainee': 0, 'junior': 1, 'senior': 2}).fillna(valores)
+    return pd.to_numeric(valores, errors='coerce').to_numpy(dtype=float)
+
+
+def _votos_por_clase(df, reglas_compiladas):
+    """
+    Evalúa todas las reglas sobre el lote y devuelve (clases, conteos) donde conteos[i, j]
+    es la cantidad de reglas que votaron la clase clases[j] en la fila i.
+    """
+    n = len(df)
+    votos = {}
+
+    def sumar(clase, mascara):
+        if clase not in votos:
+            votos[clase] = np.zeros(n, dtype=np.int32)
+        votos[clase] += mascara
+
+    for regla in reglas_compiladas:
+        columna = regla[1]
+        if columna not in df.columns:
+            continue
+        valores = _columna_numerica(df, columna)
+        # Las comparaciones con NaN dan False, así que los valores no numéricos no votan
+        if regla[0] == 'rango':
+            _, _, min_val, max_val = regla
+            en_rango = (min_val <= valores) & (valores <= max_val)
+            debajo = ~en_rango & (valores < min_val)
+            arriba = ~en_rango & ~debajo & (valores > max_val)
+            sumar(1, en_rango)
+            sumar(0, debajo)
+            sumar(2, arriba)
+        else:
+            sin_asignar = np.ones(n, dtype=bool)
+            for clase, min_val, max_val in regla[2]:
+                # Una vez que la fila coincide con una clase, se pasa a la siguiente columna
+                coincide = sin_asignar & (min_val <= valores) & (valores <= max_val)
+                sumar(clase, coincide)
+                sin_asignar &= ~coincide
+
+    clases = np.array(sorted(votos), dtype=np.int64)
+    if len(clases) == 0:
+        return clases, np.zeros((n, 0), dtype=np.int32)
+    return clases, np.column_stack([votos[c] for c in clases])
+
+
+def _sortear_uniformes(tiene_puntaje, p_ruido, rng):
+    """
+    Reproduce en bloque la secuencia de sorteos de la versión por fila: cada fila consume un
+    uniforme (rand() o choice()) y las que tienen puntaje y caen en ruido consumen uno más.
+    Devuelve (primer sorteo, sorteo de ruido, con_ruido) por fila, consumiendo del generador
+    exactamente la misma cantidad de números que la versión por fila.
+    """
+    n = len(tiene_puntaje)
+    sorteos = rng.random_sample(n)
+    posiciones_bajas = np.flatnonzero(sorteos < p_ruido)
+
+    primer_sorteo = np.empty(n)
+    sorteo_ruido = np.zeros(n)
+    con_ruido = np.zeros(n, dtype=bool)
+
+    def extender(hasta):
+        nonlocal sorteos, posiciones_bajas
+        nuevos = rng.random_sample(hasta - len(sorteos))
+        posiciones_bajas = np.concatenate([posiciones_bajas, len(sorteos) + np.flatnonzero(nuevos < p_ruido)])
+        sorteos = np.concatenate([sorteos, nuevos])
+
+    # La fila i usa el sorteo en la posición i + k, donde k es la cantidad de filas con ruido previas.
+    # Solo las posiciones con sorteo < p_ruido pueden disparar ruido, así que se recorren solo esas.
+    i = k = j = 0
+    while True:
+        while j < len(posiciones_bajas) and posiciones_bajas[j] < i + k:
+            j += 1
+        if j == len(posiciones_bajas):
+            if len(sorteos) >= n + k:
+                break
+            extender(n + k)
+            continue
+        t = posiciones_bajas[j]
+        fila = t - k
+        if fila >= n:
+            break
+        j += 1
+        if not tiene_puntaje[fila]:
+            continue
+        if t + 1 >= len(sorteos):
+            extender(t + 2)
+        primer_sorteo[i:fila + 1] = sorteos[i + k:t + 1]
+        sorteo_ruido[fila] = sorteos[t + 1]
+        con_ruido[fila] = True
+        k += 1
+        i = fila + 1
+    primer_sorteo[i:] = sorteos[i + k:n + k]
+    return primer_sorteo, sorteo_ruido, con_ruido
+
+
+def _elegir(opciones_y_probabilidades, uniformes):
+    """
+    Equivalente vectorizado de np.random.choice(opciones, p=probabilidades) dado el uniforme ya sorteado.
+    """
+    opciones, probabilidades = opciones_y_probabilidades
+    cdf = np.cumsum(np.asarray(probabilidades, dtype=float))
+    cdf /= cdf[-1]
+    return np.asarray(opciones, dtype=np.int64)[cdf.searchsorted(uniformes, side='right')]
+
+
+def clasificar_lote_con_ruido(df, reglas, p_ruido=0.01, rng=np.random):
+    """
+    Versión vectorizada de clasificar_fila_con_ruido para todo el DataFrame a la vez:
+    evalúa los rangos por columna, cuenta votos, desempata por la clase más baja y aplica
+    el ruido a clases adyacentes. Con el mismo estado del generador 'rng' produce las mismas
+    etiquetas que aplicar clasificar_fila_con_ruido fila por fila.
+    """
+    reglas_compiladas = reglas if isinstance(reglas, list) else compilar_reglas(reglas)
+    clases, conteos = _votos_por_clase(df, reglas_compiladas)
+    n = len(df)
+
+    tiene_puntaje = conteos.sum(axis=1) > 0 if conteos.shape[1] else np.zeros(n, dtype=bool)
+    # argmax devuelve la primera clase con más votos; como 'clases' está ordenado, es la más baja
+    resultado = clases[conteos.argmax(axis=1)] if conteos.shape[1] else np.zeros(n, dtype=np.int64)
+
+    primer_sorteo, sorteo_ruido, con_ruido = _sortear_uniformes(tiene_puntaje, p_ruido, rng)
+
+    etiquetas = np.where(tiene_puntaje, resultado, _elegir(SIN_REGLAS, primer_sorteo))
+    desde_bajo = con_ruido & (resultado == 0)
+    desde_alto = con_ruido & (resultado == 2)
+    desde_medio = con_ruido & ~desde_bajo & ~desde_alto
+    etiquetas[desde_bajo] = _elegir(RUIDO_DESDE_BAJO, sorteo_ruido[desde_bajo])
+    etiquetas[desde_alto] = _elegir(RUIDO_DESDE_ALTO, sorteo_ruido[desde_alto])
+    etiquetas[desde_medio] = _elegir(RUIDO_DESDE_MEDIO, sorteo_ruido[desde_medio])
+    return pd.Series(etiquetas, index=df.index)
+
+
+def generar_datos_sinteticos_con_reglas(reglas, n_samples=3000, p_ruido=0.01, semilla=None, rng=None, inicio=0): # <--- n_samples MODIFICADO a 3000
     """
     Genera un DataFrame con datos sintéticos y aplica las reglas para definir desempenio_futuro.
+    Con 'semilla' el resultado es reproducible; sin ella se usa el estado global de np.random.
+    'rng' (un RandomState ya inicializado) tiene prioridad sobre 'semilla'; 'inicio' numera
+    los empleados a partir de esa posición (lo usa la generación por fragmentos).
     """
+    if rng is None:
+        rng = np.random if semilla is None else np.random.RandomState(semilla)
     areas = [
         'reposicion', 'ventas', 'atencion al cliente', 'administracion',
         'caja', 'logistica', 'deposito'
@@ -97,15 +282,15 @@ def generar_datos_sinteticos_con_reglas(reglas, n_samples=3000, p_ruido=0.01): #
     desempenios = ['bajo', 'medio', 'alto']
 
     data = {
-        'nombre': [f'Empleado {i+1}' for i in range(n_samples)],
-        'area': np.random.choice(areas, n_samples),
-        'jerarquia': np.random.choice(jerarquias, n_samples, p=[0.3, 0.4, 0.3]),
-        'puntaje': np.random.randint(30, 100, n_samples),
-        'cantidad_proyectos': np.random.randint(1, 6, n_samples),
-        'desempenio': np.random.choice(desempenios, n_samples, p=[0.2, 0.5, 0.3]),
-        'personas_equipo': np.random.randint(2, 31, n_samples),
-        'horas_extra': np.random.randint(0, 21, n_samples),
-        'asistencia_puntualidad': np.random.randint(40, 101, n_samples)
+        'nombre': [f'Empleado {i+1}' for i in range(inicio, inicio + n_samples)],
+        'area': rng.choice(areas, n_samples),
+        'jerarquia': rng.choice(jerarquias, n_samples, p=[0.3, 0.4, 0.3]),
+        'puntaje': rng.randint(30, 100, n_samples),
+        'cantidad_proyectos': rng.randint(1, 6, n_samples),
+        'desempenio': rng.choice(desempenios, n_samples, p=[0.2, 0.5, 0.3]),
+        'personas_equipo': rng.randint(2, 31, n_samples),
+        'horas_extra': rng.randint(0, 21, n_samples),
+        'asistencia_puntualidad': rng.randint(40, 101, n_samples)
     }
     df = pd.DataFrame(data)
 
@@ -121,7 +306,8 @@ def generar_datos_sinteticos_con_reglas(reglas, n_samples=3000, p_ruido=0.01): #
         if col in df_temp_mapped.columns:
             df_temp_mapped[col] = pd.to_numeric(df_temp_mapped[col], errors='coerce')
 
-    df["desempenio_futuro"] = df_temp_mapped.apply(lambda fila: clasificar_fila_con_ruido(fila, reglas, p_ruido), axis=1)
+    # Clasificación vectorizada (equivale a aplicar clasificar_fila_con_ruido fila por fila)
+    df["desempenio_futuro"] = clasificar_lote_con_ruido(df_temp_mapped, reglas, p_ruido, rng)
     
     # Volver a mapear las columnas originales si es necesario para el CSV de salida
     # Es crucial que las columnas 'jerarquia' y 'desempenio' se mantengan en su formato original de cadena
@@ -141,13 +327,40 @@ def generar_datos_sinteticos_con_reglas(reglas, n_samples=3000, p_ruido=0.01): #
 
     return df
 
+
+def _extraer_opcion(argumentos, nombre):
+    # Saca '--nombre valor' de la lista de argumentos y devuelve el valor (o None)
+    if nombre not in argumentos:
+        return None
+    indice = argumentos.index(nombre)
+    valor = argumentos[indice + 1] if indice + 1 < len(argumentos) else None
+    del argumentos[indice:indice + 2]
+    return valor
+
+USO = (
+    "Uso: python generar_synthetic_training_data.py <reglas.json> [n_samples] [semilla] [--salida ruta.parquet|carpeta] "
+    "[--procesos N] [--filas_por_fragmento N]"
+)
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        logging.error("Uso: python generar_synthetic_training_data.py <reglas.json>")
-        print(json.dumps({"error": "Uso: python generar_synthetic_training_data.py <reglas.json>"}), file=sys.stderr)
+    # Por defecto el dataset se escribe junto al script; la app pasa '--salida' con la ruta
+    # dentro del espacio de trabajo de cada ejecución. Una '--salida' sin extensión es una
+    # carpeta: el dataset se genera por fragmentos en paralelo (ver generacion_paralela)
+    argumentos = sys.argv[1:]
+    output_csv_path = os.path.join(os.path.dirname(sys.argv[0]), "synthetic_training_data.parquet")
+    if "--salida" in argumentos:
+        output_csv_path = _extraer_opcion(argumentos, "--salida")
+    procesos = _extraer_opcion(argumentos, "--procesos")
+    filas_por_fragmento = _extraer_opcion(argumentos, "--filas_por_fragmento")
+
+    if len(argumentos) < 1 or not output_csv_path:
+        logging.error(USO)
+        print(json.dumps({"error": USO}), file=sys.stderr)
         sys.exit(1)
     
-    reglas_path = sys.argv[1]
+    reglas_path = argumentos[0]
+    n_samples = int(argumentos[1]) if len(argumentos) > 1 else 3000
+    semilla = int(argumentos[2]) if len(argumentos) > 2 else None
     logging.info(f"Cargando reglas desde: {reglas_path}")
     try:
         with open(reglas_path, "r", encoding="utf-8") as f:
@@ -158,12 +371,19 @@ if __name__ == "__main__":
         print(json.dumps({"error": f"Error al cargar reglas: {str(e)}"}), file=sys.stderr)
         sys.exit(1)
 
-    logging.info(f"Generando datos sintéticos con n_samples={3000} y p_ruido={0.01}...")
-    # Pasar p_ruido y n_samples explícitamente a la función
-    df = generar_datos_sinteticos_con_reglas(reglas, n_samples=3000, p_ruido=0.01) 
-    
-    output_csv_path = os.path.join(os.path.dirname(sys.argv[0]), "synthetic_training_data.csv")
-    df.to_csv(output_csv_path, index=False, encoding="utf-8")
+    logging.info(f"Generando datos sintéticos con n_samples={n_samples} y p_ruido={0.01}...")
+    if not os.path.splitext(output_csv_path)[1]:
+        # Dataset fragmentado: regresion.py acepta la carpeta directamente en --datos
+        generacion_paralela.generar_fragmentado(
+            partial(generar_datos_sinteticos_con_reglas, p_ruido=0.01), (reglas,), n_samples, output_csv_path, semilla,
+            filas_por_fragmento=int(filas_por_fragmento or generacion_paralela.FILAS_POR_FRAGMENTO),
+            procesos=int(procesos or generacion_paralela.PROCESOS),
+        )
+        df = dataset_io.leer_dataset(output_csv_path, columnas=['desempenio_futuro'])
+    else:
+        # Pasar p_ruido y n_samples explícitamente a la función
+        df = generar_datos_sinteticos_con_reglas(reglas, n_samples=n_samples, p_ruido=0.01, semilla=semilla)
+        dataset_io.guardar_dataset(df, output_csv_path)
     
     # Log la distribución de desempenio_futuro
     desempenio_counts = df['desempenio_futuro'].value_counts(normalize=True).to_dict()
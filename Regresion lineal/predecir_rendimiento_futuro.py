@@ -1,105 +1,103 @@
+import numpy as np
 import pandas as pd
 import pickle
 import sys
 import json
 import os
 import logging
+from contextlib import nullcontext
+import preprocesamiento
+import bosque_compacto
 
-# Configuración de Logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# registro_logs está en la raíz del proyecto. El logging lo configura quien importa el módulo
+# (la API) o el main de este script, no la importación.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import registro_logs
 
-def predecir_rendimiento_futuro(archivo_csv):
+# La ruta del modelo debe ser la misma donde regresion.py lo guarda
+ruta_modelo = os.path.join(os.path.dirname(os.path.dirname(__file__)), "azurepy", "modelo_desempenio_futuro.pkl")
+
+# Filas que se leen y predicen por vez en el modo por lotes
+FILAS_POR_LOTE = 50000
+
+def cargar_modelo(modelo_guardado_path=ruta_modelo):
+    """
+    Carga el pickle generado por regresion.py (modelo, columnas, encoder, scaler y pipeline).
+    """
+    logging.info(f"Cargando modelo desde: {modelo_guardado_path}")
+    with open(modelo_guardado_path, 'rb') as archivo_cargado:
+        datos_cargados = pickle.load(archivo_cargado)
+    logging.info("Modelo y preprocesadores cargados exitosamente.")
+    return datos_cargados
+
+def predecir_dataframe(nuevos_df, datos_cargados, probabilidades=False, cache=None, clave_modelo=None, medir=None):
+    """
+    Aplica el preprocesamiento y el modelo ya cargado sobre un DataFrame.
+    Devuelve el mismo DataFrame con la columna 'desempenio_futuro' agregada y, con
+    'probabilidades', una columna 'probabilidad_<clase>' por cada clase.
+    Con 'cache' (ver cache_predicciones) solo se calculan las filas que el modelo
+    'clave_modelo' todavía no predijo.
+    'medir(nombre, filas=)' devuelve un context manager que mide cada etapa (la API pasa metricas.etapa).
+    """
+    medir = medir or (lambda nombre, filas=None: nullcontext())
+
+    # --- Preprocesamiento (el mismo pipeline ajustado en el entrenamiento) ---
+    with medir("preprocesamiento", filas=len(nuevos_df)):
+        # El bosque compilado da las mismas clases que modelo.predict, con menos costo fijo por llamada
+        bosque = bosque_compacto.obtener_bosque(datos_cargados)
+        x_nuevos_scaled = preprocesamiento.obtener_pipeline(datos_cargados).transformar(nuevos_df)
+    logging.debug("Datos de predicción preprocesados y escalados.")
+
+    # --- Predicción ---
+    with medir("prediccion", filas=len(nuevos_df)):
+        if cache is not None and clave_modelo is not None:
+            probabilidades_clases = cache.probabilidades(clave_modelo, x_nuevos_scaled, bosque.predict_proba)
+        else:
+            probabilidades_clases = bosque.predict_proba(x_nuevos_scaled)
+    predicciones_futuras_numericas = bosque.classes_.take(np.argmax(probabilidades_clases, axis=1), axis=0)
+    logging.debug("Predicciones del modelo obtenidas.")
+
+    # Mapear de las predicciones numéricas a etiquetas de texto para la salida final
+    mapa_rendimiento_numerico_a_simbolico = {0: 'bajo', 1: 'medio', 2: 'alto'}
+    predicciones = pd.Series(predicciones_futuras_numericas, index=nuevos_df.index)
+    nuevos_df["desempenio_futuro"] = predicciones.map(mapa_rendimiento_numerico_a_simbolico).fillna(predicciones)
+    if probabilidades:
+        for indice, clase in enumerate(bosque.classes_):
+            etiqueta = mapa_rendimiento_numerico_a_simbolico.get(clase, clase)
+            nuevos_df[f"probabilidad_{etiqueta}"] = probabilidades_clases[:, indice]
+    
+    # Retornar resultados
+    # Las columnas categóricas que vinieron como números se muestran como texto
+    for columna, mapa_numerico_a_simbolico in preprocesamiento.MAPAS_ORDINALES_INVERSOS.items():
+        if columna in nuevos_df.columns and pd.api.types.is_numeric_dtype(nuevos_df[columna]):
+            nuevos_df[columna] = nuevos_df[columna].map(mapa_numerico_a_simbolico).fillna(nuevos_df[columna])
+
+    return nuevos_df
+
+def predecir_por_lotes(archivo_csv, datos_cargados, filas_por_lote=FILAS_POR_LOTE, probabilidades=False, cache=None, clave_modelo=None, medir=None):
+    """
+    Lee el CSV de a 'filas_por_lote' filas y va devolviendo cada lote ya predicho (generador).
+    La memoria usada depende del tamaño del lote, no del tamaño del archivo.
+    """
+    with pd.read_csv(archivo_csv, encoding="utf-8", chunksize=filas_por_lote) as lector:
+        for numero_lote, lote in enumerate(lector, start=1):
+            logging.debug("Lote %s del CSV de predicción: %s filas.", numero_lote, len(lote))
+            yield predecir_dataframe(lote, datos_cargados, probabilidades, cache, clave_modelo, medir)
+
+def predecir_rendimiento_futuro(archivo_csv, datos_cargados=None):
     """
     Realiza la predicción del desempeño futuro usando un modelo Random Forest previamente entrenado.
     El modelo ya fue entrenado con datos que incorporan las reglas del analista y ruido.
+    Si se recibe 'datos_cargados' (modelo ya en memoria) no se vuelve a leer el pickle.
     """
     try:
-        # La ruta del modelo debe ser la misma donde regresion.py lo guarda
-        modelo_guardado_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "azurepy", "modelo_desempenio_futuro.pkl")
-        
-        logging.info(f"Cargando modelo desde: {modelo_guardado_path}")
-        with open(modelo_guardado_path, 'rb') as archivo_cargado:
-            datos_cargados = pickle.load(archivo_cargado)
-
-        modelo_cargado = datos_cargados['modelo']
-        columnas_entrenamiento = datos_cargados['columnas']
-        ohe = datos_cargados['encoder']
-        scaler = datos_cargados['scaler']
-        logging.info("Modelo y preprocesadores cargados exitosamente.")
+        if datos_cargados is None:
+            datos_cargados = cargar_modelo()
 
         nuevos_df = pd.read_csv(archivo_csv, encoding="utf-8")
         logging.info(f"CSV de predicción cargado desde: {archivo_csv}. Filas: {len(nuevos_df)}")
 
-        # --- Preprocesamiento (igual que en el entrenamiento) ---
-        # Mapeo de categorías a numéricos
-        mapa_jerarquia = {'trainee': 0, 'junior': 1, 'senior': 2}
-        mapa_desempenio = {'bajo': 0, 'medio': 1, 'alto': 2}
-        
-        if 'jerarquia' in nuevos_df.columns:
-            nuevos_df['jerarquia'] = nuevos_df['jerarquia'].map(mapa_jerarquia).fillna(nuevos_df['jerarquia'])
-            logging.info("Columna 'jerarquia' mapeada.")
-        
-        if 'desempenio' in nuevos_df.columns:
-            nuevos_df['desempenio'] = nuevos_df['desempenio'].map(mapa_desempenio).fillna(nuevos_df['desempenio'])
-            logging.info("Columna 'desempenio' mapeada.")
-
-        # Aplicar One-Hot Encoding si 'area' está presente y el encoder fue cargado
-        if 'area' in nuevos_df.columns and ohe:
-            area_encoded = ohe.transform(nuevos_df[['area']])
-            area_encoded_df = pd.DataFrame(area_encoded, columns=ohe.get_feature_names_out(['area']), index=nuevos_df.index)
-            df_final = pd.concat([nuevos_df.drop(['area'], axis=1)], axis=1) # No usar area_encoded_df directamente aquí aún
-            # Asegurarse de que las columnas generadas por el OHE se añadan correctamente.
-            # Necesitamos un DataFrame que contenga todas las columnas que el modelo espera.
-            # La forma más segura es crear un nuevo DataFrame con las columnas del entrenamiento y rellenarlo.
-            logging.info("One-Hot Encoding aplicado a 'area'.")
-        else:
-            df_final = nuevos_df.copy() # Si no hay 'area' o encoder, usar el DF original
-            logging.warning("Columna 'area' no encontrada o OneHotEncoder no cargado. Saltando OHE para 'area'.")
-        
-        # Asegurarse de que X_nuevos contenga solo las columnas esperadas por el modelo
-        # Esto es crucial para evitar errores si el CSV de predicción tiene columnas extra o faltantes
-        x_nuevos = pd.DataFrame(columns=columnas_entrenamiento)
-        for col in columnas_entrenamiento:
-            if col in df_final.columns:
-                # Si la columna existe en df_final (original o después de mapeo categórico)
-                x_nuevos[col] = pd.to_numeric(df_final[col], errors='coerce') 
-            elif col in ohe.get_feature_names_out(['area']) if 'area' in nuevos_df.columns and ohe else []:
-                # Si es una columna de one-hot encoding y el 'area' original estaba presente
-                # Necesitamos extraer el valor one-hot del 'area_encoded_df' si existe
-                if 'area' in nuevos_df.columns and ohe:
-                     # Buscar el índice correspondiente en 'nuevos_df'
-                     idx = nuevos_df.index
-                     # Extraer el valor de la columna one-hot del df generado en la OHE
-                     x_nuevos[col] = area_encoded_df[col]
-                else:
-                    x_nuevos[col] = 0 # O un valor predeterminado si no se pudo mapear
-            else:
-                x_nuevos[col] = 0 # O un valor predeterminado si la columna no existe
-
-        # Asegurarse de que el orden de las columnas sea el mismo que en el entrenamiento
-        x_nuevos = x_nuevos[columnas_entrenamiento]
-        
-        # Escalar antes de predecir
-        x_nuevos_scaled = scaler.transform(x_nuevos)
-        logging.info("Datos de predicción escalados.")
-
-        # --- Predicción ---
-        predicciones_futuras_numericas = modelo_cargado.predict(x_nuevos_scaled)
-        logging.info("Predicciones del modelo obtenidas.")
-
-        # Mapear de las predicciones numéricas a etiquetas de texto para la salida final
-        mapa_rendimiento_numerico_a_simbolico = {0: 'bajo', 1: 'medio', 2: 'alto'}
-        nuevos_df["desempenio_futuro"] = [mapa_rendimiento_numerico_a_simbolico.get(p, p) for p in predicciones_futuras_numericas]
-        
-        # Retornar resultados
-        # Asegurarse de que las columnas categóricas originales se muestren como texto si fueron mapeadas
-        mapa_jerarquia_numerico_a_simbolico = {0: 'trainee', 1: 'junior', 2: 'senior'}
-        mapa_desempenio_numerico_a_simbolico = {0: 'bajo', 1: 'medio', 2: 'alto'}
-
-        if 'jerarquia' in nuevos_df.columns and nuevos_df['jerarquia'].dtype != 'object':
-            nuevos_df['jerarquia'] = nuevos_df['jerarquia'].map(mapa_jerarquia_numerico_a_simbolico).fillna(nuevos_df['jerarquia'])
-        if 'desempenio' in nuevos_df.columns and nuevos_df['desempenio'].dtype != 'object':
-            nuevos_df['desempenio'] = nuevos_df['desempenio'].map(mapa_desempenio_numerico_a_simbolico).fillna(nuevos_df['desempenio'])
+        nuevos_df = predecir_dataframe(nuevos_df, datos_cargados)
 
         resultados = nuevos_df.to_dict(orient="records")
         logging.info("Resultados de predicción preparados para retorno.")
@@ -116,12 +114,27 @@ def predecir_rendimiento_futuro(archivo_csv):
         return json.dumps({"error": f"Ocurrió un error inesperado: {e}"})
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
+    registro_logs.configurar()
+    # Con '--ndjson' se predice por lotes y se imprime una fila JSON por línea a medida que avanza
+    ndjson = "--ndjson" in sys.argv[1:]
+    argumentos = [a for a in sys.argv[1:] if a != "--ndjson"]
+    if len(argumentos) != 1:
         logging.error("Error: Se debe proporcionar la ruta al archivo CSV como argumento.")
-        print(json.dumps({"error": "Uso: python predecir_rendimiento_futuro.py <archivo_csv_prediccion>"}))
+        print(json.dumps({"error": "Uso: python predecir_rendimiento_futuro.py <archivo_csv_prediccion> [--ndjson]"}))
         sys.exit(1)
 
-    archivo_csv = sys.argv[1]
+    archivo_csv = argumentos[0]
     logging.info(f"Iniciando predicción para CSV: {archivo_csv}")
-    resultado = predecir_rendimiento_futuro(archivo_csv)
-    print(resultado)
+    if ndjson:
+        try:
+            for lote in predecir_por_lotes(archivo_csv, cargar_modelo()):
+                lineas = lote.to_json(orient="records", lines=True, force_ascii=False)
+                sys.stdout.write(lineas if lineas.endswith("\n") else lineas + "\n")
+                sys.stdout.flush()
+        except Exception as e:
+            logging.error(f"❌ Error al predecir por lotes: {e}", exc_info=True)
+            print(json.dumps({"error": f"Ocurrió un error inesperado: {e}"}))
+            sys.exit(1)
+    else:
+        resultado = predecir_rendimiento_futuro(archivo_csv)
+        print(resultado)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# Mapeos de categorías a numéricos, los mismos que se usan en el entrenamiento
+MAPAS_ORDINALES = {
+    'jerarquia': {'trainee': 0, 'junior': 1, 'senior': 2},
+    'desempenio': {'bajo': 0, 'medio': 1, 'alto': 2},
+}
+MAPAS_ORDINALES_INVERSOS = {
+    columna: {codigo: etiqueta for etiqueta, codigo in mapa.items()} for columna, mapa in MAPAS_ORDINALES.items()
+}
+
+
+class PipelinePreprocesamiento:
+    """
+    Preprocesamiento compilado: mapeo de categorías, one-hot de 'area', orden de columnas y
+    escalado, ajustados en el entrenamiento y guardados junto al modelo.
+    transformar() convierte un DataFrame crudo en la matriz que espera el modelo sin armar
+    DataFrames intermedios columna por columna.
+    """
+
+    def __init__(self, columnas, encoder, scaler):
+        self.columnas = list(columnas)
+        posicion = {columna: i for i, columna in enumerate(self.columnas)}
+
+        # Columnas del one-hot de 'area' y su posición en la matriz final
+        nombres_area = list(encoder.get_feature_names_out(['area'])) if hasattr(encoder, 'categories_') else []
+        self.categorias_area = None
+        self.indices_area = None
+        if nombres_area and all(nombre in posicion for nombre in nombres_area):
+            self.categorias_area = pd.Index(encoder.categories_[0])
+            self.indices_area = np.array([posicion[nombre] for nombre in nombres_area], dtype=np.intp)
+
+        # Resto de columnas: se toman del DataFrame y se convierten a número
+        self.numericas = [(i, columna) for i, columna in enumerate(self.columnas) if columna not in nombres_area]
+
+        n_columnas = len(self.columnas)
+        self.media = np.asarray(scaler.mean_, dtype=np.float64) if getattr(scaler, 'with_mean', True) else np.zeros(n_columnas)
+        self.escala = np.asarray(scaler.scale_, dtype=np.float64) if getattr(scaler, 'with_std', True) else np.ones(n_columnas)
+
+    @staticmethod
+    def _a_numerico(serie, columna):
+        # Igual que el mapeo con .map(...).fillna(original) seguido de pd.to_numeric(errors='coerce'),
+        # pero el parseo de texto solo se paga en los valores que no son categorías conocidas
+        if pd.api.types.is_numeric_dtype(serie):
+            return serie.to_numpy(dtype=np.float64, na_value=np.nan)
+        valores = np.full(len(serie), np.nan)
+        pendientes = np.ones(len(serie), dtype=bool)
+        mapa = MAPAS_ORDINALES.get(columna)
+        if mapa is not None:
+            codigos = pd.Index(list(mapa)).get_indexer(serie.astype(object))
+            pendientes = codigos < 0
+            valores[~pendientes] = np.fromiter(mapa.values(), dtype=np.float64)[codigos[~pendientes]]
+        if pendientes.any():
+            valores[pendientes] = pd.to_numeric(serie[pendientes], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        return valores
+
+    def transformar(self, df):
+        """
+        Devuelve la matriz escalada (n_filas x n_columnas) lista para el modelo.
+        Las columnas faltantes quedan en 0 y las categorías de 'area' desconocidas, sin marcar.
+        """
+        x = np.zeros((len(df), len(self.columnas)), dtype=np.float64)
+        for indice, columna in self.numericas:
+            if columna in df.columns:
+                x[:, indice] = self._a_numerico(df[columna], columna)
+
+        if self.indices_area is not None and 'area' in df.columns:
+            codigos = self.categorias_area.get_indexer(df['area'].astype(object))
+            filas = np.flatnonzero(codigos >= 0)
+            x[filas, self.indices_area[codigos[filas]]] = 1.0
+
+        x -= self.media
+        x /= self.escala
+        return x
+
+
+def obtener_pipeline(datos_modelo):
+    """
+    Pipeline del modelo cargado. Los modelos entrenados antes de que existiera se compilan
+    una vez a partir del encoder y el scaler guardados, y se deja el resultado en 'datos_modelo'.
+    """
+    pipeline = datos_modelo.get('preprocesamiento')
+    if pipeline is None:
+        pipeline = PipelinePreprocesamiento(datos_modelo['columnas'], datos_modelo['encoder'], datos_modelo['scaler'])
+        datos_modelo['preprocesamiento'] = pipeline
+    return pipeline
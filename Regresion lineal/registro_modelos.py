@@ -0,0 +1,224 @@
+import os
+import json
+import shutil
+import pickle
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+import bosque_compacto
+
+# Registro de modelos: un artefacto por corrida de entrenamiento de cada regla (reglas_aplicadas.id_regla).
+# Estructura en disco:
+#   azurepy/modelos/regla_<id>/<version>.pkl     -> modelo, columnas, encoder y scaler
+#   azurepy/modelos/regla_<id>/<version>.bosque/ -> el mismo bosque en formato compacto (ver bosque_compacto)
+#                                                   más el preprocesamiento; es lo que se usa para predecir
+#   azurepy/modelos/regla_<id>/<version>.json    -> metadata (accuracy, columnas, fecha, ...)
+#   azurepy/modelos/regla_<id>/actual.json       -> puntero a la versión vigente
+ruta_registro = os.path.join(os.path.dirname(os.path.dirname(__file__)), "azurepy", "modelos")
+
+ARCHIVO_PUNTERO = "actual.json"
+ARCHIVO_PREPROCESAMIENTO = "preprocesamiento.pkl"
+
+# Formato del bosque para servir predicciones: "completo", "cuantizado" o "ninguno" (solo el pickle)
+FORMATO_BOSQUE = os.environ.get("MODELO_FORMATO_BOSQUE", "completo")
+
+# Versiones que se conservan por regla (además de la vigente, que nunca se borra)
+VERSIONES_A_CONSERVAR = max(1, int(os.environ.get("MODELOS_VERSIONES_A_CONSERVAR", 5)))
+
+
+def _carpeta_regla(id_regla, ruta_base=ruta_registro):
+    return os.path.join(ruta_base, f"regla_{int(id_regla)}")
+
+
+def _escribir_atomico(ruta_destino, contenido, modo="wb"):
+    """
+    Escribe en un archivo temporal de la misma carpeta y lo renombra con os.replace,
+    así un lector concurrente ve el archivo viejo o el nuevo, nunca uno a medio escribir.
+    """
+    carpeta = os.path.dirname(ruta_destino)
+    fd, ruta_tmp = tempfile.mkstemp(dir=carpeta, suffix=".tmp")
+    try:
+        with os.fdopen(fd, modo, **({} if "b" in modo else {"encoding": "utf-8"})) as archivo:
+            archivo.write(contenido)
+        os.replace(ruta_tmp, ruta_destino)
+    except Exception:
+        if os.path.exists(ruta_tmp):
+            os.unlink(ruta_tmp)
+        raise
+
+
+def _exportar_bosque(carpeta, version, datos_modelo, formato, x_verificacion):
+    """
+    Escribe <version>.bosque/ con el bosque compacto y el resto del artefacto (sin el modelo).
+    Devuelve la metadata del bosque o None si no se exportó.
+    """
+    modelo = datos_modelo.get('modelo')
+    if formato == "ninguno" or not hasattr(modelo, "estimators_"):
+        return None
+    carpeta_bosque = os.path.join(carpeta, f"{version}.bosque")
+    try:
+        meta = bosque_compacto.exportar_bosque(modelo, carpeta_bosque, formato == "cuantizado", x_verificacion)
+        sin_modelo = {k: v for k, v in datos_modelo.items() if k != 'modelo'}
+        _escribir_atomico(os.path.join(carpeta_bosque, ARCHIVO_PREPROCESAMIENTO), pickle.dumps(sin_modelo))
+        return {k: meta[k] for k in ("cuantizado", "bytes", "n_arboles") if k in meta}
+    except Exception as e:
+        # El pickle completo sigue sirviendo: sin bosque compacto solo se pierde velocidad de carga
+        logging.warning(f"No se pudo exportar el bosque compacto de la versión {version}: {e}")
+        return None
+
+
+def guardar_version(id_regla, datos_modelo, metadata, ruta_base=ruta_registro, x_verificacion=None, formato_bosque=FORMATO_BOSQUE):
+    """
+    Guarda una nueva versión del modelo para la regla y la publica como vigente.
+    Además del pickle se exporta el bosque compacto ('formato_bosque'); con 'x_verificacion'
+    se comprueba que prediga lo mismo que el modelo antes de publicarlo.
+    Devuelve el identificador de versión generado.
+    """
+    carpeta = _carpeta_regla(id_regla, ruta_base)
+    os.makedirs(carpeta, exist_ok=True)
+
+    version = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    metadata = dict(metadata, id_regla=int(id_regla), version=version, fecha=datetime.now().isoformat())
+
+    _escribir_atomico(os.path.join(carpeta, f"{version}.pkl"), pickle.dumps(datos_modelo))
+    metadata["bosque"] = _exportar_bosque(carpeta, version, datos_modelo, formato_bosque, x_verificacion)
+    _escribir_atomico(os.path.join(carpeta, f"{version}.json"), json.dumps(metadata, ensure_ascii=False), modo="w")
+    # El puntero se actualiza al final: hasta este momento se sigue sirviendo la versión anterior
+    _escribir_atomico(os.path.join(carpeta, ARCHIVO_PUNTERO), json.dumps({"version": version}), modo="w")
+    logging.info(f"Modelo de la regla {id_regla} registrado como versión {version} en: {carpeta}")
+    try:
+        purgar_versiones(id_regla, ruta_base=ruta_base)
+    except Exception as e:
+        # La versión nueva ya está publicada: si no se pudo limpiar, se reintenta en el próximo entrenamiento
+        logging.warning(f"No se pudieron purgar versiones viejas de la regla {id_regla}: {e}")
+    return version
+
+
+def purgar_versiones(id_regla, conservar=VERSIONES_A_CONSERVAR, ruta_base=ruta_registro):
+    """
+    Borra las versiones de la regla más viejas que las 'conservar' más nuevas, salvo la vigente.
+    Un worker que todavía tenga mapeado el bosque de una versión borrada la sigue usando hasta
+    recargar (en Linux el archivo abierto no desaparece). Devuelve las versiones borradas.
+    """
+    carpeta = _carpeta_regla(id_regla, ruta_base)
+    vigente = version_actual(id_regla, ruta_base)
+    versiones = sorted(
+        (nombre[:-len(".json")] for nombre in os.listdir(carpeta)
+         if nombre.endswith(".json") and nombre != ARCHIVO_PUNTERO),
+        reverse=True
+    )
+    borradas = [version for version in versiones[conservar:] if version != vigente]
+    for version in borradas:
+        shutil.rmtree(os.path.join(carpeta, f"{version}.bosque"), ignore_errors=True)
+        for extension in (".pkl", ".json"):
+            # La metadata va última: mientras exista, la versión sigue figurando en listar_versiones
+            try:
+                os.unlink(os.path.join(carpeta, f"{version}{extension}"))
+            except FileNotFoundError:
+                pass
+    if borradas:
+        logging.info(f"Versiones viejas de la regla {id_regla} eliminadas: {borradas}")
+    return borradas
+
+
+def version_actual(id_regla, ruta_base=ruta_registro):
+    """
+    Devuelve la versión vigente de la regla o None si nunca se entrenó un modelo para ella.
+    """
+    ruta_puntero = os.path.join(_carpeta_regla(id_regla, ruta_base), ARCHIVO_PUNTERO)
+    try:
+        with open(ruta_puntero, "r", encoding="utf-8") as archivo:
+            return json.load(archivo)["version"]
+    except FileNotFoundError:
+        return None
+
+
+def listar_versiones(id_regla, ruta_base=ruta_registro):
+    """
+    Lista la metadata de todas las versiones registradas para la regla, de la más nueva a la más vieja.
+    """
+    carpeta = _carpeta_regla(id_regla, ruta_base)
+    if not os.path.isdir(carpeta):
+        return []
+    versiones = []
+    for nombre in sorted(os.listdir(carpeta), reverse=True):
+        if nombre.endswith(".json") and nombre != ARCHIVO_PUNTERO:
+            with open(os.path.join(carpeta, nombre), "r", encoding="utf-8") as archivo:
+                versiones.append(json.load(archivo))
+    return versiones
+
+
+def cargar_version(id_regla, version, ruta_base=ruta_registro, compacto=True):
+    """
+    Carga de disco el artefacto (modelo, columnas, encoder y scaler) de una versión concreta.
+    Con 'compacto' (para predecir) el modelo es el bosque mapeado en memoria si la versión lo
+    tiene; sin él (p. ej. para seguir entrenando) siempre es el RandomForestClassifier del pickle.
+    """
+    carpeta_bosque = os.path.join(_carpeta_regla(id_regla, ruta_base), f"{version}.bosque")
+    ruta_preprocesamiento = os.path.join(carpeta_bosque, ARCHIVO_PREPROCESAMIENTO)
+    if compacto and os.path.exists(ruta_preprocesamiento):
+        logging.info(f"Cargando bosque compacto de la regla {id_regla} (versión {version}) desde: {carpeta_bosque}")
+        with open(ruta_preprocesamiento, "rb") as archivo:
+            datos_modelo = pickle.load(archivo)
+        datos_modelo['modelo'] = bosque_compacto.cargar_bosque(carpeta_bosque)
+        return datos_modelo
+
+    ruta_modelo = os.path.join(_carpeta_regla(id_regla, ruta_base), f"{version}.pkl")
+    logging.info(f"Cargando modelo de la regla {id_regla} (versión {version}) desde: {ruta_modelo}")
+    with open(ruta_modelo, "rb") as archivo:
+        return pickle.load(archivo)
+
+
+class RegistroModelos:
+    """
+    Cache LRU en memoria de los modelos registrados, indexada por id de regla.
+    Cada consulta verifica el puntero de la regla (solo un stat si no cambió) y, si un
+    entrenamiento publicó una versión nueva, la carga y reemplaza la entrada de una sola vez.
+    """
+
+    def __init__(self, capacidad=8, ruta_base=ruta_registro):
+        self.capacidad = capacidad
+        self.ruta_base = ruta_base
+        # id_regla -> (firma del puntero, version, datos del modelo)
+        self._modelos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _firma_puntero(self, id_regla):
+        try:
+            stat = os.stat(os.path.join(_carpeta_regla(id_regla, self.ruta_base), ARCHIVO_PUNTERO))
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def obtener(self, id_regla):
+        """
+        Devuelve (version, datos del modelo) vigentes para la regla, o (None, None) si no hay modelo registrado.
+        """
+        id_regla = int(id_regla)
+        firma = self._firma_puntero(id_regla)
+        if firma is None:
+            return None, None
+
+        with self._lock:
+            entrada = self._modelos.get(id_regla)
+            if entrada is not None and entrada[0] == firma:
+                self._modelos.move_to_end(id_regla)
+                return entrada[1], entrada[2]
+
+        # La carga se hace fuera del lock para no bloquear predicciones de otras reglas
+        version = version_actual(id_regla, self.ruta_base)
+        datos_modelo = cargar_version(id_regla, version, self.ruta_base)
+
+        with self._lock:
+            self._modelos[id_regla] = (firma, version, datos_modelo)
+            self._modelos.move_to_end(id_regla)
+            while len(self._modelos) > self.capacidad:
+                id_descartado, _ = self._modelos.popitem(last=False)
+                logging.info(f"Modelo de la regla {id_descartado} descartado de la cache LRU.")
+        return version, datos_modelo
+
+    def descartar(self, id_regla):
+        with self._lock:
+            self._modelos.pop(int(id_regla), None)
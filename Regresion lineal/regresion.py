@@ -8,74 +8,164 @@ import json
 import os
 import logging
 import sys
+import argparse
+import registro_modelos
+import preprocesamiento
 
-# Configuración de Logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# dataset_io y registro_logs están en la raíz del proyecto
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dataset_io
+import registro_logs
 
 # Rutas relativas
 # Asegurarse de que el modelo se guarde en 'azurepy/' un nivel arriba
 ruta_modelo = os.path.join(os.path.dirname(os.path.dirname(__file__)), "azurepy", "modelo_desempenio_futuro.pkl")
-# Carga el CSV generado por 'generar_synthetic_training_data.py'
-ruta_csv_training = os.path.join(os.path.dirname(__file__), "synthetic_training_data.csv")
+# Carga el dataset (Parquet) generado por 'generar_synthetic_training_data.py'
+ruta_csv_training = os.path.join(os.path.dirname(__file__), "synthetic_training_data.parquet")
 
-def entrenar_modelo():
+# Parámetros del Random Forest que se pueden cambiar por entrenamiento
+PARAMETROS_POR_DEFECTO = {
+    "n_jobs": int(os.environ.get("ENTRENAMIENTO_N_JOBS", -1)), # -1 = todos los núcleos
+    "n_estimators": 100,
+    "max_depth": None,
+    "max_samples": None,
+}
+
+def _preparar_datos_completos(df):
+    """
+    Preprocesamiento de un entrenamiento desde cero: ajusta el one-hot de 'area' y el escalado.
+    Devuelve (X_train_scaled, X_test_scaled, y_train, y_test, datos_preprocesamiento).
+    """
+    # One-hot encoding para la columna 'area'
+    ohe = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
+    
+    # Verificar si 'area' existe y si ohe debe aplicarse
+    if 'area' in df.columns:
+        area_encoded = ohe.fit_transform(df[['area']])
+        area_encoded_df = pd.DataFrame(area_encoded, columns=ohe.get_feature_names_out(['area']), index=df.index)
+        df_final = pd.concat([df.drop(['area'], axis=1), area_encoded_df], axis=1)
+        logging.info("One-Hot Encoding aplicado a 'area'.")
+    else:
+        df_final = df.copy() # Si no hay 'area', usar el DataFrame tal cual
+        logging.warning("Columna 'area' no encontrada en el CSV de entrenamiento. Saltando OHE para 'area'.")
+
+
+    # Separar features y target
+    # Asegurarse de que las columnas a dropear existan
+    cols_to_drop = ['nombre', 'desempenio_futuro']
+    existing_cols_to_drop = [col for col in cols_to_drop if col in df_final.columns]
+    X = df_final.drop(columns=existing_cols_to_drop, errors='ignore')
+    
+    if 'desempenio_futuro' not in df_final.columns:
+        raise KeyError("La columna 'desempenio_futuro' es necesaria para el entrenamiento y no se encontró.")
+    y = df_final['desempenio_futuro']
+
+    # Split
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+    logging.info(f"Datos divididos en entrenamiento ({len(X_train)} filas) y prueba ({len(X_test)} filas).")
+
+    # Escalado
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    logging.info("Datos escalados.")
+
+    datos_preprocesamiento = {
+        'columnas': list(X.columns), # Guardar las columnas utilizadas para el entrenamiento
+        'encoder': ohe,
+        'scaler': scaler,
+        # Mapeos, one-hot, orden de columnas y escalado compilados para la predicción
+        'preprocesamiento': preprocesamiento.PipelinePreprocesamiento(X.columns, ohe if 'area' in df.columns else None, scaler)
+    }
+    return X_train_scaled, X_test_scaled, y_train, y_test, datos_preprocesamiento
+
+def _modelo_base_incremental(id_regla, df):
+    """
+    Devuelve (versión, datos) del modelo vigente de la regla si se le pueden agregar árboles
+    entrenados con 'df'; si no (no hay modelo, aparecen áreas nuevas o cambian las clases)
+    devuelve (None, None) y el entrenamiento se hace desde cero.
+    """
+    if id_regla is None:
+        logging.warning("El modo incremental requiere un id_regla. Se entrena desde cero.")
+        return None, None
+    version_base = registro_modelos.version_actual(id_regla)
+    if version_base is None:
+        logging.info(f"La regla {id_regla} no tiene un modelo registrado. Se entrena desde cero.")
+        return None, None
+    datos_base = registro_modelos.cargar_version(id_regla, version_base, compacto=False)
+
+    ohe = datos_base['encoder']
+    if 'area' in df.columns and hasattr(ohe, 'categories_'):
+        areas_nuevas = set(df['area'].dropna().unique()) - set(ohe.categories_[0])
+        if areas_nuevas:
+            logging.info(f"Áreas nuevas respecto del modelo {version_base}: {sorted(areas_nuevas)}. Se entrena desde cero.")
+            return None, None
+    # Los árboles nuevos y los existentes tienen que votar sobre las mismas clases
+    clases = set(df['desempenio_futuro'].unique())
+    if clases != set(datos_base['modelo'].classes_):
+        logging.info(f"Las clases {sorted(clases)} no coinciden con las del modelo {version_base}. Se entrena desde cero.")
+        return None, None
+    return version_base, datos_base
+
+def entrenar_modelo(id_regla=None, ruta_datos=ruta_csv_training, parametros=None, incremental=False):
     """
     Entrena un modelo Random Forest usando datos de entrenamiento sintéticos.
+    'ruta_datos' es el dataset a usar (la app pasa el del espacio de trabajo de la ejecución).
+    'parametros' sobrescribe PARAMETROS_POR_DEFECTO (n_jobs, n_estimators, max_depth, max_samples).
+    Con 'incremental', en lugar de entrenar desde cero se agregan 'n_estimators' árboles
+    (warm_start) al modelo vigente de la regla, reutilizando su preprocesamiento.
+    Si se indica 'id_regla', el modelo se guarda como una nueva versión en el registro
+    de esa regla; si no, se guarda en la ruta fija de siempre.
     """
     try:
-        logging.info(f"Cargando datos de entrenamiento desde: {ruta_csv_training}")
-        df = pd.read_csv(ruta_csv_training, encoding="utf-8")
+        parametros = dict(PARAMETROS_POR_DEFECTO, **(parametros or {}))
+        logging.info(f"Cargando datos de entrenamiento desde: {ruta_datos}")
+        df = dataset_io.leer_dataset(ruta_datos)
         logging.info(f"Datos cargados. Filas: {len(df)}")
 
-        # Mapeo de categorías a numéricos si aún no lo están (deberían estarlo por el generador)
-        mapa_jerarquia = {'trainee': 0, 'junior': 1, 'senior': 2}
-        mapa_desempenio = {'bajo': 0, 'medio': 1, 'alto': 2}
-        
-        # Solo mapear si la columna existe y no está ya en formato numérico
-        if 'jerarquia' in df.columns and df['jerarquia'].dtype == 'object':
-            df['jerarquia'] = df['jerarquia'].map(mapa_jerarquia)
-        if 'desempenio' in df.columns and df['desempenio'].dtype == 'object':
-            df['desempenio'] = df['desempenio'].map(mapa_desempenio)
-
-        # One-hot encoding para la columna 'area'
-        ohe = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        
-        # Verificar si 'area' existe y si ohe debe aplicarse
-        if 'area' in df.columns:
-            area_encoded = ohe.fit_transform(df[['area']])
-            area_encoded_df = pd.DataFrame(area_encoded, columns=ohe.get_feature_names_out(['area']), index=df.index)
-            df_final = pd.concat([df.drop(['area'], axis=1), area_encoded_df], axis=1)
-            logging.info("One-Hot Encoding aplicado a 'area'.")
+        # Mapeo de categorías a numéricos si aún no lo están (trainee/junior/senior y bajo/medio/alto -> 0/1/2).
+        # Solo se mapea si la columna existe y no está ya en formato numérico
+        df = dataset_io.codificar_ordinales(df)
+
+        version_base, datos_base = None, None
+        if incremental:
+            if 'desempenio_futuro' not in df.columns:
+                raise KeyError("La columna 'desempenio_futuro' es necesaria para el entrenamiento y no se encontró.")
+            version_base, datos_base = _modelo_base_incremental(id_regla, df)
+
+        if datos_base is not None:
+            # Los árboles nuevos se entrenan en el mismo espacio de features que los existentes:
+            # se usa el preprocesamiento del modelo base, sin reajustar encoder ni scaler
+            datos_preprocesamiento = {k: datos_base[k] for k in ('columnas', 'encoder', 'scaler')}
+            datos_preprocesamiento['preprocesamiento'] = preprocesamiento.obtener_pipeline(datos_base)
+            X = datos_preprocesamiento['preprocesamiento'].transformar(df)
+            X_train_scaled, X_test_scaled, y_train, y_test = train_test_split(
+                X, df['desempenio_futuro'], test_size=0.3, random_state=42
+            )
+            model = datos_base['modelo']
+            arboles_previos = len(model.estimators_)
+            model.set_params(
+                warm_start=True,
+                n_estimators=arboles_previos + parametros['n_estimators'],
+                n_jobs=parametros['n_jobs'],
+                max_depth=parametros['max_depth'],
+                max_samples=parametros['max_samples']
+            )
+            logging.info(f"Agregando {parametros['n_estimators']} árboles al modelo {version_base} ({arboles_previos} árboles)...")
         else:
-            df_final = df.copy() # Si no hay 'area', usar el DataFrame tal cual
-            logging.warning("Columna 'area' no encontrada en el CSV de entrenamiento. Saltando OHE para 'area'.")
-
-
-        # Separar features y target
-        # Asegurarse de que las columnas a dropear existan
-        cols_to_drop = ['nombre', 'desempenio_futuro']
-        existing_cols_to_drop = [col for col in cols_to_drop if col in df_final.columns]
-        X = df_final.drop(columns=existing_cols_to_drop, errors='ignore')
-        
-        if 'desempenio_futuro' not in df_final.columns:
-            raise KeyError("La columna 'desempenio_futuro' es necesaria para el entrenamiento y no se encontró.")
-        y = df_final['desempenio_futuro']
-
-        # Split
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
-        logging.info(f"Datos divididos en entrenamiento ({len(X_train)} filas) y prueba ({len(X_test)} filas).")
-
-        # Escalado
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
-        logging.info("Datos escalados.")
+            X_train_scaled, X_test_scaled, y_train, y_test, datos_preprocesamiento = _preparar_datos_completos(df)
+            model = RandomForestClassifier(
+                n_estimators=parametros['n_estimators'],
+                max_depth=parametros['max_depth'],
+                max_samples=parametros['max_samples'],
+                n_jobs=parametros['n_jobs'],
+                random_state=42
+            )
+            logging.info(f"Entrenando modelo RandomForestClassifier con {parametros}...")
 
         # Entrenar Random Forest
-        model = RandomForestClassifier(n_estimators=100, random_state=42)
-        logging.info("Entrenando modelo RandomForestClassifier...")
         model.fit(X_train_scaled, y_train)
-        logging.info("Modelo entrenado.")
+        logging.info(f"Modelo entrenado ({len(model.estimators_)} árboles).")
 
         # Evaluar
         y_pred = model.predict(X_test_scaled)
@@ -83,24 +173,42 @@ def entrenar_modelo():
         reporte = classification_report(y_test, y_pred, output_dict=True)
         logging.info(f"Precisión del modelo: {acc * 100:.2f}%")
 
+        # El modelo guardado predice con un solo hilo: en la API ya hay varios requests en paralelo
+        model.set_params(n_jobs=None, warm_start=False)
+        datos_modelo = dict(datos_preprocesamiento, modelo=model)
+        precision_por_clase = {
+            str(k): f"{v['precision'] * 100:.2f}%" for k, v in reporte.items() if k in ['0', '1', '2']
+        }
+
         # Guardar modelo
-        # Asegúrate de que la carpeta 'azurepy' exista antes de guardar
-        os.makedirs(os.path.dirname(ruta_modelo), exist_ok=True)
-        with open(ruta_modelo, 'wb') as archivo:
-            pickle.dump({
-                'modelo': model,
-                'columnas': list(X.columns), # Guardar las columnas utilizadas para el entrenamiento
-                'encoder': ohe,
-                'scaler': scaler
-            }, archivo)
-        logging.info(f"Modelo y preprocesadores guardados en: {ruta_modelo}")
+        version = None
+        if id_regla is not None:
+            version = registro_modelos.guardar_version(id_regla, datos_modelo, {
+                "accuracy": acc,
+                "precision_por_clase": precision_por_clase,
+                "columnas": datos_modelo['columnas'],
+                "filas_entrenamiento": len(X_train_scaled),
+                "parametros": parametros,
+                "arboles": len(model.estimators_),
+                "version_base": version_base
+            }, x_verificacion=X_test_scaled)
+        else:
+            # Asegúrate de que la carpeta 'azurepy' exista antes de guardar
+            os.makedirs(os.path.dirname(ruta_modelo), exist_ok=True)
+            # Escritura atómica: el runtime puede estar recargando este archivo en paralelo
+            registro_modelos._escribir_atomico(ruta_modelo, pickle.dumps(datos_modelo))
+            logging.info(f"Modelo y preprocesadores guardados en: {ruta_modelo}")
 
         # Salida
         resultados = {
             "accuracy": f"{acc * 100:.2f}%",
-            "precision_por_clase": {
-                str(k): f"{v['precision'] * 100:.2f}%" for k, v in reporte.items() if k in ['0', '1', '2']
-            },
+            "precision_por_clase": precision_por_clase,
+            "id_regla": id_regla,
+            "version": version,
+            "incremental": datos_base is not None,
+            "version_base": version_base,
+            "arboles": len(model.estimators_),
+            "parametros": parametros,
             "status": "Modelo entrenado y guardado"
         }
         return json.dumps(resultados, ensure_ascii=False)
@@ -115,7 +223,29 @@ def entrenar_modelo():
         logging.error(f"❌ Ocurrió un error inesperado durante el entrenamiento del modelo: {e}", exc_info=True)
         return json.dumps({"error": f"Ocurrió un error inesperado: {e}"})
 
+def _entero_o_fraccion(valor):
+    # max_samples acepta una cantidad de filas (entero) o una fracción del total; la API
+    # manda las fracciones con repr(), que puede usar exponente ("1e-05")
+    return int(valor) if valor.isdigit() else float(valor)
+
 if __name__ == '__main__':
+    registro_logs.configurar()
     logging.info("Ejecutando entrenamiento del modelo desde main de regresion.py")
-    resultado = entrenar_modelo()
+    parser = argparse.ArgumentParser(description="Entrena el modelo de desempeño futuro.")
+    parser.add_argument("id_regla", nargs="?", type=int, default=None)
+    parser.add_argument("--datos", default=ruta_csv_training, help="Dataset de entrenamiento (Parquet o CSV)")
+    parser.add_argument("--n_jobs", type=int, default=PARAMETROS_POR_DEFECTO["n_jobs"])
+    parser.add_argument("--n_estimators", type=int, default=PARAMETROS_POR_DEFECTO["n_estimators"])
+    parser.add_argument("--max_depth", type=int, default=None)
+    parser.add_argument("--max_samples", type=_entero_o_fraccion, default=None)
+    parser.add_argument("--incremental", action="store_true", help="Agrega árboles al modelo vigente de la regla")
+    args = parser.parse_args()
+
+    parametros = {
+        "n_jobs": args.n_jobs,
+        "n_estimators": args.n_estimators,
+        "max_depth": args.max_depth,
+        "max_samples": args.max_samples,
+    }
+    resultado = entrenar_modelo(args.id_regla, args.datos, parametros, args.incremental)
     print(resultado)
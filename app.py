@@ -1,5 +1,5 @@
 import tempfile
-from flask import Flask, request, jsonify, send_file, render_template_string
+from flask import Flask, request, jsonify, send_file, render_template_string, Response, stream_with_context, g
 from flask_cors import CORS
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
@@ -7,15 +7,27 @@ import subprocess
 import os
 import json
 import sys # Importar sys para sys.executable en run_script
-from config_postgres import get_connection # Asumo que esta función existe y es funcional
-from psycopg2.extras import execute_values
+from pool_postgres import get_connection, pool as pool_postgres # Conexiones reutilizadas desde un pool (config_postgres las crea)
+import carga_resultados # COPY masivo de predicciones en random_forest_resultados
 import pandas as pd # Se mantiene por si hay otras funciones que lo usen
 from datetime import datetime
+from decimal import Decimal
 import logging
 from collections import Counter # Se mantiene por si hay otras funciones que lo usen
 import random # Se mantiene por si hay otras funciones que lo usen
 import jwt # Se encuentra en las importaciones originales del usuario
 import time # Se encuentra en las importaciones originales del usuario
+from runtime_modelo import runtime_modelo, ModeloNoEntrenado # Modelo de desempeño futuro cargado en memoria
+from cola_trabajos import ColaTrabajos, ColaLlena, TrabajoCancelado
+import dataset_io # Lectura/escritura de datasets en formato columnar
+import espacios_trabajo # Carpeta aislada por ejecución para los datasets sintéticos
+from cache_rotacion import cache_rotacion # Resultados de K-Means cacheados por huella del dataset
+import rotacion_incremental # K-Means de rotación con agregados por empleado y actualización por ciclo
+import cache_predicciones # Predicciones ya calculadas, por versión de modelo y hash de la fila
+import prediccion_multiregla # Predicción de un CSV con varias reglas en un pool de procesos
+import resumen_resultados # Agregaciones de random_forest_resultados para los gráficos
+import metricas # Histogramas por etapa y contadores para /metrics
+import registro_logs # Logging estructurado, asíncrono y con resumen muestreado por request
 
 # Configura Flask y CORS
 app = Flask(__name__)
@@ -37,6 +49,27 @@ ENABLE_AUTH = False # Cambiado a False para simplificar las pruebas iniciales
 CSV_ENTRADA_PATH = os.path.join(os.path.dirname(__file__), "prediccion_rendimiento_training.csv")
 CSV_SALIDA_PATH = os.path.join(os.path.dirname(__file__), "prediccion_rendimiento_training_completo.csv")
 
+# Cálculo de rotación por defecto: "incremental" (agregados + MiniBatchKMeans) o "completo"
+# (KMeans sobre todo el dataset, cacheado por contenido)
+ROTACION_MODO = os.environ.get("ROTACION_MODO", "incremental")
+
+# Parámetros de K-Means que aceptan los endpoints de rotación. Cada combinación distinta guarda
+# su propia cache en disco y su motor incremental (en memoria y en disco), así que se acotan.
+ROTACION_MIN_CLUSTERS = 2
+ROTACION_MAX_CLUSTERS = int(os.environ.get("ROTACION_MAX_CLUSTERS", 10))
+ROTACION_RANDOM_STATES = [int(v) for v in os.environ.get("ROTACION_RANDOM_STATES", "12").split(",")]
+
+
+# Cola de entrenamientos en segundo plano. Pocos workers a propósito: cada entrenamiento
+# usa CPU que de otro modo se le quita a las predicciones.
+cola_entrenamiento = ColaTrabajos(
+    max_workers=int(os.environ.get("ENTRENAMIENTO_WORKERS", 1)),
+    max_pendientes=int(os.environ.get("ENTRENAMIENTO_MAX_PENDIENTES", 20))
+)
+
+
+# Configuración de Logging (perfil por LOG_PERFIL: "desarrollo" o "produccion", ver registro_logs)
+registro_logs.configurar()
 
 # Inicializa Firebase
 try:
@@ -48,8 +81,49 @@ except Exception as e:
     logging.error(f"Error al inicializar Firebase: {e}")
     # Considera una forma de manejar esto si Firebase es crítico para la app.
 
-# Configuración de Logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# =========================================================================
+# === MÉTRICAS ===
+# =========================================================================
+
+# Componentes que ya llevan sus propios contadores: se leen cada vez que se consulta /metrics
+metricas.registrar_fuente("pool_postgres", pool_postgres.metricas,
+                          contadores=("creadas", "reutilizadas", "descartadas", "esperas", "agotado", "segundos_espera_total"))
+metricas.registrar_fuente("cache_predicciones", cache_predicciones.cache_predicciones.metricas,
+                          contadores=("memoria", "postgres", "calculadas"))
+metricas.registrar_fuente("cola_entrenamiento", cola_entrenamiento.metricas,
+                          contadores=("encolados", "rechazados", "completado", "error", "cancelado"))
+metricas.registrar_fuente("resumen_resultados", resumen_resultados.refresco_resumen.metricas,
+                          contadores=("refrescos", "errores"))
+metricas.registrar_fuente("logs", registro_logs.metricas, contadores=("descartados",))
+
+# Rutas que no dejan resumen en el log salvo que fallen (las consultan los health checks y Prometheus)
+RUTAS_SIN_RESUMEN = {"/health", "/metrics"}
+
+@app.before_request
+def iniciar_medicion():
+    # La regla de la ruta (no la URL) como etiqueta: /api/jobs/<job_id> es una sola serie
+    g.inicio_request = time.perf_counter()
+    metricas.endpoint_actual.set(request.url_rule.rule if request.url_rule else "sin_ruta")
+    registro_logs.iniciar_request()
+
+@app.after_request
+def registrar_medicion(response):
+    # En las respuestas en streaming esto mide hasta el envío de los encabezados
+    if metricas.HABILITADAS and "inicio_request" in g:
+        metricas.duracion_requests.observar(
+            time.perf_counter() - g.inicio_request, metricas.endpoint_actual.get(), request.method, str(response.status_code)
+        )
+    return response
+
+@app.after_request
+def resumir_request(response):
+    # Una línea por request (muestreada) en lugar de una por cada paso del endpoint
+    if "inicio_request" in g and (request.path not in RUTAS_SIN_RESUMEN or response.status_code >= 400):
+        registro_logs.resumir_request(
+            request.method, request.path, metricas.endpoint_actual.get(), response.status_code,
+            time.perf_counter() - g.inicio_request
+        )
+    return response
 
 # =========================================================================
 # === LÓGICA DE BASE DE DATOS PARA LAS REGLAS ===
@@ -83,32 +157,143 @@ def init_db_rules():
     finally:
         if cursor:
             cursor.close()
-            logging.info("Cursor de init_db_rules cerrado.")
+            logging.debug("Cursor de init_db_rules cerrado.")
+        if conn:
+            conn.close()
+            logging.debug("Conexión de init_db_rules cerrada.")
+
+def init_db_resultados():
+    """
+    Crea los índices de 'random_forest_resultados' que usa la paginación por (fecha, id)
+    de /api/data/regresion. Debe ser llamada al iniciar la aplicación.
+    """
+    logging.info("Iniciando verificación/creación de índices de 'random_forest_resultados'...")
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rf_resultados_fecha_id
+                ON random_forest_resultados (fecha DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_rf_resultados_regla_fecha_id
+                ON random_forest_resultados (id_regla_aplicada, fecha DESC, id DESC);
+            -- Cubre las agregaciones de /api/data/regresion/*: se resuelven sin leer la tabla
+            CREATE INDEX IF NOT EXISTS idx_rf_resultados_agregados
+                ON random_forest_resultados (id_regla_aplicada, desempenio_futuro, fecha) INCLUDE (area, jerarquia);
+        ''')
+        conn.commit()
+        logging.info("Índices de 'random_forest_resultados' verificados/creados exitosamente.")
+    except Exception as e:
+        logging.error(f"❌ Error al crear índices de random_forest_resultados: {e}")
+    finally:
+        if cursor:
+            cursor.close()
         if conn:
             conn.close()
-            logging.info("Conexión de init_db_rules cerrada.")
+
+def init_db_resumen_resultados():
+    """
+    Crea la vista materializada 'resumen_resultados_diario' (si está habilitada). La primera vez
+    agrega toda la tabla; después se refresca en segundo plano tras cada carga de predicciones.
+    Debe ser llamada al iniciar la aplicación.
+    """
+    if not resumen_resultados.USAR_RESUMEN:
+        logging.info("Resumen materializado de resultados deshabilitado.")
+        return
+    logging.info("Iniciando verificación/creación de la vista 'resumen_resultados_diario'...")
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(resumen_resultados.QUERY_CREAR_RESUMEN)
+        conn.commit()
+        logging.info("Vista 'resumen_resultados_diario' verificada/creada exitosamente.")
+    except Exception as e:
+        logging.error(f"❌ Error al crear la vista resumen_resultados_diario: {e}")
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+def init_db_cache_predicciones():
+    """
+    Crea la tabla 'cache_predicciones' (si la cache en PostgreSQL está habilitada) y borra las
+    entradas más viejas que la retención configurada. Debe ser llamada al iniciar la aplicación.
+    """
+    if not cache_predicciones.USAR_POSTGRES:
+        logging.info("Cache de predicciones en PostgreSQL deshabilitada.")
+        return
+    logging.info("Iniciando verificación/creación de la tabla 'cache_predicciones'...")
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(cache_predicciones.QUERY_CREAR_TABLA)
+        cursor.execute(cache_predicciones.QUERY_PURGAR, (cache_predicciones.RETENCION_DIAS_POSTGRES,))
+        logging.info(f"Entradas vencidas de cache_predicciones eliminadas: {cursor.rowcount}")
+        conn.commit()
+        logging.info("Tabla 'cache_predicciones' verificada/creada exitosamente.")
+    except Exception as e:
+        logging.error(f"❌ Error al inicializar la tabla cache_predicciones: {e}")
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+def init_db():
+    """
+    Crea tablas, índices y la vista de resumen si no existen. Corre al importar el módulo para
+    que también se ejecute con gunicorn (startup.sh no pasa por __main__); todo es
+    IF NOT EXISTS, así que repetirlo en cada worker o reinicio es inocuo, y los errores
+    solo se registran para que la app levante igual sin base de datos.
+    """
+    init_db_rules()
+    init_db_resultados()
+    init_db_resumen_resultados()
+    init_db_cache_predicciones()
+
+init_db()
 
 # =========================================================================
 # === FUNCIONES DE APOYO ===
 # =========================================================================
 
-def run_script(script_path, *args):
+def run_script(script_path, *args, trabajo=None):
     """
     Ejecuta un script Python como un subproceso y captura su salida.
     Si el script devuelve un JSON con una clave 'error', lanza una excepción.
     Acepta argumentos adicionales para pasar al script.
+    Si se pasa 'trabajo' (cola de entrenamiento), el subproceso corre con prioridad baja
+    y queda registrado en el trabajo para poder cancelarlo.
     """
     logging.info(f"Preparando para ejecutar script: {script_path}")
     try:
         command = [sys.executable, script_path] # Usar sys.executable para mayor compatibilidad
         command.extend(args) # Añadir todos los argumentos
         logging.info(f"Comando a ejecutar: {' '.join(command)}")
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True # Esto levantará CalledProcessError si el script devuelve un código de error distinto de 0
-        )
+        if trabajo is not None:
+            trabajo.verificar_cancelacion()
+        proceso = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if trabajo is not None:
+            trabajo.proceso = proceso
+            if hasattr(os, "setpriority"):
+                # Los entrenamientos no deben quitarle CPU a las predicciones del worker
+                os.setpriority(os.PRIO_PROCESS, proceso.pid, 10)
+            if trabajo.cancelado:
+                proceso.terminate()
+        stdout, stderr = proceso.communicate()
+        if trabajo is not None:
+            trabajo.proceso = None
+            trabajo.verificar_cancelacion()
+        if proceso.returncode != 0:
+            # Misma excepción que subprocess.run(check=True)
+            raise subprocess.CalledProcessError(proceso.returncode, command, output=stdout, stderr=stderr)
+        result = subprocess.CompletedProcess(command, proceso.returncode, stdout, stderr)
         logging.info(f"Script {script_path} ejecutado exitosamente.")
         
         # --- Lógica: Procesar la salida JSON del script ---
@@ -135,10 +320,137 @@ def run_script(script_path, *args):
     except FileNotFoundError:
         logging.error(f"❌ Script no encontrado: {script_path}")
         raise Exception(f"Script no encontrado: {script_path}")
+    except TrabajoCancelado:
+        logging.info(f"Ejecución de {script_path} cancelada.")
+        raise
     except Exception as e:
         logging.error(f"❌ Error inesperado al ejecutar el script {script_path}: {e}")
         raise Exception(f"Error inesperado al ejecutar el script: {str(e)}")
 
+def obtener_ultimo_id_regla():
+    """
+    Devuelve el id_regla de la última regla aplicada, o None si no hay ninguna o falla la consulta.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id_regla FROM reglas_aplicadas ORDER BY fecha_aplicacion DESC LIMIT 1;")
+        result = cursor.fetchone()
+        return result[0] if result else None
+    except Exception as e:
+        logging.error(f"❌ Error al obtener el último id_regla_aplicada desde la DB: {e}", exc_info=True)
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+def obtener_reglas_regla(id_regla):
+    """
+    Devuelve las reglas (dict) guardadas para 'id_regla', o None si no existe.
+    Los errores de base de datos se propagan.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT detalles_reglas FROM reglas_aplicadas WHERE id_regla = %s;", (id_regla,))
+        result = cursor.fetchone()
+        return result[0] if result else None # JSONB se carga como dict directamente
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+def generar_dataset_sintetico(reglas_json, ruta_espacio, trabajo=None):
+    """
+    Ejecuta el generador sintético dentro del espacio de trabajo 'ruta_espacio'.
+    Devuelve (ruta del dataset generado, salida del script).
+    """
+    reglas_file_path = os.path.join(ruta_espacio, espacios_trabajo.NOMBRE_REGLAS)
+    with open(reglas_file_path, "w", encoding="utf-8") as reglas_file:
+        json.dump(reglas_json, reglas_file)
+    logging.info(f"Reglas guardadas en el espacio de trabajo: {reglas_file_path}")
+
+    ruta_datos = espacios_trabajo.ruta_dataset(ruta_espacio)
+    script_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "generar_synthetic_training_data.py")
+    with metricas.etapa("generacion_dataset"):
+        synthetic_gen_output = run_script(script_path, reglas_file_path, "--salida", ruta_datos, trabajo=trabajo)
+    if not os.path.exists(ruta_datos):
+        logging.error(f"El archivo CSV sintético no fue generado por {script_path}: {ruta_datos}")
+        raise Exception("El archivo CSV sintético no fue generado")
+    return ruta_datos, synthetic_gen_output
+
+# Tope de árboles por entrenamiento, para que un pedido no bloquee la cola por horas
+MAX_ARBOLES_ENTRENAMIENTO = int(os.environ.get("ENTRENAMIENTO_MAX_ARBOLES", 1000))
+
+def leer_parametros_entrenamiento(data):
+    """
+    Valida los parámetros opcionales de entrenamiento del cuerpo JSON
+    (n_jobs, n_estimators, max_depth, max_samples e incremental).
+    Devuelve los argumentos de línea de comandos para regresion.py; lanza ValueError si alguno es inválido.
+    """
+    def entero(clave, minimo, maximo=None):
+        valor = data[clave]
+        if isinstance(valor, bool) or not isinstance(valor, int) or valor < minimo or (maximo is not None and valor > maximo):
+            rango = f"entre {minimo} y {maximo}" if maximo is not None else f"mayor o igual a {minimo}"
+            raise ValueError(f"{clave} debe ser un entero {rango}")
+        return valor
+
+    argumentos = []
+    if data.get('n_jobs') is not None:
+        n_jobs = entero('n_jobs', -1, os.cpu_count() or 1)
+        if n_jobs == 0:
+            raise ValueError("n_jobs no puede ser 0 (usar -1 para todos los núcleos)")
+        argumentos += ["--n_jobs", str(n_jobs)]
+    if data.get('n_estimators') is not None:
+        argumentos += ["--n_estimators", str(entero('n_estimators', 1, MAX_ARBOLES_ENTRENAMIENTO))]
+    if data.get('max_depth') is not None:
+        argumentos += ["--max_depth", str(entero('max_depth', 1))]
+    if data.get('max_samples') is not None:
+        max_samples = data['max_samples']
+        if isinstance(max_samples, float) and 0 < max_samples <= 1:
+            argumentos += ["--max_samples", repr(max_samples)]
+        elif isinstance(max_samples, int) and not isinstance(max_samples, bool) and max_samples >= 1:
+            argumentos += ["--max_samples", str(max_samples)]
+        else:
+            raise ValueError("max_samples debe ser una fracción en (0, 1] o una cantidad de filas")
+    if data.get('incremental'):
+        argumentos.append("--incremental")
+    return argumentos
+
+def leer_parametros_rotacion(data):
+    """
+    Valida n_clusters y random_state del cuerpo JSON de los endpoints de rotación.
+    Devuelve (n_clusters, random_state); lanza ValueError si alguno es inválido.
+    """
+    try:
+        # Vía str() se rechazan 3.5 y true en lugar de truncarlos
+        n_clusters = int(str(data.get('n_clusters', 3)))
+        random_state = int(str(data.get('random_state', ROTACION_RANDOM_STATES[0])))
+    except ValueError:
+        raise ValueError("n_clusters y random_state deben ser enteros") from None
+    if not ROTACION_MIN_CLUSTERS <= n_clusters <= ROTACION_MAX_CLUSTERS:
+        raise ValueError(f"n_clusters debe estar entre {ROTACION_MIN_CLUSTERS} y {ROTACION_MAX_CLUSTERS}")
+    if random_state not in ROTACION_RANDOM_STATES:
+        raise ValueError(f"random_state debe ser uno de {ROTACION_RANDOM_STATES}")
+    return n_clusters, random_state
+
+def precargar_modelo_regla(id_regla):
+    """
+    Carga en memoria el modelo recién registrado para la regla, así la primera predicción
+    posterior al entrenamiento no paga la lectura del artefacto.
+    """
+    try:
+        runtime_modelo.obtener_modelo(id_regla)
+    except Exception as e:
+        logging.warning(f"No se pudo precargar el modelo de la regla {id_regla}: {e}")
+
 # --- Funciones `clasificar_fila` y `aplicar_reglas_y_guardar` ELIMINADAS ---
 # Ya no son necesarias en el nuevo flujo de trabajo, donde
 # `generar_synthetic_training_data.py` maneja la aplicación de reglas para
@@ -151,91 +463,219 @@ def run_script(script_path, *args):
 
 @app.route('/', methods=['GET'])
 def index():
-    logging.info("Llamada a la ruta principal '/'.")
+    logging.debug("Llamada a la ruta principal '/'.")
     return jsonify({
         "message": "Bienvenido a la API de predicción",
         "status": "OK",
         "endpoints_disponibles": [
             "/health",
+            "/metrics",
             "/api/predict/rotation",
+            "/api/predict/rotation/score",
+            "/api/data/rotacion/ciclos",
             "/api/predict/performance_train",
             "/test",
             "/api/predict/future_performance",
+            "/api/predict/future_performance_multi",
             "/interfaz",
             "/api/data/regresion",
+            "/api/data/regresion/conteos",
+            "/api/data/regresion/por_regla",
+            "/api/data/regresion/serie",
             "/api/predict/generar_csv_training",
             "/api/data/reglas_previas",
             "/api/data/regla_por_id/<int:rule_id>",
-            "/api/predict/train_with_historical" # Nuevo endpoint para entrenar con reglas históricas
+            "/api/predict/train_with_historical", # Nuevo endpoint para entrenar con reglas históricas
+            "/api/jobs/<job_id>" # Estado (GET) o cancelación (DELETE) de un entrenamiento encolado
         ]
     }), 200
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    logging.info("Llamada a la ruta de salud '/health'.")
+    logging.debug("Llamada a la ruta de salud '/health'.")
     return jsonify({
         "status": "OK",
         "message": "El servidor está funcionando correctamente",
         "endpoints": {
+            "metricas": "/metrics",
             "kmeans": "/api/predict/rotation",
+            "rotacion_puntuar": "/api/predict/rotation/score",
+            "rotacion_ciclos": "/api/data/rotacion/ciclos",
             "entrenar_regresion": "/api/predict/performance_train",
             "future_performance": "/api/predict/future_performance",
+            "future_performance_multi": "/api/predict/future_performance_multi",
             "get_regresion_data": "/api/data/regresion",
+            "regresion_conteos": "/api/data/regresion/conteos",
+            "regresion_por_regla": "/api/data/regresion/por_regla",
+            "regresion_serie": "/api/data/regresion/serie",
             "generar_csv_training": "/api/predict/generar_csv_training",
             "get_reglas_previas": "/api/data/reglas_previas",
             "get_regla_por_id": "/api/data/regla_por_id/<int:rule_id>",
-            "train_with_historical": "/api/predict/train_with_historical" # Nuevo endpoint
-        }
+            "train_with_historical": "/api/predict/train_with_historical", # Nuevo endpoint
+            "jobs": "/api/jobs/<job_id>"
+        },
+        "pool_postgres": pool_postgres.metricas(),
+        "cache_predicciones": cache_predicciones.cache_predicciones.metricas(),
+        "resumen_resultados": resumen_resultados.refresco_resumen.metricas()
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Métricas del worker en formato de texto de Prometheus: duración de requests y de cada
+    etapa de los endpoints (histogramas), filas procesadas, pool de conexiones, cache de
+    predicciones, cola de entrenamiento y refrescos del resumen.
+    """
+    return Response(metricas.exponer(), content_type='text/plain; version=0.0.4; charset=utf-8'), 200
+
 @app.route('/api/predict/rotation', methods=['POST'])
 def predict_rotation():
-    logging.info("➡️ Se ha llamado al endpoint /api/predict/rotation.")
+    logging.debug("➡️ Se ha llamado al endpoint /api/predict/rotation.")
     if ENABLE_AUTH:
-        logging.info("Autenticación habilitada para /api/predict/rotation. Verificando token...")
+        logging.debug("Autenticación habilitada para /api/predict/rotation. Verificando token...")
         try:
             token = request.headers.get('Authorization', '').split(" ")[1]
             auth.verify_id_token(token)
-            logging.info("Token de autenticación verificado.")
+            logging.debug("Token de autenticación verificado.")
         except Exception as e:
             logging.error(f"❌ Error de autenticación en /api/predict/rotation: {e}")
             return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
     else:
-        logging.info("Autenticación deshabilitada para /api/predict/rotation.")
+        logging.debug("Autenticación deshabilitada para /api/predict/rotation.")
 
     try:
-        script_path = os.path.join(os.path.dirname(__file__), "K-Means", "K-Means-Rotacion.py")
-        output = run_script(script_path)
-        logging.info("Predicción de rotación completada exitosamente.")
-        return jsonify(output), 200
+        # El resultado se cachea por contenido del dataset y parámetros: solo se recalcula si cambian
+        data = request.get_json(silent=True) or {}
+        n_clusters, random_state = leer_parametros_rotacion(data)
+        modo = data.get('modo', ROTACION_MODO)
+        if modo not in ('incremental', 'completo'):
+            return jsonify({"error": "modo debe ser 'incremental' o 'completo'"}), 400
+        with metricas.etapa(f"rotacion_{modo}"):
+            if modo == 'incremental':
+                output = rotacion_incremental.obtener_motor(n_clusters, random_state).obtener()
+            else:
+                output = cache_rotacion.obtener(n_clusters, random_state)
+        registro_logs.anotar(modo=modo, clusters=n_clusters)
+        logging.debug("Predicción de rotación completada exitosamente.")
+        with metricas.etapa("serializacion"):
+            respuesta = jsonify(output)
+        return respuesta, 200
+    except ValueError as e:
+        # Parámetros fuera de rango, o más clusters que empleados en el dataset
+        logging.warning(f"Parámetros de rotación inválidos: {e}")
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        logging.error(f"❌ No se encontró el dataset de rotación: {e.filename}")
+        return jsonify({"error": f"No se encontró el archivo: {e.filename}"}), 500
     except Exception as e:
         logging.error(f"❌ Error en endpoint /api/predict/rotation: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/predict/rotation/score', methods=['POST'])
+def puntuar_rotacion():
+    """
+    Rotación de empleados puntuales sin reajustar el modelo (centroide más cercano).
+    'nombres': empleados ya incorporados. 'empleados': empleados nuevos, ya agregados
+    (Ausencias Injustificadas, Llegadas tarde, Salidas tempranas, Rendimiento ACTUAL_Bajo/_Medio/_Alto) o como
+    filas por ciclo con las mismas columnas que el dataset.
+    """
+    logging.debug("➡️ Se ha llamado al endpoint /api/predict/rotation/score.")
+    if ENABLE_AUTH:
+        logging.debug("Autenticación habilitada para /api/predict/rotation/score. Verificando token...")
+        try:
+            token = request.headers.get('Authorization', '').split(" ")[1]
+            auth.verify_id_token(token)
+            logging.debug("Token de autenticación verificado.")
+        except Exception as e:
+            logging.error(f"❌ Error de autenticación en /api/predict/rotation/score: {e}")
+            return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
+    else:
+        logging.debug("Autenticación deshabilitada para /api/predict/rotation/score.")
+
+    try:
+        data = request.get_json(silent=True) or {}
+        nombres = data.get('nombres') or []
+        empleados = data.get('empleados') or []
+        if isinstance(nombres, str):
+            nombres = [nombres]
+        if not isinstance(nombres, list) or not isinstance(empleados, list) or not (nombres or empleados):
+            return jsonify({"error": "Se debe enviar 'nombres' y/o 'empleados' con al menos un elemento"}), 400
+        motor = rotacion_incremental.obtener_motor(*leer_parametros_rotacion(data))
+        with metricas.etapa("puntuacion", filas=len(nombres) + len(empleados)):
+            resultados, no_encontrados = motor.puntuar(nombres, pd.DataFrame(empleados) if empleados else None)
+        registro_logs.anotar(filas=len(resultados), no_encontrados=len(no_encontrados))
+        logging.debug("✅ Rotación puntuada para %s empleados (%s no encontrados).", len(resultados), len(no_encontrados))
+        return jsonify({"data": resultados, "no_encontrados": no_encontrados, "clusters": motor.n_clusters}), 200
+    except ValueError as e:
+        logging.warning(f"Datos de rotación inválidos: {e}")
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        logging.error(f"❌ No se encontró el dataset de rotación: {e.filename}")
+        return jsonify({"error": f"No se encontró el archivo: {e.filename}"}), 500
+    except Exception as e:
+        logging.error(f"❌ Error en endpoint /api/predict/rotation/score: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/data/rotacion/ciclos', methods=['POST'])
+def agregar_ciclos_rotacion():
+    """
+    Suma filas de ciclos nuevos al motor incremental de rotación (mismas columnas que el dataset:
+    Nombre, Ciclo, Ausencias Injustificadas, Llegadas tarde, Salidas tempranas, Rendimiento ACTUAL).
+    """
+    logging.debug("➡️ Se ha llamado al endpoint /api/data/rotacion/ciclos.")
+    if ENABLE_AUTH:
+        logging.debug("Autenticación habilitada para /api/data/rotacion/ciclos. Verificando token...")
+        try:
+            token = request.headers.get('Authorization', '').split(" ")[1]
+            auth.verify_id_token(token)
+            logging.debug("Token de autenticación verificado.")
+        except Exception as e:
+            logging.error(f"❌ Error de autenticación en /api/data/rotacion/ciclos: {e}")
+            return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
+    else:
+        logging.debug("Autenticación deshabilitada para /api/data/rotacion/ciclos.")
+
+    try:
+        data = request.get_json(silent=True) or {}
+        filas = data.get('filas')
+        if not isinstance(filas, list) or not filas:
+            return jsonify({"error": "Se debe enviar 'filas' con al menos una fila"}), 400
+        motor = rotacion_incremental.obtener_motor(*leer_parametros_rotacion(data))
+        # Primero se incorpora el dataset (si el motor todavía no lo tiene) y después las filas recibidas
+        motor.actualizar_desde_dataset()
+        filas_nuevas, empleados = motor.agregar_ciclos(pd.DataFrame(filas))
+        logging.info(f"✅ Ciclos de rotación agregados: {filas_nuevas} filas nuevas, {empleados} empleados actualizados.")
+        return jsonify({"filas_nuevas": filas_nuevas, "empleados_actualizados": empleados}), 200
+    except ValueError as e:
+        logging.warning(f"Filas de rotación inválidas: {e}")
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        logging.error(f"❌ No se encontró el dataset de rotación: {e.filename}")
+        return jsonify({"error": f"No se encontró el archivo: {e.filename}"}), 500
+    except Exception as e:
+        logging.error(f"❌ Error en endpoint /api/data/rotacion/ciclos: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/predict/generar_csv_training', methods=['POST'])
 def generar_csv_entrenamiento_endpoint():
-    logging.info("➡️ Se ha llamado al endpoint /api/predict/generar_csv_training (generar sintéticos y guardar reglas).")
+    logging.debug("➡️ Se ha llamado al endpoint /api/predict/generar_csv_training (generar sintéticos y guardar reglas).")
     try:
         reglas_json = request.get_json()
         if not reglas_json:
             logging.warning("No se recibieron reglas JSON en la solicitud. Cuerpo de la solicitud vacío o inválido.")
             return jsonify({"error": "No se enviaron reglas JSON"}), 400
 
-        logging.info(f"Reglas JSON recibidas del frontend: {json.dumps(reglas_json, indent=2)}")
+        logging.debug("Reglas JSON recibidas del frontend: %s", registro_logs.json_diferido(reglas_json))
 
-        # Guardar reglas en archivo temporal para pasar al generador sintético
-        reglas_file_path = None
+        # Cada request genera en su propio espacio de trabajo; cuando se conoce el id_regla
+        # la carpeta se publica como la de esa regla para el entrenamiento posterior
+        ruta_espacio = espacios_trabajo.nuevo_espacio()
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".json", mode="w", encoding="utf-8") as reglas_file:
-                json.dump(reglas_json, reglas_file)
-                reglas_file_path = reglas_file.name
-            logging.info(f"Reglas guardadas en archivo temporal: {reglas_file_path}")
-
             # Llamar al generador sintético con las reglas
-            script_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "generar_synthetic_training_data.py")
-            # run_script ahora acepta múltiples argumentos
-            synthetic_gen_output = run_script(script_path, reglas_file_path) 
+            csv_path, synthetic_gen_output = generar_dataset_sintetico(reglas_json, ruta_espacio)
             
             # El script generador imprime un mensaje simple o un JSON con error
             if isinstance(synthetic_gen_output, dict) and 'error' in synthetic_gen_output:
@@ -246,61 +686,58 @@ def generar_csv_entrenamiento_endpoint():
             else:
                 logging.info(f"Salida inesperada del generador sintético: {synthetic_gen_output}")
 
-            # Leer el CSV generado para vista previa
-            csv_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "synthetic_training_data.csv")
-            if not os.path.exists(csv_path):
-                logging.error(f"El archivo CSV sintético no fue generado por {script_path}: {csv_path}")
-                return jsonify({"error": "El archivo CSV sintético no fue generado"}), 500
-                
-            df_resultado = pd.read_csv(csv_path)
-            logging.info(f"CSV sintético generado exitosamente con {len(df_resultado)} filas.")
+            # Leer las primeras filas del dataset generado para vista previa
+            df_resultado = dataset_io.leer_primeras_filas(csv_path, 10)
+            logging.info(f"CSV sintético generado exitosamente con {dataset_io.contar_filas(csv_path)} filas.")
 
         except Exception as gen_e:
             logging.error(f"Error en la generación del CSV sintético: {gen_e}", exc_info=True)
+            espacios_trabajo.eliminar_espacio(ruta_espacio)
             return jsonify({"error": f"Error en la generación del CSV sintético: {str(gen_e)}"}), 500
-        finally:
-            # Limpiar archivo temporal de reglas
-            if reglas_file_path and os.path.exists(reglas_file_path):
-                os.unlink(reglas_file_path)
-                logging.info(f"Archivo temporal de reglas eliminado: {reglas_file_path}")
 
         # --- Guardar reglas en la base de datos ---
-        logging.info("Intentando establecer conexión a la base de datos para guardar reglas...")
+        logging.debug("Intentando establecer conexión a la base de datos para guardar reglas...")
         conn = None
         cursor = None
         try:
             conn = get_connection()
             cursor = conn.cursor()
-            logging.info("Conexión a la base de datos establecida.")
+            logging.debug("Conexión a la base de datos establecida.")
             
             timestamp_id = datetime.now().strftime("training_run_%Y%m%d_%H%M%S")
             reglas_string = json.dumps(reglas_json)
             
-            logging.info(f"Preparando inserción de reglas: ID={timestamp_id}, Detalles={reglas_string[:100]}...")
+            logging.debug("Preparando inserción de reglas: ID=%s, Detalles=%s...", timestamp_id, reglas_string[:100])
             cursor.execute(
-                "INSERT INTO reglas_aplicadas (fecha_aplicacion, nombre_csv_generado, detalles_reglas) VALUES (NOW(), %s, %s)",
+                "INSERT INTO reglas_aplicadas (fecha_aplicacion, nombre_csv_generado, detalles_reglas) VALUES (NOW(), %s, %s) RETURNING id_regla",
                 (timestamp_id, reglas_string)
             )
+            id_regla = cursor.fetchone()[0]
             conn.commit()
-            logging.info(f"✅ Reglas guardadas exitosamente en la base de datos para ID: {timestamp_id}. Commited.")
+            logging.info(f"✅ Reglas guardadas exitosamente en la base de datos para ID: {timestamp_id} (id_regla={id_regla}). Commited.")
         except Exception as db_e:
             logging.error(f"❌ Error al guardar reglas en la base de datos: {db_e}. Rolback de la transacción.", exc_info=True)
             if conn:
                 conn.rollback()
+            espacios_trabajo.eliminar_espacio(ruta_espacio)
             return jsonify({"error": f"CSV sintético generado, pero error al guardar reglas en DB: {str(db_e)}"}), 500
         finally:
             if cursor:
                 cursor.close()
-                logging.info("Cursor de reglas_aplicadas cerrado.")
+                logging.debug("Cursor de reglas_aplicadas cerrado.")
             if conn:
                 conn.close()
-                logging.info("Conexión de reglas_aplicadas cerrada.")
+                logging.debug("Conexión de reglas_aplicadas cerrada.")
         # --- Fin de guardar reglas en la base de datos ---
 
+        espacios_trabajo.publicar_espacio(ruta_espacio, id_regla)
+        logging.info(f"Dataset sintético publicado para id_regla={id_regla}.")
+
         logging.info("Respondiendo al frontend tras la generación de CSV sintético y guardado de reglas.")
         return jsonify({
             "mensaje": "CSV de entrenamiento sintético generado exitosamente y reglas guardadas.",
             "archivo": os.path.basename(csv_path),
+            "id_regla": id_regla,
             "vista_previa": df_resultado.head(10).to_dict(orient="records")
         }), 200
 
@@ -309,28 +746,122 @@ def generar_csv_entrenamiento_endpoint():
         return jsonify({"error": str(e)}), 500
 
 
+def entrenar_modelo_trabajo(trabajo, id_regla, argumentos=()):
+    """
+    Trabajo de la cola: entrena el modelo con el CSV sintético de la regla y lo registra bajo ella.
+    'argumentos' son los parámetros de entrenamiento ya validados (ver leer_parametros_entrenamiento).
+    """
+    ruta_datos = espacios_trabajo.ruta_dataset_regla(id_regla)
+    if ruta_datos is None:
+        # El dataset venció o lo generó otro host: se regenera a partir de las reglas guardadas
+        logging.info(f"No hay dataset sintético publicado para id_regla={id_regla}. Se regenera desde la BD.")
+        reglas_json = obtener_reglas_regla(id_regla)
+        if reglas_json is None:
+            raise Exception(f"Regla con ID {id_regla} no encontrada")
+        ruta_espacio = espacios_trabajo.nuevo_espacio()
+        try:
+            generar_dataset_sintetico(reglas_json, ruta_espacio, trabajo=trabajo)
+            ruta_datos = espacios_trabajo.ruta_dataset(espacios_trabajo.publicar_espacio(ruta_espacio, id_regla))
+        except BaseException:
+            espacios_trabajo.eliminar_espacio(ruta_espacio)
+            raise
+
+    script_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "regresion.py")
+    logging.info(f"Ejecutando script de entrenamiento del modelo (regresion.py): {script_path} para id_regla={id_regla}")
+    with metricas.etapa("entrenamiento"):
+        output = run_script(script_path, str(int(id_regla)), "--datos", ruta_datos, *argumentos, trabajo=trabajo)
+    logging.info("Script de entrenamiento del modelo finalizado exitosamente.")
+    precargar_modelo_regla(id_regla)
+    return output
+
+
+def entrenar_con_regla_historica_trabajo(trabajo, rule_id, reglas_json, argumentos=()):
+    """
+    Trabajo de la cola: genera el CSV sintético con las reglas históricas y entrena el modelo.
+    Todo ocurre en un espacio de trabajo propio que se borra al terminar.
+    """
+    with espacios_trabajo.espacio_temporal(f"historico_{int(rule_id)}") as ruta_espacio:
+        # Llamar al generador sintético
+        ruta_datos, synthetic_gen_output = generar_dataset_sintetico(reglas_json, ruta_espacio, trabajo=trabajo)
+
+        if isinstance(synthetic_gen_output, dict) and 'message' in synthetic_gen_output:
+            logging.info(f"Mensaje del generador sintético con reglas históricas: {synthetic_gen_output['message']}")
+        else:
+            logging.info(f"Salida inesperada del generador sintético con reglas históricas: {synthetic_gen_output}")
+
+        # Entrenar el modelo
+        trabajo.verificar_cancelacion()
+        train_script_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "regresion.py")
+        logging.info(f"Ejecutando entrenamiento del modelo con CSV sintético basado en regla ID {rule_id}.")
+        with metricas.etapa("entrenamiento"):
+            train_output = run_script(train_script_path, str(int(rule_id)), "--datos", ruta_datos, *argumentos, trabajo=trabajo)
+        precargar_modelo_regla(rule_id)
+
+        logging.info("Entrenamiento con reglas históricas completado exitosamente.")
+        return {
+            "mensaje": f"Modelo entrenado exitosamente con regla ID {rule_id}",
+            "resultado_entrenamiento": train_output
+        }
+
+
+def respuesta_trabajo_encolado(trabajo):
+    """
+    Respuesta 202 común a los endpoints que encolan un entrenamiento.
+    """
+    url_estado = f"/api/jobs/{trabajo.id}"
+    respuesta = jsonify({
+        "mensaje": "Entrenamiento encolado. Consultá su estado en url_estado.",
+        "job_id": trabajo.id,
+        "estado": trabajo.estado,
+        "url_estado": url_estado
+    })
+    respuesta.headers['Location'] = url_estado
+    return respuesta, 202
+
+
 @app.route('/api/predict/performance_train', methods=['POST'])
 def performance_train_endpoint(): # Renombrado para evitar conflicto si se usa `predict_performance` en otro lado
-    logging.info("➡️ Se ha llamado al endpoint /api/predict/performance_train (entrenamiento del modelo).")
+    logging.debug("➡️ Se ha llamado al endpoint /api/predict/performance_train (entrenamiento del modelo).")
     if ENABLE_AUTH:
-        logging.info("Autenticación habilitada para /api/predict/performance_train. Verificando token...")
+        logging.debug("Autenticación habilitada para /api/predict/performance_train. Verificando token...")
         try:
             token = request.headers.get('Authorization', '').split(" ")[1]
             auth.verify_id_token(token)
-            logging.info("Token de autenticación verificado.")
+            logging.debug("Token de autenticación verificado.")
         except Exception as e:
             logging.error(f"❌ Error de autenticación en /api/predict/performance_train: {e}")
             return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
     else:
-        logging.info("Autenticación deshabilitada para /api/predict/performance_train.")
+        logging.debug("Autenticación deshabilitada para /api/predict/performance_train.")
 
-    script_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "regresion.py")
-    
     try:
-        logging.info(f"Ejecutando script de entrenamiento del modelo (regresion.py): {script_path}")
-        output = run_script(script_path)
-        logging.info("Script de entrenamiento del modelo finalizado exitosamente.")
-        return jsonify(output), 200
+        # El modelo se registra bajo la regla indicada o, si no se envía, la última regla aplicada
+        data = request.get_json(silent=True) or {}
+        id_regla = data.get('id_regla')
+        if id_regla is not None:
+            # Se valida antes de encolar: el worker haría int(id_regla) recién después de
+            # regenerar y publicar el espacio de trabajo. Vía str() se rechazan 1.5 y true.
+            try:
+                id_regla = int(str(id_regla))
+            except (ValueError, TypeError):
+                return jsonify({"error": "id_regla debe ser un entero"}), 400
+        if id_regla is None:
+            id_regla = obtener_ultimo_id_regla()
+        if id_regla is None:
+            return jsonify({"error": "No hay reglas aplicadas. Generá primero el CSV de entrenamiento."}), 400
+        try:
+            argumentos = leer_parametros_entrenamiento(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        trabajo = cola_entrenamiento.encolar(
+            "performance_train", entrenar_modelo_trabajo, id_regla, argumentos,
+            parametros={"id_regla": id_regla, "argumentos": argumentos}
+        )
+        return respuesta_trabajo_encolado(trabajo)
+    except ColaLlena as e:
+        logging.warning(f"Cola de entrenamiento llena en /api/predict/performance_train: {e}")
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         logging.error(f"❌ Error en endpoint /api/predict/performance_train: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
@@ -338,7 +869,7 @@ def performance_train_endpoint(): # Renombrado para evitar conflicto si se usa `
 
 @app.route('/api/predict/train_with_historical', methods=['POST'])
 def train_with_historical_rules():
-    logging.info("➡️ Se ha llamado al endpoint /api/predict/train_with_historical.")
+    logging.debug("➡️ Se ha llamado al endpoint /api/predict/train_with_historical.")
     try:
         data = request.get_json()
         if not data or 'rule_id' not in data:
@@ -346,96 +877,138 @@ def train_with_historical_rules():
 
         rule_id = data['rule_id']
         logging.info(f"Entrenando con regla histórica ID: {rule_id}")
+        try:
+            argumentos = leer_parametros_entrenamiento(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Obtener reglas de la base de datos
-        conn = None
-        cursor = None
+        # Obtener reglas de la base de datos (antes de encolar, para responder 404 enseguida)
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT detalles_reglas FROM reglas_aplicadas WHERE id_regla = %s;", (rule_id,))
-            result = cursor.fetchone()
-            
-            if not result:
-                logging.warning(f"Regla con ID {rule_id} no encontrada en la base de datos.")
-                return jsonify({"error": f"Regla con ID {rule_id} no encontrada"}), 404
-                
-            reglas_json = result[0] # JSONB se carga como dict directamente
-            logging.info(f"Reglas obtenidas de la BD para ID {rule_id}: {json.dumps(reglas_json, indent=2)}")
-            
+            reglas_json = obtener_reglas_regla(rule_id)
         except Exception as db_e:
             logging.error(f"Error al obtener reglas de la BD para ID {rule_id}: {db_e}", exc_info=True)
             return jsonify({"error": f"Error al obtener reglas: {str(db_e)}"}), 500
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
-        # Generar CSV sintético con las reglas históricas
-        reglas_file_path = None
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".json", mode="w", encoding="utf-8") as reglas_file:
-                json.dump(reglas_json, reglas_file)
-                reglas_file_path = reglas_file.name
-            logging.info(f"Reglas históricas guardadas en archivo temporal: {reglas_file_path}")
-
-            # Llamar al generador sintético
-            script_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "generar_synthetic_training_data.py")
-            synthetic_gen_output = run_script(script_path, reglas_file_path)
-            
-            if isinstance(synthetic_gen_output, dict) and 'error' in synthetic_gen_output:
-                 logging.error(f"Error del generador sintético con reglas históricas: {synthetic_gen_output['error']}")
-                 return jsonify({"error": synthetic_gen_output['error']}), 500
-            elif isinstance(synthetic_gen_output, dict) and 'message' in synthetic_gen_output:
-                logging.info(f"Mensaje del generador sintético con reglas históricas: {synthetic_gen_output['message']}")
-            else:
-                logging.info(f"Salida inesperada del generador sintético con reglas históricas: {synthetic_gen_output}")
+        if reglas_json is None:
+            logging.warning(f"Regla con ID {rule_id} no encontrada en la base de datos.")
+            return jsonify({"error": f"Regla con ID {rule_id} no encontrada"}), 404
+        logging.debug("Reglas obtenidas de la BD para ID %s: %s", rule_id, registro_logs.json_diferido(reglas_json))
 
-            # Entrenar el modelo
-            train_script_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "regresion.py")
-            logging.info(f"Ejecutando entrenamiento del modelo con CSV sintético basado en regla ID {rule_id}.")
-            train_output = run_script(train_script_path)
-            
-            logging.info("Entrenamiento con reglas históricas completado exitosamente.")
-            return jsonify({
-                "mensaje": f"Modelo entrenado exitosamente con regla ID {rule_id}",
-                "resultado_entrenamiento": train_output
-            }), 200
-
-        except Exception as gen_e:
-            logging.error(f"Error en el proceso de entrenamiento con regla histórica: {gen_e}", exc_info=True)
-            return jsonify({"error": f"Error en el proceso: {str(gen_e)}"}), 500
-        finally:
-            if reglas_file_path and os.path.exists(reglas_file_path):
-                os.unlink(reglas_file_path)
-                logging.info(f"Archivo temporal de reglas históricas eliminado: {reglas_file_path}")
+        # Generar CSV sintético y entrenar en segundo plano
+        trabajo = cola_entrenamiento.encolar(
+            "train_with_historical", entrenar_con_regla_historica_trabajo, rule_id, reglas_json, argumentos,
+            parametros={"rule_id": rule_id, "argumentos": argumentos}
+        )
+        return respuesta_trabajo_encolado(trabajo)
 
+    except ColaLlena as e:
+        logging.warning(f"Cola de entrenamiento llena en /api/predict/train_with_historical: {e}")
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         logging.error(f"❌ Error general en /api/predict/train_with_historical: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_endpoint(job_id):
+    logging.debug("➡️ Se ha llamado al endpoint /api/jobs/%s (%s).", job_id, request.method)
+    if ENABLE_AUTH:
+        logging.debug("Autenticación habilitada para /api/jobs. Verificando token...")
+        try:
+            token = request.headers.get('Authorization', '').split(" ")[1]
+            auth.verify_id_token(token)
+            logging.debug("Token de autenticación verificado.")
+        except Exception as e:
+            logging.error(f"❌ Error de autenticación en /api/jobs: {e}")
+            return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
+    else:
+        logging.debug("Autenticación deshabilitada para /api/jobs.")
+
+    # DELETE cancela el trabajo (si todavía no terminó); GET solo consulta su estado
+    if request.method == 'DELETE':
+        trabajo = cola_entrenamiento.cancelar(job_id)
+    else:
+        trabajo = cola_entrenamiento.obtener(job_id)
+
+    if trabajo is None:
+        return jsonify({"error": f"Trabajo {job_id} no encontrado"}), 404
+    return jsonify(trabajo.to_dict()), 200
+
+
+# Filas por lote en el modo streaming de /api/predict/future_performance
+FILAS_POR_LOTE_PREDICCION = int(os.environ.get("PREDICCION_FILAS_POR_LOTE", 20000))
+
+def pide_streaming():
+    """
+    El cliente pide la respuesta en NDJSON con ?stream=1 (o campo 'stream' del formulario)
+    o con el encabezado Accept: application/x-ndjson.
+    """
+    if request.values.get('stream', '').lower() in ('1', 'true', 'si', 'sí'):
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+def pide_probabilidades():
+    """
+    Con ?probabilidades=1 (o el campo del formulario) la respuesta incluye la probabilidad de cada clase.
+    """
+    return request.values.get('probabilidades', '').lower() in ('1', 'true', 'si', 'sí')
+
+def generar_prediccion_ndjson(lotes, archivo_temporal_path, id_regla):
+    """
+    Recorre los lotes predichos: escribe cada uno en random_forest_resultados y lo envía al
+    cliente como NDJSON. Toda la carga es una sola transacción que se confirma al final; si
+    algo falla se revierte completa y se envía una última línea con 'error'.
+    """
+    fecha_actual = datetime.now()
+    filas = 0
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        for lote in lotes:
+            with metricas.etapa("escritura_db", filas=len(lote)):
+                filas += carga_resultados.escribir_resultados(cursor, lote, fecha_actual, id_regla)
+            with metricas.etapa("serializacion", filas=len(lote)):
+                lineas = lote.to_json(orient="records", lines=True, force_ascii=False, date_format="iso")
+            yield lineas if lineas.endswith("\n") else lineas + "\n"
+        conn.commit()
+        resumen_resultados.refresco_resumen.solicitar()
+        # El stream termina después del resumen del request: el resultado queda en su propia línea
+        logging.info("✅ Predicción por lotes terminada: %s filas guardadas en PostgreSQL.", filas)
+    except Exception as e:
+        # Los encabezados ya se enviaron: el error viaja como última línea del stream
+        logging.error(f"❌ Error durante la predicción por lotes ({filas} filas revertidas): {e}", exc_info=True)
+        if conn:
+            conn.rollback()
+        yield json.dumps({"error": str(e), "filas_guardadas": 0}, ensure_ascii=False) + "\n"
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+        if archivo_temporal_path and os.path.exists(archivo_temporal_path):
+            os.remove(archivo_temporal_path)
+            logging.debug("Archivo temporal eliminado: %s", archivo_temporal_path)
+
 @app.route('/api/predict/future_performance', methods=['POST'])
 def predict_future_performance():
-    logging.info("➡️ Se ha llamado al endpoint /api/predict/future_performance.")
+    logging.debug("➡️ Se ha llamado al endpoint /api/predict/future_performance.")
     if ENABLE_AUTH:
-        logging.info("Autenticación habilitada para /api/predict/future_performance. Verificando token...")
+        logging.debug("Autenticación habilitada para /api/predict/future_performance. Verificando token...")
         try:
             token = request.headers.get('Authorization', '').split(" ")[1]
             auth.verify_id_token(token)
-            logging.info("Token de autenticación verificado.")
+            logging.debug("Token de autenticación verificado.")
         except Exception as e:
             logging.error(f"❌ Error de autenticación en /api/predict/future_performance: {e}")
             return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
     else:
-        logging.info("Autenticación deshabilitada para /api/predict/future_performance.")
+        logging.debug("Autenticación deshabilitada para /api/predict/future_performance.")
 
     archivo_temporal_path = None
     conn = None
     cursor = None
-    conn_rules = None
-    cursor_rules = None
 
     try:
         if 'file' not in request.files:
@@ -452,89 +1025,67 @@ def predict_future_performance():
         if id_regla_para_guardar:
             try:
                 id_regla_para_guardar = int(id_regla_para_guardar)
-                logging.info(f"Se recibió id_regla_seleccionada para la predicción: {id_regla_para_guardar}")
+                logging.debug("Se recibió id_regla_seleccionada para la predicción: %s", id_regla_para_guardar)
             except ValueError:
                 logging.warning(f"id_regla_seleccionada no es un entero válido: {request.form.get('id_regla_seleccionada')}. Se ignorará.")
                 id_regla_para_guardar = None # Resetear si no es válido
         else:
-            logging.info("No se recibió id_regla_seleccionada. Se buscará el último id_regla_aplicada del entrenamiento.")
+            logging.debug("No se recibió id_regla_seleccionada. Se buscará el último id_regla_aplicada del entrenamiento.")
             # Si no se selecciona una regla específica, obtenemos la última generada/entrenada
-            try:
-                conn_rules = get_connection()
-                cursor_rules = conn_rules.cursor()
-                cursor_rules.execute("SELECT id_regla FROM reglas_aplicadas ORDER BY fecha_aplicacion DESC LIMIT 1;")
-                result = cursor_rules.fetchone()
-                if result:
-                    id_regla_para_guardar = result[0]
-                    logging.info(f"Obtenido id_regla_aplicada (último entrenamiento) para la predicción: {id_regla_para_guardar}")
-                else:
-                    logging.warning("No se encontró ningún id_regla_aplicada reciente en la base de datos. Se insertará NULL.")
-            except Exception as e_rules:
-                logging.error(f"❌ Error al obtener el último id_regla_aplicada desde la DB: {e_rules}", exc_info=True)
-            finally:
-                if cursor_rules:
-                    cursor_rules.close()
-                if conn_rules:
-                    conn_rules.close()
+            id_regla_para_guardar = obtener_ultimo_id_regla()
+            if id_regla_para_guardar is not None:
+                logging.debug("Obtenido id_regla_aplicada (último entrenamiento) para la predicción: %s", id_regla_para_guardar)
+            else:
+                logging.warning("No se encontró ningún id_regla_aplicada reciente en la base de datos. Se insertará NULL.")
         # --- FIN: Obtener id_regla_seleccionada ---
+        registro_logs.anotar(id_regla=id_regla_para_guardar)
 
-        logging.info(f"Guardando archivo CSV de predicción temporal: {archivo_csv.filename}")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_file:
+        logging.debug("Guardando archivo CSV de predicción temporal: %s", archivo_csv.filename)
+        with metricas.etapa("guardar_archivo"), tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_file:
             archivo_csv.save(tmp_file.name)
             archivo_temporal_path = tmp_file.name
-        logging.info(f"Archivo temporal guardado en: {archivo_temporal_path}")
+        logging.debug("Archivo temporal guardado en: %s", archivo_temporal_path)
 
-        script_path = os.path.join(os.path.dirname(__file__), "Regresion lineal", "predecir_rendimiento_futuro.py")
-        logging.info(f"Ejecutando script de predicción futura: {script_path} con archivo: {archivo_temporal_path}")
-        output = run_script(script_path, archivo_temporal_path)
-        logging.info("Script de predicción futura finalizado exitosamente.")
+        probabilidades = pide_probabilidades()
+        if pide_streaming():
+            # Modo streaming: el CSV se procesa de a lotes y cada lote se guarda y se envía enseguida
+            registro_logs.anotar(streaming=True)
+            logging.debug("Predicción por lotes de %s filas (id_regla=%s).", FILAS_POR_LOTE_PREDICCION, id_regla_para_guardar)
+            lotes = runtime_modelo.predecir_por_lotes(archivo_temporal_path, id_regla_para_guardar, FILAS_POR_LOTE_PREDICCION, probabilidades)
+            respuesta = Response(
+                stream_with_context(generar_prediccion_ndjson(lotes, archivo_temporal_path, id_regla_para_guardar)),
+                mimetype='application/x-ndjson'
+            )
+            archivo_temporal_path = None # Lo borra el generador al terminar
+            return respuesta, 200
+
+        # La predicción corre dentro del worker con el modelo de la regla ya cargado en memoria
+        logging.debug("Ejecutando predicción futura en proceso con archivo: %s (id_regla=%s)", archivo_temporal_path, id_regla_para_guardar)
+        resultados_df = runtime_modelo.predecir_csv(archivo_temporal_path, id_regla_para_guardar, probabilidades)
+        logging.debug("Predicción futura finalizada exitosamente.")
 
         # --- Insertar resultados en la base de datos ---
-        logging.info("Intentando insertar resultados de predicción en random_forest_resultados...")
+        logging.debug("Intentando insertar resultados de predicción en random_forest_resultados...")
         conn = get_connection()
         cursor = conn.cursor()
         
-        query = """
-            INSERT INTO random_forest_resultados
-            (nombre, area, jerarquia, puntaje, cantidad_proyectos, desempenio, personas_equipO, horas_extra, asistencia_puntualidad, desempenio_futuro, fecha, id_regla_aplicada)
-            VALUES %s
-        """
         fecha_actual = datetime.now()
-        # Asegurarse de que estos mapas coincidan con los valores que produce predecir_rendimiento_futuro.py
-        # Si predecir_rendimiento_futuro.py ya devuelve cadenas, no se necesita mapeo aquí.
-        mapa_jerarquia_num_a_str = {0: 'trainee', 1: 'junior', 2: 'senior'}
-        mapa_desempenio_num_a_str = {0: 'bajo', 1: 'medio', 2: 'alto'}
-        mapa_rendimiento_num_a_str = {0: 'bajo', 1: 'medio', 2: 'alto'}
-        
-        if not isinstance(output, list):
-            logging.error(f"El script de predicción futura no devolvió una lista: {output}")
-            raise ValueError("Formato de salida de predicción futura inesperado.")
-
-        valores = [
-            (
-                d.get('nombre'),
-                d.get('area'),
-                # Usar los mapeos solo si el valor es numérico y necesita ser convertido a string
-                mapa_jerarquia_num_a_str.get(d.get('jerarquia'), d.get('jerarquia')),
-                d.get('puntaje'),  
-                d.get('cantidad_proyectos'),
-                mapa_desempenio_num_a_str.get(d.get('desempenio'), d.get('desempenio')),
-                d.get('personas_equipo'),
-                d.get('horas_extra'), 
-                d.get('asistencia_puntualidad'),
-                mapa_rendimiento_num_a_str.get(d.get('desempenio_futuro'), d.get('desempenio_futuro')), # Aquí ya debería ser el rendimiento final del modelo
-                fecha_actual,
-                id_regla_para_guardar # Usamos el ID determinado aquí
-            ) for d in output
-        ]
-        
-        logging.info(f"Preparando inserción de {len(valores)} filas en random_forest_resultados.")
-        execute_values(cursor, query, valores)
-        conn.commit()
-        logging.info("✅ Datos de predicción futura guardados en PostgreSQL exitosamente.")
-        
-        return jsonify({"mensaje": "Datos guardados en PostgreSQL exitosamente", "resultados": output}), 200
+        logging.debug("Preparando inserción de %s filas en random_forest_resultados.", len(resultados_df))
+        with metricas.etapa("escritura_db", filas=len(resultados_df)):
+            carga_resultados.escribir_resultados(cursor, resultados_df, fecha_actual, id_regla_para_guardar)
+            conn.commit()
+        resumen_resultados.refresco_resumen.solicitar()
+        registro_logs.anotar(filas=len(resultados_df))
+        logging.debug("✅ Datos de predicción futura guardados en PostgreSQL exitosamente.")
         
+        with metricas.etapa("serializacion", filas=len(resultados_df)):
+            output = resultados_df.to_dict(orient="records")
+            respuesta = jsonify({"mensaje": "Datos guardados en PostgreSQL exitosamente", "resultados": output})
+        return respuesta, 200
+
+    except ModeloNoEntrenado as e:
+        logging.warning(f"Predicción futura sin modelo entrenado: {e}")
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         logging.error(f"❌ Error general en /api/predict/future_performance: {e}", exc_info=True)
         if conn:
@@ -543,38 +1094,118 @@ def predict_future_performance():
     finally:
         if archivo_temporal_path and os.path.exists(archivo_temporal_path):
             os.remove(archivo_temporal_path)
-            logging.info(f"Archivo temporal eliminado: {archivo_temporal_path}")
+            logging.debug("Archivo temporal eliminado: %s", archivo_temporal_path)
         if cursor:
             cursor.close()
-            logging.info("Cursor de random_forest_resultados cerrado.")
+            logging.debug("Cursor de random_forest_resultados cerrado.")
         if conn:
             conn.close()
-            logging.info("Conexión de random_forest_resultados cerrada.")
+            logging.debug("Conexión de random_forest_resultados cerrada.")
+
+
+# --- ENDPOINT: Predicción de un CSV con varias reglas (multi-regla) ---
+def leer_ids_regla(valor):
+    """
+    Convierte 'ids_regla' (lista JSON o texto separado por comas) en una lista de enteros sin
+    repetidos, en el orden recibido. Lanza ValueError si no es válida.
+    """
+    if isinstance(valor, str):
+        valor = valor.strip()
+        valor = json.loads(valor) if valor.startswith('[') else [v for v in valor.split(',') if v.strip()]
+    if not isinstance(valor, list) or not valor:
+        raise ValueError("ids_regla debe ser una lista con al menos un id de regla")
+    ids_regla = []
+    for id_regla in valor:
+        try:
+            id_regla = int(id_regla)
+        except (TypeError, ValueError):
+            raise ValueError(f"id de regla inválido: {id_regla}")
+        if id_regla not in ids_regla:
+            ids_regla.append(id_regla)
+    if len(ids_regla) > prediccion_multiregla.MAX_REGLAS:
+        raise ValueError(f"Se pueden comparar hasta {prediccion_multiregla.MAX_REGLAS} reglas por vez")
+    return ids_regla
+
+@app.route('/api/predict/future_performance_multi', methods=['POST'])
+def predict_future_performance_multi():
+    logging.debug("➡️ Se ha llamado al endpoint /api/predict/future_performance_multi.")
+    if ENABLE_AUTH:
+        logging.debug("Autenticación habilitada para /api/predict/future_performance_multi. Verificando token...")
+        try:
+            token = request.headers.get('Authorization', '').split(" ")[1]
+            auth.verify_id_token(token)
+            logging.debug("Token de autenticación verificado.")
+        except Exception as e:
+            logging.error(f"❌ Error de autenticación en /api/predict/future_performance_multi: {e}")
+            return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
+    else:
+        logging.debug("Autenticación deshabilitada para /api/predict/future_performance_multi.")
+
+    try:
+        if 'file' not in request.files:
+            logging.warning("No se recibió ningún archivo CSV en la solicitud de predicción multi-regla.")
+            return jsonify({"error": "No se proporcionó ningún archivo CSV"}), 400
+        archivo_csv = request.files['file']
+        if archivo_csv.filename == '' or not archivo_csv.filename.endswith('.csv'):
+            logging.warning(f"Archivo subido inválido: {archivo_csv.filename}")
+            return jsonify({"error": "Por favor, sube un archivo CSV válido"}), 400
+
+        try:
+            ids_regla = leer_ids_regla(request.form.get('ids_regla', ''))
+        except ValueError as e:
+            logging.warning(f"ids_regla inválido en la predicción multi-regla: {e}")
+            return jsonify({"error": str(e)}), 400
+        # Con guardar=0 solo se compara, sin escribir en random_forest_resultados
+        guardar = request.form.get('guardar', '1').lower() not in ('0', 'false', 'no')
+
+        # El CSV se parsea una sola vez para todas las reglas
+        with metricas.etapa("lectura_csv"):
+            nuevos_df = pd.read_csv(archivo_csv, encoding="utf-8")
+        registro_logs.anotar(filas=len(nuevos_df), reglas=len(ids_regla), guardar=guardar)
+        logging.debug("Predicción multi-regla de %s filas con las reglas %s (guardar=%s).", len(nuevos_df), ids_regla, guardar)
+
+        with metricas.etapa("prediccion_multiregla", filas=len(nuevos_df) * len(ids_regla)):
+            comparacion = prediccion_multiregla.predecir_multiregla(nuevos_df, ids_regla, datetime.now(), guardar)
+        errores = [id_regla for id_regla, resultado in comparacion["por_regla"].items() if "error" in resultado]
+        if guardar and len(errores) < len(ids_regla):
+            resumen_resultados.refresco_resumen.solicitar()
+        if len(errores) == len(ids_regla):
+            logging.error(f"❌ Ninguna regla pudo predecirse: {errores}")
+            return jsonify({"error": "No se pudo predecir con ninguna de las reglas", **comparacion}), 500
+        if errores:
+            logging.warning(f"Predicción multi-regla con errores en las reglas {errores}.")
+        else:
+            logging.debug("✅ Predicción multi-regla finalizada exitosamente.")
+        return jsonify({"mensaje": "Predicción multi-regla finalizada", **comparacion}), 200
+
+    except Exception as e:
+        logging.error(f"❌ Error general en /api/predict/future_performance_multi: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
 
 
 # --- ENDPOINT: Obtener reglas previamente aplicadas (LISTA) ---
 @app.route('/api/data/reglas_previas', methods=['GET'])
 def get_reglas_previas():
-    logging.info("➡️ Se ha llamado al endpoint /api/data/reglas_previas.")
+    logging.debug("➡️ Se ha llamado al endpoint /api/data/reglas_previas.")
     if ENABLE_AUTH:
-        logging.info("Autenticación habilitada para /api/data/reglas_previas. Verificando token...")
+        logging.debug("Autenticación habilitada para /api/data/reglas_previas. Verificando token...")
         try:
             token = request.headers.get('Authorization', '').split(" ")[1]
             auth.verify_id_token(token)
-            logging.info("Token de autenticación verificado.")
+            logging.debug("Token de autenticación verificado.")
         except Exception as e:
             logging.error(f"❌ Error de autenticación en /api/data/reglas_previas: {e}")
             return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
     else:
-        logging.info("Autenticación deshabilitada para /api/data/reglas_previas.")
+        logging.debug("Autenticación deshabilitada para /api/data/reglas_previas.")
 
     conn = None
     cursor = None
     try:
-        logging.info("Intentando establecer conexión a la base de datos para obtener reglas previas (lista).")
+        logging.debug("Intentando establecer conexión a la base de datos para obtener reglas previas (lista).")
         conn = get_connection()
         cursor = conn.cursor()
-        logging.info("Conexión a la base de datos establecida.")
+        logging.debug("Conexión a la base de datos establecida.")
         
         cursor.execute("SELECT id_regla, fecha_aplicacion, detalles_reglas FROM reglas_aplicadas ORDER BY fecha_aplicacion DESC;")
         
@@ -595,27 +1226,27 @@ def get_reglas_previas():
     finally:
         if cursor:
             cursor.close()
-            logging.info("Cursor de reglas_aplicadas (lista) cerrado.")
+            logging.debug("Cursor de reglas_aplicadas (lista) cerrado.")
         if conn:
             conn.close()
-            logging.info("Conexión de reglas_aplicadas (lista) cerrada.")
+            logging.debug("Conexión de reglas_aplicadas (lista) cerrada.")
 
 
 # --- ENDPOINT: Obtener una regla específica por ID ---
 @app.route('/api/data/regla_por_id/<int:rule_id>', methods=['GET'])
 def get_regla_por_id(rule_id):
-    logging.info(f"➡️ Se ha llamado al endpoint /api/data/regla_por_id/{rule_id}.")
+    logging.debug("➡️ Se ha llamado al endpoint /api/data/regla_por_id/%s.", rule_id)
     if ENABLE_AUTH:
-        logging.info("Autenticación habilitada para /api/data/regla_por_id. Verificando token...")
+        logging.debug("Autenticación habilitada para /api/data/regla_por_id. Verificando token...")
         try:
             token = request.headers.get('Authorization', '').split(" ")[1]
             auth.verify_id_token(token)
-            logging.info("Token de autenticación verificado.")
+            logging.debug("Token de autenticación verificado.")
         except Exception as e:
             logging.error(f"❌ Error de autenticación en /api/data/regla_por_id: {e}")
             return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
     else:
-        logging.info("Autenticación deshabilitada para /api/data/regla_por_id.")
+        logging.debug("Autenticación deshabilitada para /api/data/regla_por_id.")
 
     conn = None
     cursor = None
@@ -645,75 +1276,300 @@ def get_regla_por_id(rule_id):
     finally:
         if cursor:
             cursor.close()
-            logging.info("Cursor de regla_por_id cerrado.")
+            logging.debug("Cursor de regla_por_id cerrado.")
         if conn:
             conn.close()
-            logging.info("Conexión de regla_por_id cerrada.")
+            logging.debug("Conexión de regla_por_id cerrada.")
 
 
 @app.route('/test', methods=['GET'])
 def test_page():
-    logging.info("Llamada a la ruta '/test'.")
+    logging.debug("Llamada a la ruta '/test'.")
     return send_file('test.html')
 
 @app.route('/interfaz', methods=['GET'])
 def interfaz_page():
-    logging.info("Llamada a la ruta '/interfaz'.")
+    logging.debug("Llamada a la ruta '/interfaz'.")
     with open('interfaz.html', 'r', encoding='utf-8') as f:
         html_content = f.read()
     return render_template_string(html_content)
 
+# Columnas que se pueden pedir en /api/data/regresion (fecha e id van siempre: son la clave de paginación)
+COLUMNAS_REGRESION = [
+    "id", "nombre", "area", "jerarquia", "puntaje", "cantidad_proyectos", "desempenio",
+    "personas_equipo", "horas_extra", "asistencia_puntualidad", "desempenio_futuro",
+    "fecha", "id_regla_aplicada"
+]
+FILAS_POR_LOTE_REGRESION = 2000
+
+def valor_json(valor):
+    """
+    Serializador para json.dumps de los tipos que devuelve psycopg2 (fechas y Decimal).
+    """
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return str(valor)
+
 @app.route('/api/data/regresion', methods=['GET'])
 def get_regresion_data():
-    logging.info("➡️ Se ha llamado al endpoint /api/data/regresion.")
+    """
+    Devuelve las filas de random_forest_resultados como NDJSON (una fila JSON por línea),
+    leídas en lotes desde un cursor del lado del servidor, de la más nueva a la más vieja.
+
+    Parámetros opcionales (query string):
+      columnas           lista separada por comas de columnas a devolver (id y fecha siempre se incluyen)
+      id_regla_aplicada  filtra por regla
+      area               filtra por área
+      desde, hasta       rango de fechas [desde, hasta) en ISO 8601
+      limite             cantidad máxima de filas
+      despues_fecha, despues_id
+                         paginación por clave: fecha e id de la última fila recibida
+    """
+    logging.debug("➡️ Se ha llamado al endpoint /api/data/regresion.")
     if ENABLE_AUTH:
-        logging.info("Autenticación habilitada para /api/data/regresion. Verificando token...")
+        logging.debug("Autenticación habilitada para /api/data/regresion. Verificando token...")
         try:
             token = request.headers.get('Authorization', '').split(" ")[1]
             auth.verify_id_token(token)
-            logging.info("Token de autenticación verificado.")
+            logging.debug("Token de autenticación verificado.")
         except Exception as e:
             logging.error(f"❌ Error de autenticación en /api/data/regresion: {e}")
             return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
     else:
-        logging.info("Autenticación deshabilitada para /api/data/regresion.")
+        logging.debug("Autenticación deshabilitada para /api/data/regresion.")
+
+    # --- Validar parámetros ---
+    try:
+        columnas_pedidas = request.args.get('columnas')
+        if columnas_pedidas:
+            columnas = [c.strip().lower() for c in columnas_pedidas.split(',') if c.strip()]
+            desconocidas = [c for c in columnas if c not in COLUMNAS_REGRESION]
+            if desconocidas:
+                return jsonify({"error": f"Columnas desconocidas: {desconocidas}"}), 400
+            columnas = ['id'] + [c for c in columnas if c not in ('id', 'fecha')] + ['fecha']
+        else:
+            columnas = list(COLUMNAS_REGRESION)
+
+        condiciones = []
+        parametros = []
+        if request.args.get('id_regla_aplicada'):
+            condiciones.append("id_regla_aplicada = %s")
+            parametros.append(int(request.args['id_regla_aplicada']))
+        if request.args.get('area'):
+            condiciones.append("area = %s")
+            parametros.append(request.args['area'])
+        if request.args.get('desde'):
+            condiciones.append("fecha >= %s")
+            parametros.append(datetime.fromisoformat(request.args['desde']))
+        if request.args.get('hasta'):
+            condiciones.append("fecha < %s")
+            parametros.append(datetime.fromisoformat(request.args['hasta']))
+        if request.args.get('despues_fecha') or request.args.get('despues_id'):
+            if not (request.args.get('despues_fecha') and request.args.get('despues_id')):
+                return jsonify({"error": "despues_fecha y despues_id se deben enviar juntos"}), 400
+            # Paginación por clave (fecha, id): continúa justo después de la última fila recibida
+            condiciones.append("(fecha, id) < (%s, %s)")
+            parametros.extend([datetime.fromisoformat(request.args['despues_fecha']), int(request.args['despues_id'])])
+        limite = int(request.args['limite']) if request.args.get('limite') else None
+        if limite is not None and limite <= 0:
+            return jsonify({"error": "limite debe ser mayor a 0"}), 400
+    except ValueError as e:
+        logging.warning(f"Parámetros inválidos en /api/data/regresion: {e}")
+        return jsonify({"error": f"Parámetro inválido: {str(e)}"}), 400
+
+    query = f"SELECT {', '.join(columnas)} FROM random_forest_resultados"
+    if condiciones:
+        query += " WHERE " + " AND ".join(condiciones)
+    query += " ORDER BY fecha DESC, id DESC"
+    if limite is not None:
+        query += " LIMIT %s"
+        parametros.append(limite)
 
     conn = None
     cursor = None
     try:
-        logging.info("Intentando establecer conexión a la base de datos para obtener datos de regresión.")
+        logging.debug("Intentando establecer conexión a la base de datos para obtener datos de regresión.")
         conn = get_connection()
-        cursor = conn.cursor()
-        logging.info("Conexión a la base de datos establecida.")
-        
-        logging.info("Ejecutando consulta SELECT para random_forest_resultados.")
-        cursor.execute("SELECT id,nombre, area, jerarquia, puntaje, cantidad_proyectos, desempenio, personas_equipO, horas_extra, asistencia_puntualidad, desempenio_futuro, fecha, id_regla_aplicada FROM random_forest_resultados ORDER BY fecha DESC")
-        
-        column_names = [desc[0] for desc in cursor.description]
-        logging.info(f"Columnas obtenidas: {column_names}")
-        
-        data = []
-        for row in cursor.fetchall():
-            row_dict = dict(zip(column_names, row))
-            if 'fecha' in row_dict and isinstance(row_dict['fecha'], datetime):
-                row_dict['fecha'] = row_dict['fecha'].isoformat()
-            data.append(row_dict)
-        
-        logging.info(f"Obtenidos {len(data)} filas de datos de regresión. Respondiendo.")
-        return jsonify(data), 200
+        # Cursor con nombre = cursor del lado del servidor: las filas se traen de a lotes
+        cursor = conn.cursor(name="regresion_stream")
+        cursor.itersize = FILAS_POR_LOTE_REGRESION
+        logging.debug("Ejecutando consulta SELECT para random_forest_resultados: %s", query)
+        with metricas.etapa("consulta_db"):
+            cursor.execute(query, parametros)
     except Exception as e:
         logging.error(f"❌ Error al obtener datos de la tabla random_forest_resultados: {e}", exc_info=True)
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), 500
+
+    cerrado = False
+
+    def cerrar():
+        # Se llama al terminar el stream y también desde call_on_close: un HEAD o un cliente que
+        # se desconecta antes del primer lote nunca itera el generador y su finally no corre
+        nonlocal cerrado
+        if cerrado:
+            return
+        cerrado = True
+        cursor.close()
+        conn.close()
+        logging.debug("Cursor y conexión de random_forest_resultados (lectura) cerrados.")
+
+    def generar_filas():
+        filas = 0
+        try:
+            while True:
+                lote = cursor.fetchmany(FILAS_POR_LOTE_REGRESION)
+                if not lote:
+                    break
+                filas += len(lote)
+                yield "".join(
+                    json.dumps(dict(zip(columnas, row)), default=valor_json, ensure_ascii=False) + "\n"
+                    for row in lote
+                )
+            logging.info("Enviadas %s filas de datos de regresión.", filas)
+        except Exception as e:
+            # Los encabezados ya se enviaron: solo queda registrar el error y cortar el stream
+            logging.error(f"❌ Error durante el envío de datos de random_forest_resultados: {e}", exc_info=True)
+        finally:
+            cerrar()
+
+    respuesta = Response(stream_with_context(generar_filas()), mimetype='application/x-ndjson')
+    respuesta.call_on_close(cerrar)
+    return respuesta, 200
+
+def leer_filtros_resumen():
+    """
+    Filtros comunes de las agregaciones: id_regla_aplicada, area, jerarquia y el rango de
+    fechas [desde, hasta) en ISO 8601. Lanza ValueError si alguno es inválido.
+    """
+    return {
+        "id_regla_aplicada": int(request.args['id_regla_aplicada']) if request.args.get('id_regla_aplicada') else None,
+        "area": request.args.get('area') or None,
+        "jerarquia": request.args.get('jerarquia') or None,
+        "desde": datetime.fromisoformat(request.args['desde']) if request.args.get('desde') else None,
+        "hasta": datetime.fromisoformat(request.args['hasta']) if request.args.get('hasta') else None,
+    }
+
+def responder_agregacion(nombre_endpoint, calcular):
+    """
+    Lee los filtros, elige la fuente (vista materializada o tabla, ver ?fuente=) y ejecuta
+    'calcular(cursor, filtros, resumen)'. Si la vista no está disponible, reintenta sobre la tabla.
+    """
+    try:
+        filtros = leer_filtros_resumen()
+        resumen = resumen_resultados.usa_resumen(filtros, request.args.get('fuente') or None)
+    except ValueError as e:
+        logging.warning(f"Parámetros inválidos en {nombre_endpoint}: {e}")
+        return jsonify({"error": f"Parámetro inválido: {str(e)}"}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            with metricas.etapa("consulta_db"):
+                datos = calcular(cursor, filtros, resumen)
+        except ValueError as e:
+            logging.warning(f"Parámetros inválidos en {nombre_endpoint}: {e}")
+            return jsonify({"error": f"Parámetro inválido: {str(e)}"}), 400
+        except Exception as e:
+            if not resumen or request.args.get('fuente') == 'resumen':
+                raise
+            logging.warning(f"Resumen materializado no disponible ({e}); se consulta la tabla.")
+            conn.rollback()
+            resumen = False
+            datos = calcular(cursor, filtros, resumen)
+        registro_logs.anotar(grupos=len(datos), fuente="resumen" if resumen else "tabla")
+        logging.debug("✅ %s: %s grupos (fuente=%s).", nombre_endpoint, len(datos), "resumen" if resumen else "tabla")
+        return jsonify({"fuente": "resumen" if resumen else "tabla", "datos": datos}), 200
+    except Exception as e:
+        logging.error(f"❌ Error en endpoint {nombre_endpoint}: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
             cursor.close()
-            logging.info("Cursor de random_forest_resultados (lectura) cerrado.")
         if conn:
             conn.close()
-            logging.info("Conexión de random_forest_resultados (lectura) cerrada.")
+
+@app.route('/api/data/regresion/conteos', methods=['GET'])
+def get_regresion_conteos():
+    """
+    Cantidad de predicciones por combinación de columnas.
+    Parámetros: agrupar (por defecto desempenio_futuro,area,jerarquia), filtros de
+    leer_filtros_resumen y fuente (tabla o resumen; por defecto el resumen si alcanza).
+    """
+    logging.debug("➡️ Se ha llamado al endpoint /api/data/regresion/conteos.")
+    if ENABLE_AUTH:
+        logging.debug("Autenticación habilitada para /api/data/regresion/conteos. Verificando token...")
+        try:
+            token = request.headers.get('Authorization', '').split(" ")[1]
+            auth.verify_id_token(token)
+            logging.debug("Token de autenticación verificado.")
+        except Exception as e:
+            logging.error(f"❌ Error de autenticación en /api/data/regresion/conteos: {e}")
+            return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
+    else:
+        logging.debug("Autenticación deshabilitada para /api/data/regresion/conteos.")
+
+    agrupar = [c.strip().lower() for c in request.args.get('agrupar', 'desempenio_futuro,area,jerarquia').split(',') if c.strip()]
+    return responder_agregacion(
+        "/api/data/regresion/conteos",
+        lambda cursor, filtros, resumen: resumen_resultados.conteos(cursor, agrupar, filtros, resumen)
+    )
+
+@app.route('/api/data/regresion/por_regla', methods=['GET'])
+def get_regresion_por_regla():
+    """
+    Distribución de desempenio_futuro por id_regla_aplicada (cantidades y porcentajes).
+    """
+    logging.debug("➡️ Se ha llamado al endpoint /api/data/regresion/por_regla.")
+    if ENABLE_AUTH:
+        logging.debug("Autenticación habilitada para /api/data/regresion/por_regla. Verificando token...")
+        try:
+            token = request.headers.get('Authorization', '').split(" ")[1]
+            auth.verify_id_token(token)
+            logging.debug("Token de autenticación verificado.")
+        except Exception as e:
+            logging.error(f"❌ Error de autenticación en /api/data/regresion/por_regla: {e}")
+            return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
+    else:
+        logging.debug("Autenticación deshabilitada para /api/data/regresion/por_regla.")
+
+    return responder_agregacion("/api/data/regresion/por_regla", resumen_resultados.distribucion_por_regla)
+
+@app.route('/api/data/regresion/serie', methods=['GET'])
+def get_regresion_serie():
+    """
+    Serie temporal de predicciones por fecha.
+    Parámetros: intervalo (day, week o month; por defecto day), por (columna para separar
+    cada período, por defecto desempenio_futuro; vacío para solo el total) y los filtros.
+    """
+    logging.debug("➡️ Se ha llamado al endpoint /api/data/regresion/serie.")
+    if ENABLE_AUTH:
+        logging.debug("Autenticación habilitada para /api/data/regresion/serie. Verificando token...")
+        try:
+            token = request.headers.get('Authorization', '').split(" ")[1]
+            auth.verify_id_token(token)
+            logging.debug("Token de autenticación verificado.")
+        except Exception as e:
+            logging.error(f"❌ Error de autenticación en /api/data/regresion/serie: {e}")
+            return jsonify({"error": f"Error de autenticación: {str(e)}"}), 401
+    else:
+        logging.debug("Autenticación deshabilitada para /api/data/regresion/serie.")
+
+    intervalo = request.args.get('intervalo', 'day')
+    por = request.args.get('por', 'desempenio_futuro').strip().lower() or None
+    return responder_agregacion(
+        "/api/data/regresion/serie",
+        lambda cursor, filtros, resumen: resumen_resultados.serie_temporal(cursor, intervalo, filtros, resumen, por)
+    )
 
 if __name__ == '__main__':
     logging.info("Iniciando la aplicación Flask.")
-    with app.app_context(): 
-        init_db_rules()
     app.run(host='0.0.0.0', port=5000, debug=True)
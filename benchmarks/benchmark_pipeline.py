@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import logging
+import platform
+import tempfile
+import resource
+import importlib.util
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Benchmark del pipeline por etapas: generación de datos sintéticos, entrenamiento, predicción,
+# escritura en random_forest_resultados y K-Means de rotación, con datos sembrados de varios
+# tamaños. Cada (etapa, tamaño) corre en un proceso nuevo, así el pico de memoria medido es el
+# de esa etapa y no arrastra lo que dejaron las anteriores. El resultado es un JSON; con
+# --comparar se contrasta contra una corrida anterior y el script termina con código 1 si
+# alguna etapa empeoró más que la tolerancia.
+#
+#   python benchmarks/benchmark_pipeline.py --tamanios 1000,100000 --salida base.json
+#   python benchmarks/benchmark_pipeline.py --tamanios 1000,100000 --comparar base.json
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_REGRESION = os.path.join(RAIZ, "Regresion lineal")
+RUTA_SCRIPT_KMEANS = os.path.join(RAIZ, "K-Means", "K-Means-Rotacion.py")
+
+ETAPAS = ["generacion", "entrenamiento", "prediccion", "escritura_db", "kmeans"]
+TAMANIOS_POR_DEFECTO = [1000, 100000, 1000000]
+
+# Reglas fijas: el dataset de cada tamaño es siempre el mismo para una semilla dada
+REGLAS_BENCHMARK = {
+    "puntaje": {"1": [50, 80]},
+    "horas_extra": {"1": [5, 15]},
+    "desempenio": {"0": [0, 0], "1": [1, 1], "2": [2, 2]},
+}
+# Ciclos de cada empleado en el dataset de rotación (los mismos 13 del dataset real)
+CICLOS_ROTACION = list(range(202404, 202413)) + list(range(202501, 202505))
+
+
+def _importar_modulos():
+    sys.path[:0] = [RAIZ, RUTA_REGRESION]
+    import generar_synthetic_training_data
+    import regresion
+    import predecir_rendimiento_futuro
+    import carga_resultados
+    spec = importlib.util.spec_from_file_location("kmeans_rotacion", RUTA_SCRIPT_KMEANS)
+    kmeans_rotacion = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(kmeans_rotacion)
+    # Los módulos configuran logging en INFO: durante el benchmark solo interesan los errores
+    logging.getLogger().setLevel(logging.WARNING)
+    return generar_synthetic_training_data, regresion, predecir_rendimiento_futuro, carga_resultados, kmeans_rotacion
+
+
+def _reiniciar_pico_rss():
+    # En Linux, escribir 5 en clear_refs reinicia VmHWM (pico de RSS) del proceso
+    try:
+        with open("/proc/self/clear_refs", "w") as archivo:
+            archivo.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb(campo):
+    try:
+        with open("/proc/self/status") as archivo:
+            for linea in archivo:
+                if linea.startswith(campo + ":"):
+                    return round(int(linea.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # Sin /proc: ru_maxrss es el pico de toda la vida del proceso (KB en Linux, bytes en macOS)
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maximo / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _rutas(carpeta, filas):
+    return {
+        "datos": os.path.join(carpeta, f"entrenamiento_{filas}.parquet"),
+        "modelo": os.path.join(carpeta, f"modelo_{filas}.pkl"),
+        "prediccion": os.path.join(carpeta, f"prediccion_{filas}.csv"),
+    }
+
+
+def _dataset_rotacion(filas, semilla):
+    # Una fila por (empleado, ciclo), con incidencias y rendimiento en los rangos del dataset real
+    rng = np.random.RandomState(semilla)
+    posiciones = np.arange(filas)
+    return pd.DataFrame({
+        "Nombre": [f"Empleado {i}" for i in posiciones // len(CICLOS_ROTACION)],
+        "Ausencias Injustificadas": rng.randint(0, 6, filas),
+        "Llegadas tarde": rng.randint(0, 6, filas),
+        "Salidas tempranas": rng.randint(0, 6, filas),
+        "Rendimiento ACTUAL": rng.choice(["Alto", "Bajo", "Medio"], filas, p=[0.4, 0.32, 0.28]),
+        "Ciclo": np.array(CICLOS_ROTACION)[posiciones % len(CICLOS_ROTACION)],
+    })
+
+
+def _preparar(etapa, filas, config, modulos):
+    """
+    Deja listo lo que la etapa necesita (sin medirlo) y devuelve la función a medir, que
+    recibe el número de repetición. Los archivos compartidos entre etapas (dataset, modelo,
+    CSV de predicción) se crean una vez por tamaño en la carpeta de trabajo.
+    """
+    generador, regresion, prediccion, carga_resultados, kmeans_rotacion = modulos
+    rutas = _rutas(config["carpeta"], filas)
+    parametros = {"n_estimators": config["n_estimators"], "n_jobs": config["n_jobs"]}
+    # entrenar_modelo sin id_regla guarda en regresion.ruta_modelo: se redirige a la carpeta de trabajo
+    regresion.ruta_modelo = rutas["modelo"]
+
+    def generar():
+        return generador.generar_datos_sinteticos_con_reglas(REGLAS_BENCHMARK, n_samples=filas, semilla=config["semilla"])
+
+    def entrenar():
+        resultado = json.loads(regresion.entrenar_modelo(None, rutas["datos"], parametros))
+        if "error" in resultado:
+            raise RuntimeError(resultado["error"])
+
+    import dataset_io
+    if etapa in ("entrenamiento", "prediccion", "escritura_db") and not os.path.exists(rutas["datos"]):
+        dataset_io.guardar_dataset(generar(), rutas["datos"])
+    if etapa in ("prediccion", "escritura_db") and not os.path.exists(rutas["modelo"]):
+        entrenar()
+    if etapa in ("prediccion", "escritura_db") and not os.path.exists(rutas["prediccion"]):
+        dataset_io.leer_dataset(rutas["datos"]).drop(columns=["desempenio_futuro"]).to_csv(rutas["prediccion"], index=False)
+
+    if etapa == "generacion":
+        return lambda repeticion: generar()
+    if etapa == "entrenamiento":
+        return lambda repeticion: entrenar()
+    if etapa == "prediccion":
+        datos_modelo = prediccion.cargar_modelo(rutas["modelo"])
+
+        def predecir(repeticion):
+            resultado = prediccion.predecir_rendimiento_futuro(rutas["prediccion"], datos_modelo)
+            if resultado.startswith('{"error"'):
+                raise RuntimeError(json.loads(resultado)["error"])
+        return predecir
+    if etapa == "escritura_db":
+        from pool_postgres import get_connection
+        resultados = prediccion.predecir_dataframe(pd.read_csv(rutas["prediccion"]), prediccion.cargar_modelo(rutas["modelo"]))
+        conn = get_connection()
+        fecha = datetime.now()
+
+        def escribir(repeticion):
+            # Se revierte cada carga: la tabla queda como estaba y cada repetición escribe lo mismo
+            cursor = conn.cursor()
+            try:
+                carga_resultados.escribir_resultados(cursor, resultados, fecha, None)
+            finally:
+                conn.rollback()
+                cursor.close()
+        return escribir
+    if etapa == "kmeans":
+        dataset = _dataset_rotacion(filas, config["semilla"])
+        return lambda repeticion: kmeans_rotacion.calcular_rotacion(dataset.copy())
+    raise ValueError(f"Etapa desconocida: {etapa}")
+
+
+def _percentil(tiempos, p):
+    return round(float(np.percentile(tiempos, p)) * 1000, 3)
+
+
+def medir_etapa(etapa, filas, config):
+    """
+    Corre en un proceso nuevo: prepara la etapa, la repite 'repeticiones' veces (más
+    'calentamiento' repeticiones sin medir) y devuelve latencias, filas por segundo y memoria.
+    """
+    resultado = {"etapa": etapa, "filas": filas}
+    try:
+        modulos = _importar_modulos()
+        ejecutar = _preparar(etapa, filas, config, modulos)
+        for repeticion in range(config["calentamiento"]):
+            ejecutar(repeticion)
+
+        rss_base = _rss_mb("VmRSS")
+        pico_aislado = _reiniciar_pico_rss()
+        tiempos = []
+        for repeticion in range(config["repeticiones"]):
+            inicio = time.perf_counter()
+            ejecutar(repeticion)
+            tiempos.append(time.perf_counter() - inicio)
+    except Exception as e:
+        logging.error(f"❌ Error en la etapa {etapa} con {filas} filas: {e}", exc_info=True)
+        resultado["error"] = str(e)
+        return resultado
+
+    resultado.update({
+        "repeticiones": len(tiempos),
+        "latencia_ms": {
+            "min": _percentil(tiempos, 0),
+            "p50": _percentil(tiempos, 50),
+            "p90": _percentil(tiempos, 90),
+            "p99": _percentil(tiempos, 99),
+            "max": _percentil(tiempos, 100),
+            "media": round(float(np.mean(tiempos)) * 1000, 3),
+        },
+        "filas_por_s": round(filas / float(np.median(tiempos)), 1),
+        "rss_base_mb": rss_base,
+        "rss_pico_mb": _rss_mb("VmHWM"),
+        # Sin clear_refs el pico incluye la preparación de la etapa
+        "rss_pico_aislado": pico_aislado,
+    })
+    return resultado
+
+
+def comparar(resultados, base, tolerancia):
+    """
+    Compara la latencia p50 de cada (etapa, filas) contra la corrida 'base'.
+    Devuelve la lista de comparaciones; 'regresion' es True si empeoró más que 'tolerancia'.
+    """
+    anteriores = {(r["etapa"], r["filas"]): r for r in base["resultados"] if "latencia_ms" in r}
+    comparaciones = []
+    for resultado in resultados:
+        anterior = anteriores.get((resultado["etapa"], resultado["filas"]))
+        if anterior is None or "latencia_ms" not in resultado:
+            continue
+        cociente = resultado["latencia_ms"]["p50"] / anterior["latencia_ms"]["p50"]
+        comparaciones.append({
+            "etapa": resultado["etapa"],
+            "filas": resultado["filas"],
+            "p50_base_ms": anterior["latencia_ms"]["p50"],
+            "p50_ms": resultado["latencia_ms"]["p50"],
+            "cociente": round(cociente, 3),
+            "regresion": cociente > 1 + tolerancia,
+        })
+    return comparaciones
+
+
+def _lista(valor, tipo=str):
+    return [tipo(v.strip()) for v in valor.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline por etapas.")
+    parser.add_argument("--tamanios", type=lambda v: _lista(v, int), default=TAMANIOS_POR_DEFECTO,
+                        help="Cantidades de filas separadas por coma (por defecto 1000,100000,1000000)")
+    parser.add_argument("--etapas", type=_lista, default=ETAPAS, help=f"Etapas separadas por coma: {','.join(ETAPAS)}")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--calentamiento", type=int, default=1, help="Repeticiones sin medir antes de las medidas")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--n_estimators", type=int, default=100, help="Árboles del modelo entrenado")
+    parser.add_argument("--n_jobs", type=int, default=-1, help="Núcleos para el entrenamiento")
+    parser.add_argument("--carpeta", default=None, help="Carpeta de trabajo (por defecto una temporal que se borra al terminar)")
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto se imprime)")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento de p50 tolerado al comparar (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    desconocidas = [etapa for etapa in args.etapas if etapa not in ETAPAS]
+    if desconocidas:
+        parser.error(f"Etapas desconocidas: {desconocidas}")
+
+    carpeta = args.carpeta or tempfile.mkdtemp(prefix="benchmark_pipeline_")
+    os.makedirs(carpeta, exist_ok=True)
+    config = {
+        "carpeta": carpeta,
+        "semilla": args.semilla,
+        "repeticiones": args.repeticiones,
+        "calentamiento": args.calentamiento,
+        "n_estimators": args.n_estimators,
+        "n_jobs": args.n_jobs,
+    }
+
+    resultados = []
+    try:
+        for filas in args.tamanios:
+            for etapa in [etapa for etapa in ETAPAS if etapa in args.etapas]:
+                logging.info(f"➡️ Etapa {etapa} con {filas} filas...")
+                # Un proceso por etapa ('spawn' + max_tasks_per_child=1): memoria medida desde cero
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                         max_tasks_per_child=1) as pool:
+                    resultado = pool.submit(medir_etapa, etapa, filas, config).result()
+                resultados.append(resultado)
+                if "error" in resultado:
+                    logging.error(f"❌ {etapa} ({filas} filas): {resultado['error']}")
+                else:
+                    logging.info(
+                        f"✅ {etapa} ({filas} filas): p50 {resultado['latencia_ms']['p50']} ms, "
+                        f"{resultado['filas_por_s']} filas/s, pico {resultado['rss_pico_mb']} MB"
+                    )
+    finally:
+        if args.carpeta is None:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    salida = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "parametros": {k: v for k, v in config.items() if k != "carpeta"},
+        "resultados": resultados,
+    }
+    regresiones = []
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as archivo:
+            salida["comparacion"] = comparar(resultados, json.load(archivo), args.tolerancia)
+        regresiones = [c for c in salida["comparacion"] if c["regresion"]]
+        for c in regresiones:
+            logging.error(f"❌ Regresión en {c['etapa']} ({c['filas']} filas): p50 {c['p50_base_ms']} -> {c['p50_ms']} ms")
+
+    texto = json.dumps(salida, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto)
+        logging.info(f"Resultados guardados en: {args.salida}")
+    else:
+        print(texto)
+
+    errores = [r for r in resultados if "error" in r]
+    sys.exit(1 if regresiones or errores else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import io
+import os
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Cache de predicciones de desempeño futuro. La clave es (modelo, hash de la fila ya preprocesada):
+# la misma fila con el mismo modelo da siempre las mismas probabilidades, así que en las cargas
+# periódicas (casi los mismos empleados cada semana) solo se calculan las filas nuevas o cambiadas.
+#
+# Nivel 1: memoria del worker, acotada por cantidad de filas, con descarte LRU.
+# Nivel 2 (opcional): tabla cache_predicciones en PostgreSQL, compartida entre workers y reinicios.
+# Sus filas vencen por último uso: cada acierto actualiza 'fecha' (a lo sumo una vez por día y
+# fila, para no reescribir las mismas filas en cada carga) y QUERY_PURGAR borra las que no se
+# usaron en RETENCION_DIAS_POSTGRES días.
+
+CAPACIDAD_FILAS = int(os.environ.get("PREDICCIONES_CACHE_FILAS", 500000))
+USAR_POSTGRES = os.environ.get("PREDICCIONES_CACHE_POSTGRES", "").lower() in ("1", "true", "si", "sí")
+RETENCION_DIAS_POSTGRES = int(os.environ.get("PREDICCIONES_CACHE_RETENCION_DIAS", 30))
+
+QUERY_CREAR_TABLA = '''
+    CREATE TABLE IF NOT EXISTS cache_predicciones (
+        clave_modelo TEXT NOT NULL,
+        hash_fila BIGINT NOT NULL,
+        probabilidades DOUBLE PRECISION[] NOT NULL,
+        fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (clave_modelo, hash_fila)
+    );
+'''
+QUERY_PURGAR = "DELETE FROM cache_predicciones WHERE fecha < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'"
+QUERY_BUSCAR = "SELECT hash_fila, probabilidades FROM cache_predicciones WHERE clave_modelo = %s AND hash_fila = ANY(%s)"
+QUERY_TOCAR = '''
+    UPDATE cache_predicciones SET fecha = CURRENT_TIMESTAMP
+    WHERE clave_modelo = %s AND hash_fila = ANY(%s) AND fecha < CURRENT_TIMESTAMP - INTERVAL '1 day'
+'''
+# Las filas nuevas entran por COPY a una tabla temporal y de ahí a la tabla, salteando las que
+# otro worker ya guardó (COPY no admite ON CONFLICT)
+QUERY_CREAR_TABLA_CARGA = '''
+    CREATE TEMP TABLE IF NOT EXISTS cache_predicciones_carga (
+        clave_modelo TEXT, hash_fila BIGINT, probabilidades DOUBLE PRECISION[]
+    ) ON COMMIT DELETE ROWS;
+'''
+QUERY_COPY_CARGA = "COPY cache_predicciones_carga (clave_modelo, hash_fila, probabilidades) FROM STDIN WITH (FORMAT csv)"
+QUERY_INSERTAR = '''
+    INSERT INTO cache_predicciones (clave_modelo, hash_fila, probabilidades)
+    SELECT clave_modelo, hash_fila, probabilidades FROM cache_predicciones_carga
+    ON CONFLICT DO NOTHING;
+'''
+
+
+def hash_filas(x):
+    """
+    Hash de 64 bits de cada fila de la matriz preprocesada (la que recibe el modelo).
+    Se normaliza -0.0 a 0.0 para que dos filas iguales den siempre el mismo hash.
+    """
+    x = np.asarray(x, dtype=np.float64) + 0.0
+    return pd.util.hash_pandas_object(pd.DataFrame(x), index=False).to_numpy()
+
+
+def _csv_carga(clave_modelo, hashes, proba):
+    # Arrays de PostgreSQL en CSV: "{p0,p1,p2}". astype(str) da la representación más corta
+    # que vuelve al mismo float, así lo leído de la tabla es idéntico a lo calculado.
+    arrays = pd.Series(proba[:, 0].astype(str), dtype=object)
+    for columna in range(1, proba.shape[1]):
+        arrays = arrays + "," + proba[:, columna].astype(str)
+    carga = pd.DataFrame({"clave": clave_modelo, "hash": hashes.view(np.int64), "proba": "{" + arrays + "}"})
+    buffer = io.StringIO()
+    carga.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+def _buscar_ordenado(hashes_ordenados, hashes):
+    # Posición de cada hash en el array ordenado y si realmente está
+    posiciones = np.searchsorted(hashes_ordenados, hashes)
+    posiciones[posiciones == len(hashes_ordenados)] = 0
+    encontrados = hashes_ordenados[posiciones] == hashes
+    return posiciones, encontrados
+
+
+class CachePredicciones:
+    """
+    Por cada modelo se guardan arrays ordenados por hash (hashes, probabilidades y último uso),
+    así buscar o agregar un lote entero son operaciones vectorizadas y no un acceso por fila.
+    Cuando se supera 'capacidad' filas se descartan las usadas hace más tiempo, de cualquier modelo.
+    """
+
+    def __init__(self, capacidad=CAPACIDAD_FILAS, usar_postgres=USAR_POSTGRES):
+        self.capacidad = capacidad
+        self.usar_postgres = usar_postgres
+        self._modelos = OrderedDict()  # clave_modelo -> {"hashes", "proba", "uso"}
+        self._filas = 0
+        self._reloj = 0
+        self._tabla_verificada = False
+        self._lock = threading.Lock()
+        self.estadisticas = {"memoria": 0, "postgres": 0, "calculadas": 0}
+
+    def _buscar_en_memoria(self, clave_modelo, hashes):
+        with self._lock:
+            entrada = self._modelos.get(clave_modelo)
+            if entrada is None:
+                return np.zeros(len(hashes), dtype=bool), None
+            self._reloj += 1
+            posiciones, encontrados = _buscar_ordenado(entrada["hashes"], hashes)
+            entrada["uso"][posiciones[encontrados]] = self._reloj
+            self._modelos.move_to_end(clave_modelo)
+            return encontrados, entrada["proba"][posiciones[encontrados]]
+
+    def _guardar_en_memoria(self, clave_modelo, hashes, proba):
+        if self.capacidad <= 0 or not len(hashes):
+            return
+        with self._lock:
+            self._reloj += 1
+            uso = np.full(len(hashes), self._reloj, dtype=np.int64)
+            entrada = self._modelos.pop(clave_modelo, None)
+            if entrada is not None:
+                # Otro hilo pudo haber guardado algunas de estas filas mientras se calculaban
+                _, repetidos = _buscar_ordenado(entrada["hashes"], hashes)
+                hashes = np.concatenate([entrada["hashes"], hashes[~repetidos]])
+                proba = np.concatenate([entrada["proba"], proba[~repetidos]])
+                uso = np.concatenate([entrada["uso"], uso[~repetidos]])
+                self._filas -= len(entrada["hashes"])
+            orden = np.argsort(hashes, kind="stable")
+            self._modelos[clave_modelo] = {"hashes": hashes[orden], "proba": proba[orden], "uso": uso[orden]}
+            self._filas += len(hashes)
+            self._recortar()
+
+    def _recortar(self):
+        # Descarta las 'sobrantes' filas con el último uso más antiguo (se llama con el lock tomado)
+        sobrantes = self._filas - self.capacidad
+        if sobrantes <= 0:
+            return
+        usos = np.concatenate([entrada["uso"] for entrada in self._modelos.values()])
+        corte = np.partition(usos, sobrantes - 1)[sobrantes - 1]
+        # Las filas con uso == corte se descartan solo hasta completar las sobrantes
+        empates = sobrantes - int(np.count_nonzero(usos < corte))
+        for clave_modelo in list(self._modelos):
+            entrada = self._modelos[clave_modelo]
+            descartar = entrada["uso"] < corte
+            en_corte = np.flatnonzero(entrada["uso"] == corte)[:empates]
+            descartar[en_corte] = True
+            empates -= len(en_corte)
+            if descartar.all():
+                del self._modelos[clave_modelo]
+            elif descartar.any():
+                self._modelos[clave_modelo] = {nombre: array[~descartar] for nombre, array in entrada.items()}
+            self._filas -= int(np.count_nonzero(descartar))
+
+    def _buscar_en_postgres(self, clave_modelo, hashes):
+        from pool_postgres import get_connection
+        conn = None
+        cursor = None
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            if not self._tabla_verificada:
+                # Con gunicorn no corre el init de app.py: la tabla se crea en el primer uso
+                cursor.execute(QUERY_CREAR_TABLA)
+                conn.commit()
+                self._tabla_verificada = True
+            cursor.execute(QUERY_BUSCAR, (clave_modelo, hashes.view(np.int64).tolist()))
+            filas = cursor.fetchall()
+            if filas:
+                # Un solo UPDATE por lote con los aciertos: la retención cuenta desde el último uso
+                try:
+                    cursor.execute(QUERY_TOCAR, (clave_modelo, [fila[0] for fila in filas]))
+                    conn.commit()
+                except Exception as e:
+                    logging.warning(f"No se pudo actualizar la fecha de uso en cache_predicciones: {e}")
+                    conn.rollback()
+        except Exception as e:
+            # La tabla es opcional: si falla, se calculan las filas
+            logging.warning(f"No se pudo leer la cache de predicciones en PostgreSQL: {e}")
+            return np.zeros(len(hashes), dtype=bool), None
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+        if not filas:
+            return np.zeros(len(hashes), dtype=bool), None
+        hashes_db = np.array([fila[0] for fila in filas], dtype=np.int64).view(np.uint64)
+        proba_db = np.array([fila[1] for fila in filas], dtype=np.float64)
+        orden = np.argsort(hashes_db)
+        posiciones, encontrados = _buscar_ordenado(hashes_db[orden], hashes)
+        return encontrados, proba_db[orden][posiciones[encontrados]]
+
+    def _guardar_en_postgres(self, clave_modelo, hashes, proba):
+        from pool_postgres import get_connection
+        conn = None
+        cursor = None
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            cursor.execute(QUERY_CREAR_TABLA_CARGA)
+            cursor.copy_expert(QUERY_COPY_CARGA, _csv_carga(clave_modelo, hashes, proba))
+            cursor.execute(QUERY_INSERTAR)
+            conn.commit()
+        except Exception as e:
+            logging.warning(f"No se pudo guardar la cache de predicciones en PostgreSQL: {e}")
+            if conn:
+                conn.rollback()
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def probabilidades(self, clave_modelo, x, calcular):
+        """
+        Probabilidades por clase de cada fila de 'x' (matriz preprocesada) para el modelo 'clave_modelo'.
+        Solo se pasan a 'calcular' (p. ej. bosque.predict_proba) las filas que no están en cache,
+        y una sola vez cada fila distinta.
+        """
+        hashes = hash_filas(x)
+        unicos, primera_fila, inversa = np.unique(hashes, return_index=True, return_inverse=True)
+        proba_unicos = None
+        pendientes = np.ones(len(unicos), dtype=bool)
+
+        encontrados, proba = self._buscar_en_memoria(clave_modelo, unicos)
+        if encontrados.any():
+            proba_unicos = np.empty((len(unicos), proba.shape[1]), dtype=np.float64)
+            proba_unicos[encontrados] = proba
+            pendientes &= ~encontrados
+        aciertos_memoria = int(np.count_nonzero(encontrados))
+
+        aciertos_postgres = 0
+        if self.usar_postgres and pendientes.any():
+            indices = np.flatnonzero(pendientes)
+            encontrados, proba = self._buscar_en_postgres(clave_modelo, unicos[indices])
+            if encontrados.any():
+                if proba_unicos is None:
+                    proba_unicos = np.empty((len(unicos), proba.shape[1]), dtype=np.float64)
+                proba_unicos[indices[encontrados]] = proba
+                pendientes[indices[encontrados]] = False
+                self._guardar_en_memoria(clave_modelo, unicos[indices[encontrados]], proba)
+            aciertos_postgres = int(np.count_nonzero(encontrados))
+
+        indices = np.flatnonzero(pendientes)
+        if len(indices):
+            proba = np.asarray(calcular(x[primera_fila[indices]]), dtype=np.float64)
+            if proba_unicos is None:
+                proba_unicos = np.empty((len(unicos), proba.shape[1]), dtype=np.float64)
+            proba_unicos[indices] = proba
+            self._guardar_en_memoria(clave_modelo, unicos[indices], proba)
+            if self.usar_postgres:
+                self._guardar_en_postgres(clave_modelo, unicos[indices], proba)
+
+        with self._lock:
+            self.estadisticas["memoria"] += aciertos_memoria
+            self.estadisticas["postgres"] += aciertos_postgres
+            self.estadisticas["calculadas"] += len(indices)
+        logging.debug(
+            "Cache de predicciones (%s): %s filas, %s distintas, %s en memoria, %s en PostgreSQL, %s calculadas.",
+            clave_modelo, len(x), len(unicos), aciertos_memoria, aciertos_postgres, len(indices)
+        )
+        if proba_unicos is None:
+            # Lote vacío
+            return np.asarray(calcular(x), dtype=np.float64)
+        return proba_unicos[inversa]
+
+    def metricas(self):
+        with self._lock:
+            return dict(self.estadisticas, filas_en_memoria=self._filas, modelos_en_memoria=len(self._modelos))
+
+    def invalidar(self, clave_modelo=None):
+        """
+        Vacía la cache en memoria (de un modelo o completa). La tabla de PostgreSQL no se toca:
+        está indexada por versión de modelo, una versión nueva nunca lee filas de otra.
+        """
+        with self._lock:
+            if clave_modelo is None:
+                self._modelos.clear()
+                self._filas = 0
+            else:
+                entrada = self._modelos.pop(clave_modelo, None)
+                if entrada is not None:
+                    self._filas -= len(entrada["hashes"])
+
+
+# Instancia compartida por todos los hilos del worker
+cache_predicciones = CachePredicciones()
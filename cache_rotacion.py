@@ -0,0 +1,138 @@
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+import threading
+import logging
+import importlib.util
+from collections import OrderedDict
+
+# El script de K-Means tiene guiones en el nombre, así que se carga desde su ruta
+RUTA_SCRIPT_KMEANS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "K-Means", "K-Means-Rotacion.py")
+_spec = importlib.util.spec_from_file_location("kmeans_rotacion", RUTA_SCRIPT_KMEANS)
+kmeans_rotacion = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(kmeans_rotacion)
+
+# Se incrementa si cambia la lógica de calcular_rotacion, para no servir resultados viejos de disco
+VERSION_CALCULO = 2
+
+
+def huella_archivo(ruta):
+    """
+    Hash SHA-256 del contenido del archivo.
+    """
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+class CacheRotacion:
+    """
+    Cache de dos niveles (memoria y disco) para el resultado de la rotación por K-Means.
+    La clave es el hash del contenido del dataset más los parámetros del clustering, así que
+    si el Excel cambia, la clave cambia y se recalcula. El hash solo se recalcula cuando
+    cambian el mtime o el tamaño del archivo: una consulta repetida cuesta un stat.
+    """
+
+    def __init__(self, ruta_dataset=kmeans_rotacion.ruta_dataset, carpeta_disco=None, capacidad_memoria=16):
+        self.ruta_dataset = ruta_dataset
+        self.carpeta_disco = carpeta_disco or os.path.join(os.path.dirname(RUTA_SCRIPT_KMEANS), "cache")
+        self.capacidad_memoria = capacidad_memoria
+        self._memoria = OrderedDict()
+        self._huella = None  # (mtime_ns, tamaño, sha256) del dataset
+        self._lock = threading.Lock()
+        self._calculos = {}  # clave -> Lock, para no calcular dos veces lo mismo en paralelo
+        self.estadisticas = {"memoria": 0, "disco": 0, "calculos": 0}
+
+    def _huella_dataset(self):
+        stat = os.stat(self.ruta_dataset)
+        firma = (stat.st_mtime_ns, stat.st_size)
+        huella = self._huella
+        if huella is not None and huella[:2] == firma:
+            return huella[2]
+        sha = huella_archivo(self.ruta_dataset)
+        self._huella = firma + (sha,)
+        return sha
+
+    def _clave(self, n_clusters, random_state):
+        return f"{self._huella_dataset()}_k{n_clusters}_rs{random_state}_v{VERSION_CALCULO}"
+
+    def _guardar_en_memoria(self, clave, entrada):
+        with self._lock:
+            self._memoria[clave] = entrada
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.capacidad_memoria:
+                self._memoria.popitem(last=False)
+
+    def _leer_disco(self, clave):
+        ruta = os.path.join(self.carpeta_disco, f"{clave}.pkl")
+        try:
+            with open(ruta, "rb") as archivo:
+                return pickle.load(archivo)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Entrada de cache de rotación ilegible ({ruta}): {e}. Se recalcula.")
+            return None
+
+    def _escribir_disco(self, clave, entrada):
+        try:
+            os.makedirs(self.carpeta_disco, exist_ok=True)
+            fd, ruta_tmp = tempfile.mkstemp(dir=self.carpeta_disco, suffix=".tmp")
+            with os.fdopen(fd, "wb") as archivo:
+                pickle.dump(entrada, archivo)
+            os.replace(ruta_tmp, os.path.join(self.carpeta_disco, f"{clave}.pkl"))
+        except Exception as e:
+            # La cache en disco es opcional: si falla, se sigue con la de memoria
+            logging.warning(f"No se pudo guardar la cache de rotación en disco: {e}")
+
+    def obtener(self, n_clusters=3, random_state=12):
+        """
+        Devuelve el JSON de resultados de la rotación, calculándolo solo si no está en cache.
+        """
+        clave = self._clave(n_clusters, random_state)
+
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                self._memoria.move_to_end(clave)
+                self.estadisticas["memoria"] += 1
+                return entrada["resultados"]
+            lock_calculo = self._calculos.setdefault(clave, threading.Lock())
+
+        with lock_calculo:
+            # Otro hilo pudo haberlo calculado mientras esperábamos
+            with self._lock:
+                entrada = self._memoria.get(clave)
+            if entrada is None:
+                entrada = self._leer_disco(clave)
+                if entrada is not None:
+                    self.estadisticas["disco"] += 1
+                    logging.info(f"Rotación obtenida de la cache en disco ({clave}).")
+                else:
+                    logging.info(f"Calculando rotación K-Means (n_clusters={n_clusters}, random_state={random_state}).")
+                    dataset = kmeans_rotacion.cargar_dataset(self.ruta_dataset)
+                    resultados, pipeline = kmeans_rotacion.calcular_rotacion(dataset, n_clusters, random_state)
+                    entrada = {"resultados": resultados, "pipeline": pipeline}
+                    self.estadisticas["calculos"] += 1
+                    self._escribir_disco(clave, entrada)
+                self._guardar_en_memoria(clave, entrada)
+
+        with self._lock:
+            self._calculos.pop(clave, None)
+        return entrada["resultados"]
+
+    def invalidar(self):
+        """
+        Vacía la cache en memoria y olvida la huella del dataset (la de disco queda, indexada por contenido).
+        """
+        with self._lock:
+            self._memoria.clear()
+            self._huella = None
+
+
+# Instancia compartida por todos los hilos del worker
+cache_rotacion = CacheRotacion(carpeta_disco=os.environ.get("ROTACION_CACHE_DIR"))
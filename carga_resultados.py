@@ -0,0 +1,82 @@
+import io
+import os
+import logging
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+# Escritura masiva de predicciones en random_forest_resultados. Los lotes grandes entran con
+# COPY ... FROM STDIN (CSV armado directamente desde las columnas del DataFrame); los chicos,
+# donde COPY no compensa, con execute_values.
+
+COLUMNAS_RESULTADOS = [
+    "nombre", "area", "jerarquia", "puntaje", "cantidad_proyectos", "desempenio", "personas_equipo",
+    "horas_extra", "asistencia_puntualidad", "desempenio_futuro", "fecha", "id_regla_aplicada"
+]
+QUERY_INSERT_RESULTADOS = f"INSERT INTO random_forest_resultados ({', '.join(COLUMNAS_RESULTADOS)}) VALUES %s"
+QUERY_COPY_RESULTADOS = (
+    f"COPY random_forest_resultados ({', '.join(COLUMNAS_RESULTADOS)}) "
+    "FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+)
+
+# Filas por cada COPY y mínimo de filas para usar COPY en lugar de execute_values
+FILAS_POR_COPY = int(os.environ.get("RESULTADOS_FILAS_POR_COPY", 50000))
+MINIMO_FILAS_COPY = int(os.environ.get("RESULTADOS_MINIMO_FILAS_COPY", 500))
+
+# Por si la predicción devuelve categorías numéricas en lugar de texto
+MAPAS_NUM_A_STR = {
+    "jerarquia": {0: 'trainee', 1: 'junior', 2: 'senior'},
+    "desempenio": {0: 'bajo', 1: 'medio', 2: 'alto'},
+    "desempenio_futuro": {0: 'bajo', 1: 'medio', 2: 'alto'},
+}
+
+
+def preparar_resultados(df, fecha, id_regla):
+    """
+    Arma el DataFrame a guardar, con las columnas de COLUMNAS_RESULTADOS en orden.
+    Las columnas que falten en 'df' quedan en NULL.
+    """
+    resultados = df.reindex(columns=COLUMNAS_RESULTADOS[:-2])
+    for columna, mapa in MAPAS_NUM_A_STR.items():
+        serie = resultados[columna]
+        resultados[columna] = serie.map(mapa).fillna(serie)
+    resultados["fecha"] = fecha
+    resultados["id_regla_aplicada"] = id_regla
+    return resultados
+
+
+def _a_csv(resultados):
+    # Los float sin decimales (p. ej. una columna entera con algún vacío) se escriben como
+    # enteros: COPY no acepta '12.0' en una columna INTEGER, a diferencia de un INSERT
+    columnas_enteras = {}
+    for columna in resultados.columns:
+        serie = resultados[columna]
+        if pd.api.types.is_float_dtype(serie):
+            valores = serie.to_numpy()
+            finitos = valores[np.isfinite(valores)]
+            if np.array_equal(finitos, np.round(finitos)):
+                columnas_enteras[columna] = serie.astype("Int64")
+    if columnas_enteras:
+        resultados = resultados.assign(**columnas_enteras)
+    buffer = io.StringIO()
+    resultados.to_csv(buffer, header=False, index=False, na_rep="\\N", date_format="%Y-%m-%d %H:%M:%S.%f")
+    buffer.seek(0)
+    return buffer
+
+
+def escribir_resultados(cursor, df, fecha, id_regla, filas_por_copy=FILAS_POR_COPY, minimo_filas_copy=MINIMO_FILAS_COPY):
+    """
+    Guarda las predicciones de 'df' usando el cursor recibido. No hace commit: quien llama
+    decide el alcance de la transacción (una por carga). Devuelve la cantidad de filas escritas.
+    """
+    resultados = preparar_resultados(df, fecha, id_regla)
+    if len(resultados) < minimo_filas_copy:
+        filas = resultados.astype(object).where(resultados.notna(), None).itertuples(index=False, name=None)
+        execute_values(cursor, QUERY_INSERT_RESULTADOS, list(filas))
+        return len(resultados)
+
+    for inicio in range(0, len(resultados), filas_por_copy):
+        lote = resultados.iloc[inicio:inicio + filas_por_copy]
+        cursor.copy_expert(QUERY_COPY_RESULTADOS, _a_csv(lote))
+    logging.debug("COPY de %s filas en random_forest_resultados (lotes de %s).", len(resultados), filas_por_copy)
+    return len(resultados)
@@ -0,0 +1,180 @@
+import uuid
+import time
+import threading
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Estados posibles de un trabajo
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+ERROR = "error"
+CANCELADO = "cancelado"
+
+ESTADOS_FINALES = (COMPLETADO, ERROR, CANCELADO)
+
+
+class ColaLlena(Exception):
+    """Se lanza cuando ya hay demasiados trabajos esperando turno."""
+
+
+class TrabajoCancelado(Exception):
+    """Se lanza dentro de un trabajo cuando se pidió su cancelación."""
+
+
+class Trabajo:
+    """
+    Un trabajo de entrenamiento encolado: guarda su estado, resultado y el subproceso
+    que esté corriendo (si lo hay) para poder cancelarlo.
+    """
+
+    def __init__(self, tipo, parametros=None):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.parametros = parametros or {}
+        self.estado = PENDIENTE
+        self.resultado = None
+        self.error = None
+        self.creado = datetime.now()
+        self.iniciado = None
+        self.finalizado = None
+        self.proceso = None
+        self.future = None
+        self._cancelacion = threading.Event()
+
+    @property
+    def cancelado(self):
+        return self._cancelacion.is_set()
+
+    def verificar_cancelacion(self):
+        """
+        Punto de control entre etapas: corta el trabajo si se pidió cancelarlo.
+        """
+        if self.cancelado:
+            raise TrabajoCancelado(f"Trabajo {self.id} cancelado")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "tipo": self.tipo,
+            "parametros": self.parametros,
+            "estado": self.estado,
+            "resultado": self.resultado,
+            "error": self.error,
+            "creado": self.creado.isoformat(),
+            "iniciado": self.iniciado.isoformat() if self.iniciado else None,
+            "finalizado": self.finalizado.isoformat() if self.finalizado else None,
+        }
+
+
+class ColaTrabajos:
+    """
+    Pool acotado de hilos para los entrenamientos. Los endpoints encolan el trabajo y
+    responden enseguida; el estado y el resultado se consultan después por su id.
+    """
+
+    def __init__(self, max_workers=1, max_pendientes=20, retencion_segundos=3600):
+        self.max_pendientes = max_pendientes
+        self.retencion_segundos = retencion_segundos
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="entrenamiento")
+        self._trabajos = {}
+        self._lock = threading.Lock()
+        self.estadisticas = {"encolados": 0, "rechazados": 0, COMPLETADO: 0, ERROR: 0, CANCELADO: 0}
+
+    def pendientes(self):
+        with self._lock:
+            return sum(1 for t in self._trabajos.values() if t.estado == PENDIENTE)
+
+    def metricas(self):
+        with self._lock:
+            en_cola = sum(1 for t in self._trabajos.values() if t.estado == PENDIENTE)
+            en_curso = sum(1 for t in self._trabajos.values() if t.estado == EN_CURSO)
+            return dict(self.estadisticas, pendientes=en_cola, en_curso=en_curso, max_pendientes=self.max_pendientes)
+
+    def encolar(self, tipo, funcion, *args, parametros=None):
+        """
+        Encola 'funcion(trabajo, *args)' y devuelve el Trabajo creado.
+        La función recibe el propio trabajo para poder llamar a verificar_cancelacion().
+        """
+        self._purgar_finalizados()
+        if self.pendientes() >= self.max_pendientes:
+            with self._lock:
+                self.estadisticas["rechazados"] += 1
+            raise ColaLlena(f"Hay {self.max_pendientes} trabajos esperando. Intentá más tarde.")
+
+        trabajo = Trabajo(tipo, parametros)
+        with self._lock:
+            self._trabajos[trabajo.id] = trabajo
+            self.estadisticas["encolados"] += 1
+        # El trabajo corre con el contexto de quien lo encoló (p. ej. el endpoint, para las métricas)
+        trabajo.future = self._executor.submit(contextvars.copy_context().run, self._ejecutar, trabajo, funcion, *args)
+        logging.info(f"Trabajo {trabajo.id} ({tipo}) encolado.")
+        return trabajo
+
+    def _ejecutar(self, trabajo, funcion, *args):
+        if trabajo.cancelado:
+            # Se canceló cuando el executor ya había tomado el future (future.cancel() dio False)
+            trabajo.estado = CANCELADO
+            trabajo.finalizado = datetime.now()
+            with self._lock:
+                self.estadisticas[CANCELADO] += 1
+            logging.info(f"Trabajo {trabajo.id} ({trabajo.tipo}) cancelado antes de empezar.")
+            return
+        trabajo.estado = EN_CURSO
+        trabajo.iniciado = datetime.now()
+        logging.info(f"Trabajo {trabajo.id} ({trabajo.tipo}) iniciado.")
+        try:
+            trabajo.resultado = funcion(trabajo, *args)
+            trabajo.estado = COMPLETADO
+            logging.info(f"✅ Trabajo {trabajo.id} ({trabajo.tipo}) completado.")
+        except TrabajoCancelado:
+            trabajo.estado = CANCELADO
+            logging.info(f"Trabajo {trabajo.id} ({trabajo.tipo}) cancelado durante la ejecución.")
+        except Exception as e:
+            # Si se canceló matando el subproceso, el error que sube es consecuencia de eso
+            trabajo.estado = CANCELADO if trabajo.cancelado else ERROR
+            trabajo.error = None if trabajo.cancelado else str(e)
+            if not trabajo.cancelado:
+                logging.error(f"❌ Trabajo {trabajo.id} ({trabajo.tipo}) falló: {e}", exc_info=True)
+        finally:
+            trabajo.proceso = None
+            trabajo.finalizado = datetime.now()
+            with self._lock:
+                self.estadisticas[trabajo.estado] += 1
+
+    def obtener(self, job_id):
+        with self._lock:
+            return self._trabajos.get(job_id)
+
+    def cancelar(self, job_id):
+        """
+        Cancela un trabajo pendiente o en curso. Devuelve el trabajo, o None si no existe.
+        """
+        trabajo = self.obtener(job_id)
+        if trabajo is None or trabajo.estado in ESTADOS_FINALES:
+            return trabajo
+
+        trabajo._cancelacion.set()
+        if trabajo.future is not None and trabajo.future.cancel():
+            # Todavía no había empezado: no llega a ejecutarse
+            trabajo.estado = CANCELADO
+            trabajo.finalizado = datetime.now()
+            with self._lock:
+                self.estadisticas[CANCELADO] += 1
+        elif trabajo.proceso is not None and trabajo.proceso.poll() is None:
+            logging.info(f"Terminando subproceso del trabajo {trabajo.id}.")
+            trabajo.proceso.terminate()
+        logging.info(f"Cancelación solicitada para el trabajo {job_id}.")
+        return trabajo
+
+    def _purgar_finalizados(self):
+        limite = time.time() - self.retencion_segundos
+        with self._lock:
+            vencidos = [
+                job_id for job_id, t in self._trabajos.items()
+                if t.estado in ESTADOS_FINALES and t.finalizado and t.finalizado.timestamp() < limite
+            ]
+            for job_id in vencidos:
+                del self._trabajos[job_id]
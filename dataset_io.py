@@ -0,0 +1,177 @@
+import os
+import tempfile
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from pandas.api.types import CategoricalDtype, is_numeric_dtype
+
+# Capa común de lectura/escritura de datasets. Entre etapas del pipeline los datos viajan en
+# Parquet (columnar, tipado y comprimido); CSV y XLSX quedan solo para importar en los bordes.
+
+EXTENSION_COLUMNAR = ".parquet"
+COMPRESION = "zstd"
+# Un dataset fragmentado es una carpeta con un Parquet por fragmento (parte-00000.parquet, ...)
+PREFIJO_FRAGMENTO = "parte-"
+
+# Categorías ordenadas: el código de cada categoría coincide con el mapeo numérico que usa el modelo
+CATEGORIAS_ORDINALES = {
+    'jerarquia': ['trainee', 'junior', 'senior'],
+    'desempenio': ['bajo', 'medio', 'alto'],
+}
+COLUMNAS_CATEGORICAS = ['area', 'jerarquia', 'desempenio']
+
+
+def optimizar_tipos(df):
+    """
+    Convierte las columnas categóricas de texto a dtype 'category'.
+    Las columnas que ya son numéricas (p. ej. jerarquia ya mapeada a 0/1/2) no se tocan.
+    """
+    df = df.copy()
+    for columna in COLUMNAS_CATEGORICAS:
+        if columna in df.columns and df[columna].dtype == 'object':
+            if columna in CATEGORIAS_ORDINALES and df[columna].dropna().isin(CATEGORIAS_ORDINALES[columna]).all():
+                df[columna] = df[columna].astype(CategoricalDtype(CATEGORIAS_ORDINALES[columna], ordered=True))
+            else:
+                df[columna] = df[columna].astype('category')
+    return df
+
+
+def codificar_ordinales(df):
+    """
+    Reemplaza 'jerarquia' y 'desempenio' simbólicos por su código numérico (trainee=0, ..., alto=2),
+    igual que el mapeo con diccionario pero usando los códigos de la categoría.
+    Los valores desconocidos quedan como NaN.
+    """
+    for columna, categorias in CATEGORIAS_ORDINALES.items():
+        if columna not in df.columns or is_numeric_dtype(df[columna]):
+            continue
+        codigos = df[columna].astype(CategoricalDtype(categorias, ordered=True)).cat.codes
+        if (codigos < 0).any():
+            df[columna] = codigos.astype('float64').where(codigos >= 0, np.nan)
+        else:
+            df[columna] = codigos.astype('int64')
+    return df
+
+
+def _escribir_atomico(ruta, escribir):
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(carpeta, exist_ok=True)
+    fd, ruta_tmp = tempfile.mkstemp(dir=carpeta, suffix=".tmp")
+    os.close(fd)
+    try:
+        escribir(ruta_tmp)
+        os.replace(ruta_tmp, ruta)
+    except Exception:
+        if os.path.exists(ruta_tmp):
+            os.unlink(ruta_tmp)
+        raise
+
+
+def guardar_dataset(df, ruta):
+    """
+    Guarda el DataFrame según la extensión de 'ruta' (.parquet, .feather o .csv).
+    La escritura es atómica: un lector concurrente nunca ve un archivo a medio escribir.
+    """
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == EXTENSION_COLUMNAR:
+        df = optimizar_tipos(df)
+        _escribir_atomico(ruta, lambda destino: df.to_parquet(destino, index=False, compression=COMPRESION))
+    elif extension == ".feather":
+        df = optimizar_tipos(df)
+        _escribir_atomico(ruta, lambda destino: df.reset_index(drop=True).to_feather(destino, compression=COMPRESION))
+    elif extension == ".csv":
+        _escribir_atomico(ruta, lambda destino: df.to_csv(destino, index=False, encoding="utf-8"))
+    else:
+        raise ValueError(f"Formato de dataset no soportado: {ruta}")
+    logging.info(f"Dataset guardado en: {ruta} ({len(df)} filas)")
+    return ruta
+
+
+def ruta_fragmento(carpeta, indice):
+    return os.path.join(carpeta, f"{PREFIJO_FRAGMENTO}{indice:05d}{EXTENSION_COLUMNAR}")
+
+
+def fragmentos(carpeta):
+    """
+    Archivos de un dataset fragmentado, en orden.
+    """
+    return sorted(
+        os.path.join(carpeta, nombre) for nombre in os.listdir(carpeta)
+        if nombre.startswith(PREFIJO_FRAGMENTO) and nombre.endswith(EXTENSION_COLUMNAR)
+    )
+
+
+def leer_dataset(ruta, columnas=None):
+    """
+    Lee un dataset según su extensión. Para Parquet/Feather solo se leen las 'columnas' pedidas.
+    Una carpeta se lee como dataset fragmentado (todos sus fragmentos, en orden).
+    """
+    if os.path.isdir(ruta):
+        archivos = fragmentos(ruta)
+        if not archivos:
+            raise ValueError(f"La carpeta no tiene fragmentos de dataset: {ruta}")
+        # pyarrow unifica las categorías de cada fragmento en una sola columna 'category'
+        return pq.ParquetDataset(archivos).read(columns=columnas).to_pandas()
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == EXTENSION_COLUMNAR:
+        return pd.read_parquet(ruta, columns=columnas)
+    if extension == ".feather":
+        return pd.read_feather(ruta, columns=columnas)
+    if extension == ".csv":
+        return pd.read_csv(ruta, encoding="utf-8", usecols=columnas)
+    if extension in (".xlsx", ".xls"):
+        return pd.read_excel(ruta, usecols=columnas)
+    raise ValueError(f"Formato de dataset no soportado: {ruta}")
+
+
+def leer_primeras_filas(ruta, n=10):
+    """
+    Devuelve las primeras 'n' filas sin leer el archivo completo (útil para vistas previas).
+    """
+    if os.path.isdir(ruta):
+        ruta = fragmentos(ruta)[0]
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == EXTENSION_COLUMNAR:
+        lote = next(pq.ParquetFile(ruta).iter_batches(batch_size=n), None)
+        return lote.to_pandas() if lote is not None else pd.DataFrame()
+    if extension == ".csv":
+        return pd.read_csv(ruta, encoding="utf-8", nrows=n)
+    return leer_dataset(ruta).head(n)
+
+
+def contar_filas(ruta):
+    """
+    Cantidad de filas del dataset. En Parquet se lee de los metadatos, sin cargar los datos.
+    """
+    if os.path.isdir(ruta):
+        return sum(pq.ParquetFile(fragmento).metadata.num_rows for fragmento in fragmentos(ruta))
+    if os.path.splitext(ruta)[1].lower() == EXTENSION_COLUMNAR:
+        return pq.ParquetFile(ruta).metadata.num_rows
+    return len(leer_dataset(ruta))
+
+
+def ruta_columnar(ruta):
+    """
+    Ruta del archivo columnar equivalente (misma carpeta y nombre, extensión .parquet).
+    """
+    return os.path.splitext(ruta)[0] + EXTENSION_COLUMNAR
+
+
+def leer_con_copia_columnar(ruta_origen):
+    """
+    Lee un CSV/XLSX de borde usando una copia Parquet al lado del original. La copia se
+    regenera solo si el original es más nuevo, así el parseo de texto se paga una vez.
+    """
+    ruta_copia = ruta_columnar(ruta_origen)
+    mtime_origen = os.path.getmtime(ruta_origen)  # FileNotFoundError si falta el original
+    if os.path.exists(ruta_copia) and os.path.getmtime(ruta_copia) >= mtime_origen:
+        return leer_dataset(ruta_copia)
+
+    df = optimizar_tipos(leer_dataset(ruta_origen))
+    try:
+        guardar_dataset(df, ruta_copia)
+    except Exception as e:
+        # La copia es solo una optimización: si no se puede escribir se sigue con el original
+        logging.warning(f"No se pudo guardar la copia columnar de {ruta_origen}: {e}")
+    return df
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import logging
+from contextlib import contextmanager
+
+# Cada generación/entrenamiento trabaja en su propia carpeta, así dos requests concurrentes
+# (o dos workers de gunicorn) nunca leen ni pisan el dataset del otro. Los artefactos se pasan
+# entre etapas por ruta explícita (argumentos de los scripts), no por un nombre de archivo fijo.
+# Publicar el dataset de una regla no mueve ni borra carpetas: 'regla_<id>.json' apunta a la
+# carpeta vigente (como actual.json en registro_modelos), así un entrenamiento encolado con la
+# ruta anterior la sigue encontrando hasta que limpiar_espacios la borra por antigüedad.
+
+CARPETA_BASE = os.environ.get("ESPACIOS_TRABAJO_DIR") or os.path.join(tempfile.gettempdir(), "rendimiento_espacios")
+NOMBRE_DATASET = "synthetic_training_data.parquet"
+NOMBRE_REGLAS = "reglas.json"
+
+# Los datasets publicados por regla se conservan este tiempo; si se borran, se regeneran desde las reglas
+RETENCION_SEGUNDOS = float(os.environ.get("ESPACIOS_TRABAJO_RETENCION_SEGUNDOS", 24 * 3600))
+
+
+def nuevo_espacio(prefijo="run"):
+    """
+    Crea una carpeta única para una ejecución (p. ej. 'run_k2j3h4_') y devuelve su ruta.
+    """
+    os.makedirs(CARPETA_BASE, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{prefijo}_", dir=CARPETA_BASE)
+
+
+def eliminar_espacio(ruta_espacio):
+    shutil.rmtree(ruta_espacio, ignore_errors=True)
+
+
+@contextmanager
+def espacio_temporal(prefijo="run"):
+    """
+    Carpeta de trabajo que se elimina al salir del bloque, haya error o no.
+    """
+    ruta_espacio = nuevo_espacio(prefijo)
+    try:
+        yield ruta_espacio
+    finally:
+        eliminar_espacio(ruta_espacio)
+
+
+def _ruta_puntero_regla(id_regla):
+    return os.path.join(CARPETA_BASE, f"regla_{int(id_regla)}.json")
+
+
+def ruta_espacio_regla(id_regla):
+    """
+    Carpeta publicada vigente de la regla, o None si nunca se publicó una.
+    """
+    try:
+        with open(_ruta_puntero_regla(id_regla), encoding="utf-8") as archivo:
+            return os.path.join(CARPETA_BASE, json.load(archivo)["espacio"])
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def ruta_dataset(ruta_espacio):
+    return os.path.join(ruta_espacio, NOMBRE_DATASET)
+
+
+def ruta_dataset_regla(id_regla):
+    """
+    Dataset sintético publicado para la regla, o None si ya no está (expiró o lo generó otro host).
+    """
+    ruta_espacio = ruta_espacio_regla(id_regla)
+    if ruta_espacio is None or not os.path.exists(ruta_dataset(ruta_espacio)):
+        return None
+    try:
+        # Quien la usa la mantiene fuera del alcance de limpiar_espacios por otra retención
+        os.utime(ruta_espacio)
+        os.utime(_ruta_puntero_regla(id_regla))
+    except FileNotFoundError:
+        return None
+    return ruta_dataset(ruta_espacio)
+
+
+def publicar_espacio(ruta_espacio, id_regla):
+    """
+    Publica la carpeta de una ejecución como la vigente de la regla, reescribiendo el puntero
+    (rename atómico). La carpeta anterior no se toca: la borra limpiar_espacios cuando vence.
+    """
+    ruta_espacio = os.path.abspath(ruta_espacio)
+    if os.path.dirname(ruta_espacio) != os.path.abspath(CARPETA_BASE):
+        raise ValueError(f"El espacio {ruta_espacio} no está en {CARPETA_BASE}")
+    os.utime(ruta_espacio)
+    fd, ruta_tmp = tempfile.mkstemp(dir=CARPETA_BASE, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as archivo:
+            json.dump({"espacio": os.path.basename(ruta_espacio), "publicado": time.time()}, archivo)
+        os.replace(ruta_tmp, _ruta_puntero_regla(id_regla))
+    finally:
+        if os.path.exists(ruta_tmp):
+            os.unlink(ruta_tmp)
+    limpiar_espacios()
+    return ruta_espacio
+
+
+def limpiar_espacios(retencion_segundos=RETENCION_SEGUNDOS):
+    """
+    Borra las carpetas sin tocar hace más de 'retencion_segundos' (ejecuciones abandonadas por un
+    worker que murió y datasets de reglas viejas o ya reemplazados), y los punteros vencidos.
+    """
+    limite = time.time() - retencion_segundos
+    try:
+        nombres = os.listdir(CARPETA_BASE)
+    except FileNotFoundError:
+        return
+    for nombre in nombres:
+        ruta = os.path.join(CARPETA_BASE, nombre)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                if os.path.isdir(ruta):
+                    eliminar_espacio(ruta)
+                else:
+                    os.remove(ruta)
+                logging.info(f"Espacio de trabajo vencido eliminado: {ruta}")
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,172 @@
+import os
+import math
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Métricas de la API en formato de texto de Prometheus (/metrics), sin dependencias externas.
+# Cada endpoint mide sus etapas con 'etapa(nombre)'; el endpoint se toma del request en curso.
+# Las métricas son por proceso: con varios workers de gunicorn cada uno expone las suyas.
+
+HABILITADAS = os.environ.get("METRICAS_HABILITADAS", "1").lower() not in ("0", "false", "no")
+
+# Límites de los buckets en segundos: de 1 ms a 2 minutos (entrenamientos encolados)
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Endpoint del request en curso (lo fija app.py al empezar cada request)
+endpoint_actual = contextvars.ContextVar("endpoint_actual", default="sin_request")
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    pares = []
+    for clave, valor in etiquetas:
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pares.append(f'{clave}="{valor}"')
+    return "{" + ",".join(pares) + "}"
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Histograma:
+    """
+    Histograma acumulado por combinación de etiquetas, como el de Prometheus.
+    """
+
+    def __init__(self, nombre, ayuda, nombres_etiquetas, buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.nombres_etiquetas = tuple(nombres_etiquetas)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = {"conteos": [0] * len(self.buckets), "suma": 0.0, "cantidad": 0}
+            for indice, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie["conteos"][indice] += 1
+                    break
+            serie["suma"] += valor
+            serie["cantidad"] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = {etiquetas: dict(serie, conteos=list(serie["conteos"])) for etiquetas, serie in self._series.items()}
+        for etiquetas, serie in sorted(series.items()):
+            base = list(zip(self.nombres_etiquetas, etiquetas))
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, serie["conteos"]):
+                acumulado += conteo
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(base + [('le', _numero(limite))])} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(base)} {_numero(serie['suma'])}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(base)} {serie['cantidad']}")
+        return lineas
+
+
+class Contador:
+    """
+    Contador monotónico por combinación de etiquetas.
+    """
+
+    def __init__(self, nombre, ayuda, nombres_etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.nombres_etiquetas = tuple(nombres_etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *etiquetas, cantidad=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            valores = dict(self._valores)
+        for etiquetas, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas(list(zip(self.nombres_etiquetas, etiquetas)))} {_numero(valor)}")
+        return lineas
+
+
+duracion_requests = Histograma(
+    "api_request_duracion_segundos", "Duración total de cada request.", ("endpoint", "metodo", "estado")
+)
+duracion_etapas = Histograma(
+    "api_etapa_duracion_segundos", "Duración de cada etapa de un endpoint.", ("endpoint", "etapa")
+)
+filas_procesadas = Contador(
+    "api_filas_procesadas_total", "Filas procesadas por endpoint y etapa.", ("endpoint", "etapa")
+)
+errores_etapas = Contador(
+    "api_etapa_errores_total", "Etapas que terminaron con una excepción.", ("endpoint", "etapa")
+)
+
+# Fuentes de valores que se leen al exponer: (prefijo, función que devuelve un dict, claves contador)
+_fuentes = []
+
+
+def registrar_fuente(prefijo, funcion, contadores=()):
+    """
+    Registra un componente que ya lleva sus propias métricas (pool, cache, cola...).
+    'funcion' devuelve un dict plano de números; las claves de 'contadores' se exponen como
+    counter (<prefijo>_<clave>_total) y el resto como gauge (<prefijo>_<clave>). Los valores
+    que no son números se ignoran.
+    """
+    _fuentes.append((prefijo, funcion, set(contadores)))
+
+
+@contextmanager
+def etapa(nombre, endpoint=None, filas=None):
+    """
+    Mide la duración del bloque como etapa 'nombre' del endpoint en curso (o de 'endpoint').
+    Con 'filas' también suma esa cantidad de filas procesadas.
+    """
+    if not HABILITADAS:
+        yield
+        return
+    endpoint = endpoint or endpoint_actual.get()
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        errores_etapas.incrementar(endpoint, nombre)
+        raise
+    finally:
+        duracion_etapas.observar(time.perf_counter() - inicio, endpoint, nombre)
+        if filas:
+            filas_procesadas.incrementar(endpoint, nombre, cantidad=filas)
+
+
+def exponer():
+    """
+    Texto para /metrics (formato de exposición de Prometheus 0.0.4).
+    """
+    lineas = []
+    for metrica in (duracion_requests, duracion_etapas, filas_procesadas, errores_etapas):
+        lineas.extend(metrica.exponer())
+    for prefijo, funcion, contadores in _fuentes:
+        try:
+            valores = funcion()
+        except Exception:
+            continue
+        for clave, valor in sorted(valores.items()):
+            if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+                continue
+            es_contador = clave in contadores
+            nombre = f"{prefijo}_{clave}"
+            if es_contador and not clave.endswith("_total"):
+                nombre += "_total"
+            lineas.append(f"# TYPE {nombre} {'counter' if es_contador else 'gauge'}")
+            lineas.append(f"{nombre} {_numero(valor)}")
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,221 @@
+import os
+import time
+import threading
+import logging
+from collections import deque
+
+import config_postgres
+
+
+class PoolAgotado(Exception):
+    """Se lanza cuando no se libera ninguna conexión dentro del tiempo de espera."""
+
+
+class ConexionPool:
+    """
+    Envuelve una conexión prestada por el pool. Se usa igual que una conexión de psycopg2,
+    pero close() la devuelve al pool en lugar de cerrar el socket.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.devolver(self._conn)
+            self._conn = None
+
+    def __getattr__(self, nombre):
+        if self._conn is None:
+            raise AttributeError(f"La conexión ya fue devuelta al pool ('{nombre}')")
+        return getattr(self._conn, nombre)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Igual que psycopg2: commit si no hubo error, rollback si lo hubo (no cierra)
+        return self._conn.__exit__(exc_type, exc, tb)
+
+
+class PoolConexiones:
+    """
+    Pool thread-safe de conexiones PostgreSQL. Las conexiones se crean con 'fabrica'
+    (config_postgres.get_connection), se verifican al prestarse y se reutilizan entre requests.
+    """
+
+    def __init__(self, fabrica, minimo=1, maximo=10, timeout=30, verificar_despues_de=30, max_inactividad=300):
+        self.fabrica = fabrica
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.verificar_despues_de = verificar_despues_de
+        self.max_inactividad = max_inactividad
+        # Conexiones libres como (conexión, momento en que se devolvió)
+        self._libres = deque()
+        self._en_uso = 0
+        self._cond = threading.Condition()
+        self._prellenado = False
+        self._metricas = {
+            "creadas": 0,
+            "reutilizadas": 0,
+            "descartadas": 0,
+            "esperas": 0,
+            "agotado": 0,
+            "segundos_espera_total": 0.0,
+        }
+
+    def _total(self):
+        return len(self._libres) + self._en_uso
+
+    def _prellenar(self):
+        # Abre las 'minimo' conexiones la primera vez que se usa el pool (no al importar,
+        # para que la app levante aunque la base no esté disponible todavía)
+        with self._cond:
+            if self._prellenado:
+                return
+            self._prellenado = True
+        for _ in range(self.minimo):
+            try:
+                conn = self.fabrica()
+            except Exception as e:
+                logging.warning(f"No se pudo abrir una conexión inicial del pool: {e}")
+                return
+            with self._cond:
+                self._metricas["creadas"] += 1
+                self._libres.append((conn, time.monotonic()))
+
+    def _esta_sana(self, conn, devuelta_en):
+        if conn.closed:
+            return False
+        if time.monotonic() - devuelta_en < self.verificar_despues_de:
+            return True
+        # Conexión inactiva hace rato: el servidor o un proxy pudo haberla cortado
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _descartar(self, conn):
+        self._metricas["descartadas"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def obtener(self):
+        """
+        Presta una conexión sana del pool (o abre una nueva si hay lugar).
+        Espera hasta 'timeout' segundos si todas están en uso.
+        """
+        if not self._prellenado:
+            self._prellenar()
+
+        inicio = time.monotonic()
+        while True:
+            libre = None
+            with self._cond:
+                while not self._libres and self._total() >= self.maximo:
+                    restante = self.timeout - (time.monotonic() - inicio)
+                    if restante <= 0:
+                        self._metricas["agotado"] += 1
+                        raise PoolAgotado(f"No hay conexiones libres en el pool (máximo {self.maximo}).")
+                    self._metricas["esperas"] += 1
+                    self._cond.wait(restante)
+                if self._libres:
+                    libre = self._libres.pop()
+                self._en_uso += 1
+                self._metricas["segundos_espera_total"] += time.monotonic() - inicio
+
+            if libre is None:
+                try:
+                    conn = self.fabrica()
+                except Exception:
+                    with self._cond:
+                        self._en_uso -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._metricas["creadas"] += 1
+                return ConexionPool(self, conn)
+
+            conn, devuelta_en = libre
+            if self._esta_sana(conn, devuelta_en):
+                with self._cond:
+                    self._metricas["reutilizadas"] += 1
+                return ConexionPool(self, conn)
+
+            logging.warning("Conexión del pool descartada por no responder. Se intenta con otra.")
+            with self._cond:
+                self._descartar(conn)
+                self._en_uso -= 1
+
+    def devolver(self, conn):
+        """
+        Recibe una conexión prestada. Se descarta cualquier transacción abierta antes de reutilizarla.
+        """
+        reutilizable = not conn.closed
+        if reutilizable:
+            try:
+                conn.rollback()
+            except Exception:
+                reutilizable = False
+
+        with self._cond:
+            self._en_uso -= 1
+            if reutilizable:
+                self._libres.append((conn, time.monotonic()))
+            else:
+                self._descartar(conn)
+            self._recortar_inactivas()
+            self._cond.notify()
+
+    def _recortar_inactivas(self):
+        # Cierra las conexiones libres que llevan mucho sin usarse, respetando el mínimo
+        limite = time.monotonic() - self.max_inactividad
+        while self._libres and self._total() > self.minimo and self._libres[0][1] < limite:
+            conn, _ = self._libres.popleft()
+            self._descartar(conn)
+
+    def metricas(self):
+        with self._cond:
+            return dict(
+                self._metricas,
+                minimo=self.minimo,
+                maximo=self.maximo,
+                en_uso=self._en_uso,
+                libres=len(self._libres),
+            )
+
+    def cerrar(self):
+        with self._cond:
+            while self._libres:
+                conn, _ = self._libres.popleft()
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+# Pool compartido por todos los hilos del worker
+pool = PoolConexiones(
+    config_postgres.get_connection,
+    minimo=int(os.environ.get("POSTGRES_POOL_MIN", 1)),
+    maximo=int(os.environ.get("POSTGRES_POOL_MAX", 10)),
+    timeout=float(os.environ.get("POSTGRES_POOL_TIMEOUT", 30)),
+    verificar_despues_de=float(os.environ.get("POSTGRES_POOL_VERIFICAR_SEGUNDOS", 30)),
+    max_inactividad=float(os.environ.get("POSTGRES_POOL_MAX_INACTIVIDAD", 300)),
+)
+
+
+def get_connection():
+    """
+    Reemplazo directo de config_postgres.get_connection: presta una conexión del pool.
+    Llamar a close() sobre ella la devuelve al pool.
+    """
+    return pool.obtener()
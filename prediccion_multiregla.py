@@ -0,0 +1,174 @@
+import os
+import threading
+import logging
+import multiprocessing
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+
+import dataset_io
+import espacios_trabajo
+import registro_logs
+
+# Predicción de un mismo CSV con los modelos de varias reglas, para comparar resultados.
+# El CSV se parsea una sola vez y se deja en Feather dentro de un espacio de trabajo; cada regla
+# se predice y se guarda en un proceso del pool, así el tiempo total depende de la cantidad de
+# núcleos y no de la cantidad de reglas. Los procesos son persistentes: cada uno mantiene su
+# propio registro de modelos en memoria entre requests.
+
+PROCESOS = int(os.environ.get("PREDICCION_MULTI_PROCESOS", 0)) or os.cpu_count() or 1
+MAX_REGLAS = int(os.environ.get("PREDICCION_MULTI_MAX_REGLAS", 20))
+# Filas con predicciones distintas entre reglas que se devuelven como ejemplo
+MAX_FILAS_DIFERENCIAS = int(os.environ.get("PREDICCION_MULTI_MAX_DIFERENCIAS", 1000))
+
+NOMBRE_ENTRADA = "entrada.feather"
+ETIQUETAS = ['bajo', 'medio', 'alto']
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def _obtener_pool():
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            # 'spawn': forkear un worker de gunicorn con varios hilos puede heredar locks tomados
+            # Los procesos escriben el log sin hilo propio: al terminar no corren los atexit
+            _pool = ProcessPoolExecutor(max_workers=PROCESOS, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=registro_logs.configurar, initargs=(None, False))
+            logging.info(f"Pool de predicción multi-regla creado con {PROCESOS} procesos.")
+        return _pool
+
+
+def _descartar_pool(pool):
+    # Un proceso que muere deja el pool inutilizable: se descarta y el próximo request crea otro
+    global _pool
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _predecir_regla(ruta_entrada, id_regla, fecha, guardar):
+    """
+    Corre dentro de un proceso del pool: predice la entrada con el modelo registrado de la regla
+    y, con 'guardar', escribe el resultado en random_forest_resultados (una transacción por regla).
+    Devuelve solo lo necesario para comparar: códigos de etiqueta y agregados.
+    """
+    from runtime_modelo import runtime_modelo
+
+    version, _ = runtime_modelo.registro.obtener(id_regla)
+    if version is None:
+        raise ValueError(f"La regla {id_regla} no tiene un modelo entrenado")
+
+    nuevos_df = dataset_io.leer_dataset(ruta_entrada)
+    resultados = runtime_modelo.predecir_dataframe(nuevos_df, id_regla, probabilidades=True)
+
+    filas_guardadas = 0
+    if guardar:
+        import carga_resultados
+        from pool_postgres import get_connection
+        conn = None
+        cursor = None
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            filas_guardadas = carga_resultados.escribir_resultados(cursor, resultados, fecha, id_regla)
+            conn.commit()
+        except Exception:
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    codigos = pd.Categorical(resultados["desempenio_futuro"], categories=ETIQUETAS).codes
+    columnas_probabilidad = [c for c in resultados.columns if c.startswith("probabilidad_")]
+    return {
+        "version": version,
+        "codigos": codigos.astype(np.int8),
+        "probabilidad_media": {c[len("probabilidad_"):]: float(resultados[c].mean()) for c in columnas_probabilidad},
+        "filas_guardadas": filas_guardadas,
+    }
+
+
+def _comparar(nuevos_df, ids_regla, resultados):
+    # Distribución por regla, acuerdo entre cada par de reglas y filas donde no coinciden
+    por_regla = {}
+    codigos = {}
+    for id_regla in ids_regla:
+        resultado = resultados[id_regla]
+        if "error" in resultado:
+            por_regla[id_regla] = {"error": resultado["error"]}
+            continue
+        codigos[id_regla] = resultado["codigos"]
+        conteos = np.bincount(resultado["codigos"][resultado["codigos"] >= 0], minlength=len(ETIQUETAS))
+        por_regla[id_regla] = {
+            "version": resultado["version"],
+            "distribucion": dict(zip(ETIQUETAS, conteos.tolist())),
+            "probabilidad_media": resultado["probabilidad_media"],
+            "filas_guardadas": resultado["filas_guardadas"],
+        }
+
+    acuerdo = [
+        {"regla_a": a, "regla_b": b, "acuerdo": round(float(np.mean(codigos[a] == codigos[b])) * 100, 2) if len(nuevos_df) else 100.0}
+        for a, b in combinations(codigos, 2)
+    ]
+
+    diferencias = []
+    filas_con_diferencias = 0
+    if len(codigos) > 1:
+        matriz = np.column_stack(list(codigos.values()))
+        distintas = np.flatnonzero((matriz != matriz[:, :1]).any(axis=1))
+        filas_con_diferencias = len(distintas)
+        nombres = nuevos_df["nombre"].astype(object) if "nombre" in nuevos_df.columns else None
+        for fila in distintas[:MAX_FILAS_DIFERENCIAS]:
+            diferencias.append({
+                "fila": int(fila),
+                "nombre": None if nombres is None else nombres.iloc[fila],
+                "predicciones": {id_regla: ETIQUETAS[matriz[fila, i]] for i, id_regla in enumerate(codigos)},
+            })
+
+    return {
+        "filas": len(nuevos_df),
+        "por_regla": por_regla,
+        "acuerdo": acuerdo,
+        "filas_con_diferencias": filas_con_diferencias,
+        "diferencias": diferencias,
+    }
+
+
+def predecir_multiregla(nuevos_df, ids_regla, fecha, guardar=True):
+    """
+    Predice 'nuevos_df' con el modelo de cada regla de 'ids_regla' en paralelo y devuelve la
+    comparación. Cada regla que falla queda con su 'error' sin afectar a las demás.
+    """
+    pool = _obtener_pool()
+    resultados = {}
+    with espacios_trabajo.espacio_temporal("multiregla") as ruta_espacio:
+        ruta_entrada = os.path.join(ruta_espacio, NOMBRE_ENTRADA)
+        dataset_io.guardar_dataset(nuevos_df, ruta_entrada)
+
+        try:
+            futuros = {id_regla: pool.submit(_predecir_regla, ruta_entrada, id_regla, fecha, guardar) for id_regla in ids_regla}
+        except BrokenProcessPool:
+            _descartar_pool(pool)
+            raise
+
+        for id_regla, futuro in futuros.items():
+            try:
+                resultados[id_regla] = futuro.result()
+                logging.info(f"Regla {id_regla} predicha ({resultados[id_regla]['filas_guardadas']} filas guardadas).")
+            except BrokenProcessPool as e:
+                _descartar_pool(pool)
+                resultados[id_regla] = {"error": f"El proceso de predicción terminó inesperadamente: {e}"}
+            except Exception as e:
+                logging.error(f"❌ Error al predecir con la regla {id_regla}: {e}")
+                resultados[id_regla] = {"error": str(e)}
+
+    return _comparar(nuevos_df, ids_regla, resultados)
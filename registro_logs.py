@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+import contextvars
+from datetime import datetime, timezone
+
+# Configuración de logging de la API y de los scripts. Según el perfil (LOG_PERFIL) los mensajes
+# salen como texto o como JSON de una línea, y se escriben desde un hilo propio (QueueHandler +
+# QueueListener) para que el request no espere la escritura en stdout/stderr de gunicorn.
+# Los pasos internos de cada request se loguean en DEBUG; en INFO queda un resumen por request
+# (muestreado) con los datos que cada endpoint agrega con 'anotar'.
+# Cada variable LOG_* pisa el valor del perfil.
+
+PERFILES = {
+    "desarrollo": {"nivel": "DEBUG", "formato": "texto", "asincrono": False, "muestreo": 1.0, "lento_ms": 0},
+    "produccion": {"nivel": "INFO", "formato": "json", "asincrono": True, "muestreo": 0.1, "lento_ms": 1000},
+}
+PERFIL_POR_DEFECTO = "desarrollo"
+
+FORMATO_TEXTO = '%(asctime)s - %(levelname)s - %(message)s'
+# Máximo de mensajes esperando al hilo de escritura; si se llena se descartan los de nivel < ERROR
+MAX_COLA = int(os.environ.get("LOG_MAX_COLA", 10000))
+# Largo máximo de los payloads que se loguean con json_diferido
+MAX_PAYLOAD = int(os.environ.get("LOG_MAX_PAYLOAD", 2000))
+# Librerías que en DEBUG escriben por cada conexión o archivo
+LOGGERS_RUIDOSOS = ["urllib3", "google", "grpc", "matplotlib", "PIL", "werkzeug", "cachecontrol"]
+
+logger_requests = logging.getLogger("api.requests")
+
+# Campos del resumen del request en curso (los fija app.py al empezar cada request)
+_campos_request = contextvars.ContextVar("campos_request", default=None)
+
+_estado = {"config": None, "listener": None, "manejador_cola": None}
+
+
+def _leer_config(perfil=None):
+    perfil = perfil or os.environ.get("LOG_PERFIL", PERFIL_POR_DEFECTO)
+    if perfil not in PERFILES:
+        raise ValueError(f"LOG_PERFIL debe ser uno de {sorted(PERFILES)}")
+    config = dict(PERFILES[perfil], perfil=perfil)
+    config["nivel"] = os.environ.get("LOG_NIVEL", config["nivel"]).upper()
+    config["formato"] = os.environ.get("LOG_FORMATO", config["formato"])
+    if "LOG_ASINCRONO" in os.environ:
+        config["asincrono"] = os.environ["LOG_ASINCRONO"].lower() not in ("0", "false", "no")
+    config["muestreo"] = float(os.environ.get("LOG_MUESTREO_REQUESTS", config["muestreo"]))
+    config["lento_ms"] = float(os.environ.get("LOG_REQUEST_LENTO_MS", config["lento_ms"]))
+    if config["formato"] not in ("texto", "json"):
+        raise ValueError("LOG_FORMATO debe ser 'texto' o 'json'")
+    return config
+
+
+class FormateadorTexto(logging.Formatter):
+    """
+    El formato de siempre, con los campos estructurados del mensaje al final (clave=valor).
+    """
+
+    def format(self, record):
+        texto = super().format(record)
+        campos = getattr(record, "campos", None)
+        if campos:
+            texto += " | " + " ".join(f"{clave}={valor}" for clave, valor in campos.items())
+        return texto
+
+
+class FormateadorJSON(logging.Formatter):
+    """
+    Un objeto JSON por línea, con los campos estructurados del mensaje como claves propias.
+    """
+
+    def format(self, record):
+        registro = {
+            "fecha": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "proceso": record.process,
+            "mensaje": record.getMessage(),
+        }
+        campos = getattr(record, "campos", None)
+        if campos:
+            registro.update(campos)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            registro["excepcion"] = record.exc_text
+        return json.dumps(registro, ensure_ascii=False, default=str)
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    QueueHandler que no bloquea: en el hilo del request solo se resuelve el texto del mensaje
+    (los argumentos pueden cambiar después) y el traceback; la fecha, el formato y la escritura
+    quedan para el hilo del listener. Con la cola llena se descartan los mensajes de nivel
+    menor a ERROR y se cuentan en 'descartados'.
+    """
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        mensaje = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = mensaje
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.ERROR:
+                self.queue.put(record, timeout=1)
+            else:
+                self.descartados += 1
+
+
+def configurar(perfil=None, asincrono=None):
+    """
+    Configura el logger raíz según el perfil (o LOG_PERFIL) y las variables LOG_*.
+    Reemplaza cualquier configuración anterior, incluida la de un logging.basicConfig.
+    Con 'asincrono' se fuerza el modo de escritura (p. ej. False en procesos de un pool,
+    que terminan sin correr los atexit y perderían lo que quede en la cola).
+    """
+    config = _leer_config(perfil)
+    if asincrono is not None:
+        config["asincrono"] = asincrono
+    detener()
+
+    salida = logging.StreamHandler(sys.stderr)
+    salida.setFormatter(FormateadorJSON() if config["formato"] == "json" else FormateadorTexto(FORMATO_TEXTO))
+
+    raiz = logging.getLogger()
+    for manejador in list(raiz.handlers):
+        raiz.removeHandler(manejador)
+    if config["asincrono"]:
+        manejador_cola = ManejadorCola(queue.Queue(MAX_COLA))
+        listener = logging.handlers.QueueListener(manejador_cola.queue, salida)
+        listener.start()
+        raiz.addHandler(manejador_cola)
+        _estado["listener"] = listener
+        _estado["manejador_cola"] = manejador_cola
+    else:
+        raiz.addHandler(salida)
+        _estado["manejador_cola"] = None
+    raiz.setLevel(config["nivel"])
+    for nombre in LOGGERS_RUIDOSOS:
+        logging.getLogger(nombre).setLevel(max(logging.INFO, raiz.level))
+    _estado["config"] = config
+    return config
+
+
+def detener():
+    """
+    Escribe lo que quede en la cola y detiene el hilo de escritura (si lo hay).
+    """
+    listener = _estado["listener"]
+    if listener is not None:
+        _estado["listener"] = None
+        listener.stop()
+
+
+atexit.register(detener)
+
+
+def metricas():
+    config = _estado["config"] or {}
+    manejador_cola = _estado["manejador_cola"]
+    return {
+        "asincrono": bool(config.get("asincrono")),
+        "en_cola": manejador_cola.queue.qsize() if _estado["listener"] else 0,
+        "descartados": manejador_cola.descartados if manejador_cola else 0,
+        "muestreo_requests": config.get("muestreo", 1.0),
+    }
+
+
+class Diferido:
+    """
+    Valor de un mensaje de log que se calcula recién al formatearlo, es decir, solo si el
+    nivel del mensaje está habilitado: logging.debug("Reglas: %s", Diferido(json.dumps, reglas)).
+    """
+
+    __slots__ = ("funcion", "args", "kwargs")
+
+    def __init__(self, funcion, *args, **kwargs):
+        self.funcion = funcion
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.funcion(*self.args, **self.kwargs))
+
+
+def _json_recortado(valor, limite):
+    texto = json.dumps(valor, ensure_ascii=False, default=str)
+    if len(texto) > limite:
+        return f"{texto[:limite]}... ({len(texto)} caracteres)"
+    return texto
+
+
+def json_diferido(valor, limite=MAX_PAYLOAD):
+    """
+    JSON compacto y recortado a 'limite' caracteres, calculado solo si el mensaje se escribe.
+    """
+    return Diferido(_json_recortado, valor, limite)
+
+
+def iniciar_request():
+    _campos_request.set({})
+
+
+def anotar(**campos):
+    """
+    Agrega campos al resumen del request en curso (filas, id_regla, fuente...).
+    Fuera de un request no hace nada.
+    """
+    actuales = _campos_request.get()
+    if actuales is not None:
+        actuales.update(campos)
+
+
+def resumir_request(metodo, ruta, endpoint, estado, duracion_s):
+    """
+    Escribe una línea por request con su duración y los campos anotados. Los errores y los
+    requests lentos se escriben siempre; el resto con probabilidad LOG_MUESTREO_REQUESTS.
+    """
+    config = _estado["config"] or PERFILES[PERFIL_POR_DEFECTO]
+    duracion_ms = round(duracion_s * 1000, 1)
+    campos = _campos_request.get() or {}
+    _campos_request.set(None)
+    if estado >= 500:
+        nivel = logging.ERROR
+    elif estado >= 400:
+        nivel = logging.WARNING
+    elif config["lento_ms"] and duracion_ms >= config["lento_ms"]:
+        nivel = logging.WARNING
+    elif random.random() < config["muestreo"]:
+        nivel = logging.INFO
+    else:
+        return
+    if not logger_requests.isEnabledFor(nivel):
+        return
+    logger_requests.log(
+        nivel, "%s %s -> %s en %s ms", metodo, ruta, estado, duracion_ms,
+        extra={"campos": dict(campos, metodo=metodo, endpoint=endpoint, estado=estado, duracion_ms=duracion_ms)}
+    )
@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+from pool_postgres import get_connection
+
+# Agregaciones de random_forest_resultados para los gráficos del dashboard, calculadas en
+# PostgreSQL: el cliente recibe unas decenas de números en lugar de la tabla completa.
+# Opcionalmente se leen de una vista materializada con conteos por día, regla, área, jerarquía
+# y desempeño futuro, que se refresca en segundo plano después de cada carga de predicciones.
+
+USAR_RESUMEN = os.environ.get("RESULTADOS_RESUMEN", "1").lower() not in ("0", "false", "no")
+
+DIMENSIONES = ["desempenio_futuro", "area", "jerarquia", "id_regla_aplicada"]
+INTERVALOS = ["day", "week", "month"]
+ETIQUETAS = ['bajo', 'medio', 'alto']
+
+QUERY_CREAR_RESUMEN = '''
+    CREATE MATERIALIZED VIEW IF NOT EXISTS resumen_resultados_diario AS
+        SELECT date_trunc('day', fecha) AS dia, id_regla_aplicada, area, jerarquia, desempenio_futuro,
+               count(*) AS cantidad
+        FROM random_forest_resultados
+        GROUP BY 1, 2, 3, 4, 5;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_resumen_resultados_diario
+        ON resumen_resultados_diario (dia, id_regla_aplicada, area, jerarquia, desempenio_futuro);
+'''
+# CONCURRENTLY: las consultas del dashboard siguen leyendo la versión anterior mientras se refresca
+QUERY_REFRESCAR_RESUMEN = "REFRESH MATERIALIZED VIEW CONCURRENTLY resumen_resultados_diario"
+
+
+def _alineada_a_dia(fecha):
+    return fecha is None or (fecha.hour, fecha.minute, fecha.second, fecha.microsecond) == (0, 0, 0, 0)
+
+
+def usa_resumen(filtros, fuente=None):
+    """
+    Decide si la consulta se responde desde la vista materializada. Con fuente=None se usa si
+    está habilitada y el rango pedido cae en días completos (la vista no tiene más detalle).
+    """
+    if fuente == "tabla":
+        return False
+    alineado = _alineada_a_dia(filtros.get("desde")) and _alineada_a_dia(filtros.get("hasta"))
+    if fuente == "resumen":
+        if not alineado:
+            raise ValueError("Con fuente=resumen, desde y hasta deben ser fechas sin hora")
+        return True
+    if fuente is not None:
+        raise ValueError("fuente debe ser 'tabla' o 'resumen'")
+    return USAR_RESUMEN and alineado
+
+
+def _consulta(agrupar, filtros, resumen, intervalo=None):
+    """
+    Arma el SELECT agrupado por 'agrupar' (y por período si hay 'intervalo').
+    El rango de fechas es [desde, hasta).
+    """
+    if resumen:
+        tabla, columna_fecha, conteo = "resumen_resultados_diario", "dia", "sum(cantidad)::bigint"
+    else:
+        tabla, columna_fecha, conteo = "random_forest_resultados", "fecha", "count(*)"
+
+    columnas = list(agrupar)
+    if intervalo is not None:
+        columnas = [f"date_trunc('{intervalo}', {columna_fecha}) AS periodo"] + columnas
+
+    condiciones = []
+    parametros = []
+    for columna in ("id_regla_aplicada", "area", "jerarquia"):
+        if filtros.get(columna) is not None:
+            condiciones.append(f"{columna} = %s")
+            parametros.append(filtros[columna])
+    if filtros.get("desde") is not None:
+        condiciones.append(f"{columna_fecha} >= %s")
+        parametros.append(filtros["desde"])
+    if filtros.get("hasta") is not None:
+        condiciones.append(f"{columna_fecha} < %s")
+        parametros.append(filtros["hasta"])
+
+    query = f"SELECT {', '.join(columnas + [conteo + ' AS cantidad'])} FROM {tabla}"
+    if condiciones:
+        query += " WHERE " + " AND ".join(condiciones)
+    if columnas:
+        posiciones = ", ".join(str(i) for i in range(1, len(columnas) + 1))
+        query += f" GROUP BY {posiciones} ORDER BY {posiciones}"
+    return query, parametros
+
+
+def conteos(cursor, agrupar, filtros, resumen):
+    """
+    Cantidad de filas por cada combinación de 'agrupar' (subconjunto de DIMENSIONES).
+    """
+    desconocidas = [columna for columna in agrupar if columna not in DIMENSIONES]
+    if desconocidas:
+        raise ValueError(f"Columnas de agrupación desconocidas: {desconocidas}")
+    query, parametros = _consulta(agrupar, filtros, resumen)
+    cursor.execute(query, parametros)
+    return [dict(zip(list(agrupar) + ["cantidad"], fila)) for fila in cursor.fetchall()]
+
+
+def distribucion_por_regla(cursor, filtros, resumen):
+    """
+    Por cada id_regla_aplicada: total de filas y cantidad y porcentaje por desempeño futuro.
+    """
+    query, parametros = _consulta(["id_regla_aplicada", "desempenio_futuro"], filtros, resumen)
+    cursor.execute(query, parametros)
+    por_regla = {}
+    for id_regla, etiqueta, cantidad in cursor.fetchall():
+        etiqueta = etiqueta if etiqueta is not None else "sin_dato"
+        regla = por_regla.setdefault(id_regla, {"id_regla_aplicada": id_regla, "total": 0, "cantidades": dict.fromkeys(ETIQUETAS, 0)})
+        regla["cantidades"][etiqueta] = regla["cantidades"].get(etiqueta, 0) + cantidad
+        regla["total"] += cantidad
+    for regla in por_regla.values():
+        regla["porcentajes"] = {
+            etiqueta: round(cantidad * 100 / regla["total"], 2) for etiqueta, cantidad in regla["cantidades"].items()
+        }
+    return list(por_regla.values())
+
+
+def serie_temporal(cursor, intervalo, filtros, resumen, por="desempenio_futuro"):
+    """
+    Cantidad de filas por período ('day', 'week' o 'month') y, si se indica, por otra dimensión.
+    """
+    if intervalo not in INTERVALOS:
+        raise ValueError(f"intervalo debe ser uno de {INTERVALOS}")
+    agrupar = [por] if por else []
+    if por and por not in DIMENSIONES:
+        raise ValueError(f"Columna de agrupación desconocida: {por}")
+    query, parametros = _consulta(agrupar, filtros, resumen, intervalo)
+    cursor.execute(query, parametros)
+    return [
+        dict(zip(["periodo"] + agrupar + ["cantidad"], (fila[0].isoformat() if fila[0] is not None else None,) + fila[1:]))
+        for fila in cursor.fetchall()
+    ]
+
+
+class RefrescoResumen:
+    """
+    Refresca la vista materializada en un hilo propio. Los pedidos que llegan mientras un
+    refresco está en curso se agrupan en uno solo al terminar, así una ráfaga de cargas no
+    encola un refresco por cada una.
+    """
+
+    def __init__(self):
+        self._pedido = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.refrescos = 0
+        self.errores = 0
+        self.ultimo_refresco = None
+        self.ultima_duracion_s = None
+
+    def solicitar(self):
+        if not USAR_RESUMEN:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name="refresco-resumen", daemon=True)
+                self._hilo.start()
+        self._pedido.set()
+
+    def _ciclo(self):
+        while True:
+            self._pedido.wait()
+            self._pedido.clear()
+            self.refrescar()
+
+    def refrescar(self):
+        conn = None
+        cursor = None
+        inicio = time.perf_counter()
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            cursor.execute(QUERY_REFRESCAR_RESUMEN)
+            conn.commit()
+            self.refrescos += 1
+            self.ultimo_refresco = time.time()
+            self.ultima_duracion_s = round(time.perf_counter() - inicio, 3)
+            logging.info(f"Resumen de resultados refrescado en {self.ultima_duracion_s} s.")
+        except Exception as e:
+            self.errores += 1
+            logging.error(f"❌ Error al refrescar resumen_resultados_diario: {e}")
+            if conn:
+                conn.rollback()
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def metricas(self):
+        return {
+            "habilitado": USAR_RESUMEN,
+            "refrescos": self.refrescos,
+            "errores": self.errores,
+            "ultimo_refresco": self.ultimo_refresco,
+            "ultima_duracion_s": self.ultima_duracion_s,
+        }
+
+
+refresco_resumen = RefrescoResumen()
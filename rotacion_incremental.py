@@ -0,0 +1,394 @@
+import os
+import json
+import pickle
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import MinMaxScaler
+
+try:
+    import fcntl  # Bloqueo entre workers de gunicorn (no existe en Windows)
+except ImportError:
+    fcntl = None
+
+from cache_rotacion import kmeans_rotacion, RUTA_SCRIPT_KMEANS
+
+# Rotación por K-Means sin recalcular todo en cada llamada: se guardan los agregados por empleado
+# (ausencias, llegadas tarde, salidas tempranas y cantidad de ciclos con cada rendimiento) y solo
+# se suman las filas de ciclos nuevos. Los centroides se actualizan con MiniBatchKMeans.partial_fit
+# usando los empleados que cambiaron. El estado se persiste en disco y lo comparten los workers.
+
+COLUMNAS_INCIDENCIAS = list(kmeans_rotacion.columnas_incidencias)
+CATEGORIAS_RENDIMIENTO = ["Alto", "Bajo", "Medio"]
+COLUMNAS_RENDIMIENTO = [f"Rendimiento ACTUAL_{categoria}" for categoria in CATEGORIAS_RENDIMIENTO]
+# Mismo orden de columnas que usa calcular_rotacion
+COLUMNAS = list(kmeans_rotacion.columnas_a_escalar)
+COLUMNAS_ENTRADA = ["Nombre", "Ciclo", "Rendimiento ACTUAL"] + COLUMNAS_INCIDENCIAS
+
+TAMANIO_LOTE = int(os.environ.get("ROTACION_TAMANIO_LOTE", 1024))
+CARPETA_ESTADO = os.environ.get("ROTACION_ESTADO_DIR") or os.path.join(os.path.dirname(RUTA_SCRIPT_KMEANS), "cache")
+# Se incrementa si cambia el contenido del estado guardado
+VERSION_ESTADO = 1
+
+
+# Los clusters se renumeran por riesgo con la misma regla que el cálculo completo
+rango_por_riesgo = kmeans_rotacion.rango_por_riesgo
+etiqueta_rotacion = kmeans_rotacion.etiqueta_rotacion
+
+
+class ModeloRotacion:
+    """
+    Lo mínimo para asignar empleados a la rotación sin reajustar: el escalado (min_ y scale_
+    del MinMaxScaler), los centroides ordenados por riesgo y sus etiquetas. Se persiste en JSON
+    junto al estado del motor, así cualquier worker lo lee en microsegundos.
+    """
+
+    def __init__(self, minimo, escala, centroides, etiquetas, columnas=COLUMNAS):
+        self.columnas = list(columnas)
+        self.minimo = np.asarray(minimo, dtype=np.float64)
+        self.escala = np.asarray(escala, dtype=np.float64)
+        self.centroides = np.asarray(centroides, dtype=np.float64)
+        self.etiquetas = list(etiquetas)
+
+    @classmethod
+    def desde_estado(cls, escalador, kmeans, n_clusters):
+        rango = rango_por_riesgo(kmeans.cluster_centers_)
+        centroides = np.empty_like(kmeans.cluster_centers_)
+        centroides[rango] = kmeans.cluster_centers_
+        etiquetas = [etiqueta_rotacion(cluster, n_clusters) for cluster in range(n_clusters)]
+        return cls(escalador.min_, escalador.scale_, centroides, etiquetas)
+
+    def a_dict(self):
+        return {
+            "version": VERSION_ESTADO,
+            "columnas": self.columnas,
+            "minimo": self.minimo.tolist(),
+            "escala": self.escala.tolist(),
+            "centroides": self.centroides.tolist(),
+            "etiquetas": self.etiquetas,
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(datos["minimo"], datos["escala"], datos["centroides"], datos["etiquetas"], datos["columnas"])
+
+    def puntuar(self, agregados):
+        """
+        Asigna cada fila de 'agregados' (una por empleado, con las columnas de COLUMNAS) al
+        centroide más cercano. Devuelve un DataFrame con Cluster, Probabilidad de Rotacion y
+        la distancia al centroide asignado (en la escala del modelo).
+        """
+        faltantes = [columna for columna in self.columnas if columna not in agregados.columns]
+        if faltantes:
+            raise ValueError(f"Faltan columnas para puntuar la rotación: {faltantes}")
+        x = agregados[self.columnas].to_numpy(dtype=np.float64) * self.escala + self.minimo
+        distancias = ((x[:, None, :] - self.centroides[None, :, :]) ** 2).sum(axis=2)
+        clusters = np.argmin(distancias, axis=1)
+        return pd.DataFrame({
+            "Cluster": clusters,
+            "Probabilidad de Rotacion": np.array(self.etiquetas, dtype=object)[clusters],
+            "Distancia": np.sqrt(distancias[np.arange(len(x)), clusters]),
+        }, index=agregados.index)
+
+
+def a_numericas(filas, columnas):
+    """
+    Copia de 'filas' con 'columnas' convertidas a número: los clientes JSON pueden mandar
+    "Ciclo": "202505". Un valor que no es número lanza ValueError.
+    """
+    filas = filas.copy()
+    for columna in columnas:
+        try:
+            filas[columna] = pd.to_numeric(filas[columna], errors="raise")
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"La columna '{columna}' debe ser numérica: {e}") from None
+    return filas
+
+
+def agregar_por_empleado(filas):
+    """
+    Agrupa filas por ciclo (columnas del dataset) en una fila por empleado con las columnas de COLUMNAS.
+    """
+    faltantes = [columna for columna in COLUMNAS_ENTRADA if columna != "Ciclo" and columna not in filas.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en las filas de rotación: {faltantes}")
+    sumas = a_numericas(filas[["Nombre"] + COLUMNAS_INCIDENCIAS], COLUMNAS_INCIDENCIAS)
+    for categoria, columna in zip(CATEGORIAS_RENDIMIENTO, COLUMNAS_RENDIMIENTO):
+        sumas[columna] = (filas["Rendimiento ACTUAL"] == categoria).astype(np.float64)
+    return sumas.groupby("Nombre")[COLUMNAS].sum()
+
+
+class MotorRotacion:
+    """
+    Estado incremental de la rotación para un par (n_clusters, random_state).
+    Los clusters se devuelven renumerados por riesgo, así el mismo empleado conserva
+    su 'Cluster' y su 'Probabilidad de Rotacion' entre actualizaciones.
+    """
+
+    def __init__(self, n_clusters=3, random_state=12, ruta_dataset=kmeans_rotacion.ruta_dataset, carpeta_estado=CARPETA_ESTADO):
+        self.n_clusters = n_clusters
+        self.random_state = random_state
+        self.ruta_dataset = ruta_dataset
+        self.ruta_estado = os.path.join(carpeta_estado, f"motor_rotacion_k{n_clusters}_rs{random_state}_v{VERSION_ESTADO}.pkl")
+        self.ruta_modelo = os.path.join(carpeta_estado, f"modelo_rotacion_k{n_clusters}_rs{random_state}_v{VERSION_ESTADO}.json")
+        self.estado = None
+        self._firma_estado = None
+        self._modelo = None
+        self._firma_modelo = None
+        self._resultados = None
+        self._lock = threading.Lock()
+
+    # --- Persistencia ---
+
+    def _firma(self, ruta):
+        try:
+            stat = os.stat(ruta)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _cargar_estado(self):
+        # Otro worker pudo haber actualizado el estado: se relee solo si cambió el archivo
+        firma = self._firma(self.ruta_estado)
+        if firma is None or firma == self._firma_estado:
+            return
+        try:
+            with open(self.ruta_estado, "rb") as archivo:
+                self.estado = pickle.load(archivo)
+            self._firma_estado = firma
+            self._resultados = None
+        except Exception as e:
+            logging.warning(f"Estado de rotación ilegible ({self.ruta_estado}): {e}. Se reconstruye desde el dataset.")
+            self.estado = None
+
+    def _escribir_atomico(self, ruta, contenido):
+        carpeta = os.path.dirname(ruta)
+        os.makedirs(carpeta, exist_ok=True)
+        fd, ruta_tmp = tempfile.mkstemp(dir=carpeta, suffix=".tmp")
+        with os.fdopen(fd, "wb") as archivo:
+            archivo.write(contenido)
+        os.replace(ruta_tmp, ruta)
+
+    def _guardar_estado(self):
+        self._escribir_atomico(self.ruta_estado, pickle.dumps(self.estado))
+        self._firma_estado = self._firma(self.ruta_estado)
+        self._resultados = None
+        self._escribir_modelo()
+
+    def _escribir_modelo(self):
+        # Escalado + centroides + etiquetas, para puntuar sin cargar los agregados
+        modelo = ModeloRotacion.desde_estado(self.estado["escalador"], self.estado["kmeans"], self.n_clusters)
+        self._escribir_atomico(self.ruta_modelo, json.dumps(modelo.a_dict()).encode("utf-8"))
+
+    @contextmanager
+    def _bloqueo(self):
+        # Un solo hilo y un solo worker actualizan el estado a la vez
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.ruta_estado), exist_ok=True)
+            with open(self.ruta_estado + ".lock", "w") as archivo_lock:
+                fcntl.flock(archivo_lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(archivo_lock, fcntl.LOCK_UN)
+
+    # --- Actualización incremental ---
+
+    def _filas_nuevas(self, filas):
+        faltantes = [columna for columna in COLUMNAS_ENTRADA if columna not in filas.columns]
+        if faltantes:
+            raise ValueError(f"Faltan columnas en las filas de rotación: {faltantes}")
+        filas = a_numericas(filas[COLUMNAS_ENTRADA], ["Ciclo"] + COLUMNAS_INCIDENCIAS)
+        filas = filas.drop_duplicates(subset=["Nombre", "Ciclo"], keep="last")
+        if self.estado is None:
+            return filas
+        # Solo los ciclos posteriores al último que ya se sumó para cada empleado
+        ultimo = filas["Nombre"].map(self.estado["ultimo_ciclo"])
+        return filas[ultimo.isna() | (filas["Ciclo"] > ultimo)]
+
+    def _sumar(self, filas):
+        desconocidas = set(filas["Rendimiento ACTUAL"].dropna().unique()) - set(CATEGORIAS_RENDIMIENTO)
+        if desconocidas:
+            logging.warning(f"Categorías de rendimiento desconocidas en rotación (se ignoran): {sorted(desconocidas)}")
+        sumas = agregar_por_empleado(filas)
+        ultimo_ciclo = filas.groupby("Nombre")["Ciclo"].max()
+
+        if self.estado is None:
+            return sumas, ultimo_ciclo
+        agregados = self.estado["agregados"].add(sumas, fill_value=0)
+        agregados[COLUMNAS_INCIDENCIAS] = agregados[COLUMNAS_INCIDENCIAS].astype(np.int64)
+        ultimo_ciclo = pd.concat([self.estado["ultimo_ciclo"], ultimo_ciclo]).groupby(level=0).max()
+        return agregados, ultimo_ciclo
+
+    def _ajustar(self, agregados, actualizados):
+        x = agregados[COLUMNAS].to_numpy(dtype=np.float64)
+        if self.estado is None:
+            if len(x) < self.n_clusters:
+                raise ValueError(f"Se necesitan al menos {self.n_clusters} empleados para agrupar en {self.n_clusters} clusters")
+            escalador = MinMaxScaler().fit(x)
+            kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=self.random_state, batch_size=TAMANIO_LOTE, n_init=3)
+            kmeans.fit(escalador.transform(x))
+            return escalador, kmeans
+
+        escalador, kmeans = self.estado["escalador"], self.estado["kmeans"]
+        filas = agregados.index.get_indexer(actualizados)
+        escala_anterior, minimo_anterior = escalador.scale_.copy(), escalador.min_.copy()
+        escalador.partial_fit(x[filas])
+        if not (np.array_equal(escala_anterior, escalador.scale_) and np.array_equal(minimo_anterior, escalador.min_)):
+            # El rango cambió: los centroides se pasan a la nueva escala para que sigan en el mismo lugar
+            centroides = (kmeans.cluster_centers_ - minimo_anterior) / escala_anterior
+            kmeans.cluster_centers_ = centroides * escalador.scale_ + escalador.min_
+        x_actualizados = escalador.transform(x[filas])
+        for inicio in range(0, len(x_actualizados), TAMANIO_LOTE):
+            kmeans.partial_fit(x_actualizados[inicio:inicio + TAMANIO_LOTE])
+        return escalador, kmeans
+
+    def _incorporar(self, filas, firma_dataset=None):
+        nuevas = self._filas_nuevas(filas)
+        if nuevas.empty:
+            if firma_dataset is not None and self.estado is not None:
+                self.estado["firma_dataset"] = firma_dataset
+                self._guardar_estado()
+            return 0, 0
+        actualizados = nuevas["Nombre"].unique()
+        agregados, ultimo_ciclo = self._sumar(nuevas)
+        escalador, kmeans = self._ajustar(agregados, actualizados)
+        self.estado = {
+            "agregados": agregados,
+            "ultimo_ciclo": ultimo_ciclo,
+            "escalador": escalador,
+            "kmeans": kmeans,
+            "firma_dataset": firma_dataset if firma_dataset is not None else (self.estado or {}).get("firma_dataset"),
+        }
+        self._guardar_estado()
+        logging.info(f"Rotación incremental: {len(nuevas)} filas nuevas, {len(actualizados)} empleados actualizados.")
+        return len(nuevas), len(actualizados)
+
+    def actualizar_desde_dataset(self):
+        """
+        Suma los ciclos nuevos del dataset de rotación. Si el archivo no cambió desde la última
+        vez, no se lee.
+        """
+        with self._bloqueo():
+            self._cargar_estado()
+            firma = self._firma(self.ruta_dataset)
+            if firma is None:
+                raise FileNotFoundError(2, "No such file or directory", self.ruta_dataset)
+            if self.estado is not None and self.estado.get("firma_dataset") == firma:
+                return 0, 0
+            return self._incorporar(kmeans_rotacion.cargar_dataset(self.ruta_dataset), firma)
+
+    def agregar_ciclos(self, filas):
+        """
+        Suma filas de ciclos nuevos (mismas columnas que el dataset) sin releer el dataset.
+        Devuelve (filas nuevas, empleados actualizados); las filas de ciclos ya sumados se ignoran.
+        """
+        with self._bloqueo():
+            self._cargar_estado()
+            return self._incorporar(filas)
+
+    # --- Resultados ---
+
+    def modelo(self):
+        """
+        ModeloRotacion vigente (se relee solo si otro worker lo actualizó). Si el motor todavía
+        no tiene datos, primero incorpora el dataset.
+        """
+        firma = self._firma(self.ruta_modelo)
+        if firma is None:
+            self.actualizar_desde_dataset()
+            with self._bloqueo():
+                self._cargar_estado()
+                if self.estado is None:
+                    raise ValueError("El motor de rotación todavía no tiene datos")
+                if self._firma(self.ruta_modelo) is None:
+                    # Estado guardado por una versión que no escribía el modelo
+                    self._escribir_modelo()
+            firma = self._firma(self.ruta_modelo)
+        if self._modelo is None or firma != self._firma_modelo:
+            with open(self.ruta_modelo, "r", encoding="utf-8") as archivo:
+                self._modelo = ModeloRotacion.desde_dict(json.load(archivo))
+            self._firma_modelo = firma
+        return self._modelo
+
+    def puntuar(self, nombres=(), empleados=None):
+        """
+        Rotación sin reajustar, por centroide más cercano:
+        - 'nombres': empleados ya incorporados, con sus agregados guardados.
+        - 'empleados': DataFrame de empleados nuevos, ya agregados (columnas de COLUMNAS) o
+          como filas por ciclo (columnas del dataset), que se agrupan por Nombre.
+        Devuelve (lista de resultados, nombres no encontrados).
+        """
+        modelo = self.modelo()
+        partes = []
+        no_encontrados = []
+        if nombres:
+            with self._lock:
+                self._cargar_estado()
+                agregados = self.estado["agregados"]
+            encontrados = [nombre for nombre in dict.fromkeys(nombres) if nombre in agregados.index]
+            no_encontrados = [nombre for nombre in dict.fromkeys(nombres) if nombre not in agregados.index]
+            if encontrados:
+                partes.append(agregados.loc[encontrados].assign(Origen="registrado"))
+        if empleados is not None and len(empleados):
+            if "Rendimiento ACTUAL" in empleados.columns:
+                empleados = agregar_por_empleado(empleados)
+            elif "Nombre" in empleados.columns:
+                empleados = empleados.set_index("Nombre")
+            partes.append(empleados.assign(Origen="nuevo"))
+        if not partes:
+            return [], no_encontrados
+
+        agregados = pd.concat(partes)
+        puntaje = modelo.puntuar(agregados)
+        salida = pd.concat([agregados[modelo.columnas + ["Origen"]], puntaje], axis=1)
+        return salida.rename_axis("Nombre").reset_index().to_dict(orient="records"), no_encontrados
+
+    def resultados(self):
+        """
+        Mismo formato que calcular_rotacion: {"data": [...], "clusters": n_clusters}.
+        """
+        with self._lock:
+            self._cargar_estado()
+            if self._resultados is not None:
+                return self._resultados
+            if self.estado is None:
+                raise ValueError("El motor de rotación todavía no tiene datos")
+            agregados = self.estado["agregados"].sort_index()
+            modelo = ModeloRotacion.desde_estado(self.estado["escalador"], self.estado["kmeans"], self.n_clusters)
+            puntaje = modelo.puntuar(agregados)
+
+            salida = agregados.rename_axis("Nombre").reset_index()
+            salida["Cluster"] = puntaje["Cluster"].to_numpy()
+            salida["Probabilidad de Rotacion"] = puntaje["Probabilidad de Rotacion"].to_numpy()
+            self._resultados = {"data": salida.to_dict(orient="records"), "clusters": self.n_clusters}
+            return self._resultados
+
+    def obtener(self):
+        """
+        Actualiza con los ciclos nuevos del dataset (si los hay) y devuelve los resultados.
+        """
+        self.actualizar_desde_dataset()
+        return self.resultados()
+
+
+_motores = {}
+_lock_motores = threading.Lock()
+
+
+def obtener_motor(n_clusters=3, random_state=12):
+    """
+    Motor compartido por todos los hilos del worker para esos parámetros.
+    """
+    with _lock_motores:
+        clave = (n_clusters, random_state)
+        if clave not in _motores:
+            _motores[clave] = MotorRotacion(n_clusters, random_state)
+        return _motores[clave]
@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import logging
+import pandas as pd
+
+# Los scripts de 'Regresion lineal' no forman un paquete (la carpeta tiene un espacio),
+# así que se agregan al path para poder importarlos dentro del proceso de la API.
+RUTA_REGRESION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Regresion lineal")
+if RUTA_REGRESION not in sys.path:
+    sys.path.append(RUTA_REGRESION)
+
+import predecir_rendimiento_futuro as prediccion
+import registro_modelos
+import metricas
+from cache_predicciones import cache_predicciones
+
+
+class ModeloNoEntrenado(Exception):
+    """Se lanza cuando se pide predecir con una regla que no tiene un modelo registrado."""
+
+
+class RuntimeModelo:
+    """
+    Mantiene en memoria el modelo de desempeño futuro (modelo, columnas, encoder y scaler)
+    para no levantar un intérprete nuevo ni deserializar el pickle en cada request.
+    Si el archivo del modelo cambia en disco (por un nuevo entrenamiento) se recarga solo.
+    Los modelos entrenados por regla se sirven desde el registro; el modelo de la ruta fija
+    solo se usa cuando no se indica una regla (sus predicciones no corresponden a ninguna).
+    Con 'cache' las filas ya predichas por la misma versión del modelo no se vuelven a calcular.
+    """
+
+    def __init__(self, ruta_modelo=prediccion.ruta_modelo, registro=None, cache=None):
+        self.ruta_modelo = ruta_modelo
+        self.registro = registro
+        self.cache = cache
+        self._datos_cargados = None
+        self._firma = None
+        self._lock = threading.Lock()
+
+    def _firma_archivo(self):
+        # Lanza FileNotFoundError si todavía no hay un modelo entrenado
+        stat = os.stat(self.ruta_modelo)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _resolver_modelo(self, id_regla=None):
+        # Devuelve (clave del modelo, datos del modelo). La clave identifica la versión exacta
+        # y es la que usa la cache de predicciones.
+        if id_regla is not None:
+            # Sin modelo propio no se predice: los resultados se guardarían bajo una regla
+            # cuyo modelo no los produjo
+            version, datos_cargados = self.registro.obtener(id_regla) if self.registro is not None else (None, None)
+            if datos_cargados is None:
+                raise ModeloNoEntrenado(f"La regla {id_regla} no tiene un modelo entrenado")
+            return f"regla_{int(id_regla)}:{version}", datos_cargados
+
+        firma = self._firma_archivo()
+        clave = f"ruta_fija:{firma[0]}:{firma[1]}"
+        if self._datos_cargados is not None and firma == self._firma:
+            return clave, self._datos_cargados
+
+        with self._lock:
+            # Otro hilo pudo haberlo cargado mientras esperábamos el lock
+            if self._datos_cargados is None or firma != self._firma:
+                logging.info(f"Cargando modelo en memoria desde: {self.ruta_modelo}")
+                self._datos_cargados = prediccion.cargar_modelo(self.ruta_modelo)
+                self._firma = firma
+            return clave, self._datos_cargados
+
+    def obtener_modelo(self, id_regla=None):
+        """
+        Devuelve el modelo en memoria, cargándolo de disco solo si no está cargado o si cambió.
+        Con 'id_regla' se usa la versión vigente del registro para esa regla.
+        """
+        return self._resolver_modelo(id_regla)[1]
+
+    def predecir_csv(self, archivo_csv, id_regla=None, probabilidades=False):
+        """
+        Predice el desempeño futuro de un CSV con el modelo en memoria.
+        Devuelve el DataFrame con la columna 'desempenio_futuro' agregada (y las
+        'probabilidad_<clase>' si se piden).
+        """
+        with metricas.etapa("lectura_csv"):
+            nuevos_df = pd.read_csv(archivo_csv, encoding="utf-8")
+        logging.debug("CSV de predicción cargado desde: %s. Filas: %s", archivo_csv, len(nuevos_df))
+        return self.predecir_dataframe(nuevos_df, id_regla, probabilidades)
+
+    def predecir_dataframe(self, nuevos_df, id_regla=None, probabilidades=False):
+        """
+        Igual que predecir_csv, para un DataFrame ya leído (se modifica y se devuelve el mismo).
+        """
+        with metricas.etapa("carga_modelo"):
+            clave_modelo, datos_cargados = self._resolver_modelo(id_regla)
+        return prediccion.predecir_dataframe(nuevos_df, datos_cargados, probabilidades, self.cache, clave_modelo, metricas.etapa)
+
+    def predecir_rendimiento_futuro(self, archivo_csv, id_regla=None, probabilidades=False):
+        """
+        Igual que predecir_csv, pero devuelve una lista de diccionarios (una fila por empleado).
+        """
+        return self.predecir_csv(archivo_csv, id_regla, probabilidades).to_dict(orient="records")
+
+    def predecir_por_lotes(self, archivo_csv, id_regla=None, filas_por_lote=prediccion.FILAS_POR_LOTE, probabilidades=False):
+        """
+        Igual que predecir_csv pero leyendo el CSV de a lotes: devuelve un generador de
+        DataFrames, uno por lote. El modelo se resuelve al llamar (no al iterar), así un error
+        de modelo inexistente aparece antes de empezar a responder.
+        """
+        with metricas.etapa("carga_modelo"):
+            clave_modelo, datos_cargados = self._resolver_modelo(id_regla)
+        return prediccion.predecir_por_lotes(archivo_csv, datos_cargados, filas_por_lote, probabilidades, self.cache, clave_modelo, metricas.etapa)
+
+
+# Instancias compartidas por todos los hilos del worker
+registro = registro_modelos.RegistroModelos(capacidad=int(os.environ.get("MODELOS_EN_MEMORIA", 8)))
+runtime_modelo = RuntimeModelo(registro=registro, cache=cache_predicciones)
@@ -1,2 +1,7 @@
 #!/bin/sh
-gunicorn --bind=0.0.0.0 --timeout 600 app:app
+# Los entrenamientos corren en la cola en segundo plano del worker, así que ya no hace falta
+# un timeout largo; los hilos permiten consultar el estado de un trabajo mientras se predice.
+# Logs en JSON, escritos desde un hilo propio y con un resumen muestreado por request
+# (ver registro_logs.py); se puede pisar con LOG_PERFIL=desarrollo o con cada variable LOG_*.
+export LOG_PERFIL="${LOG_PERFIL:-produccion}"
+gunicorn --bind=0.0.0.0 --workers 1 --threads 8 --timeout 120 app:app